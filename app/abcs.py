@@ -3,10 +3,20 @@ from .utils import camel_to_snake
 
 class DataProduct(ABC):
 
+    position = None # (block_number, transaction_index, log_index) of the last event handled, set by the context's dispatchers, see middleware.etag
+
     @abstractmethod
     def handle(self, event):
         pass
 
+    def handle_batch(self, events):
+        """
+        Handle a run of events from the same signal, in order.  Override
+        this where the per-event work can be amortized across the batch.
+        """
+        for event in events:
+            self.handle(event)
+
     @property
     def name(self):
         return camel_to_snake(self.__class__.__name__)
@@ -1,7 +1,9 @@
 import csv, os, sys, json
+import multiprocessing
 
 from pathlib import Path
 from collections import defaultdict
+from itertools import islice
 
 from abifsm import ABISet
 
@@ -36,11 +38,27 @@ class CSVClientCaster:
     def __init__(self, abis):
         self.abis = abis
     
+    def int_fields(self, signature):
+
+        if signature == DELEGATE_CHANGED_2:
+            return []
+
+        abi_frag = self.abis.get_by_signature(signature)
+
+        return [camel_to_snake(o['name']) for o in abi_frag.inputs if o['type'] in INT_TYPES]
+
+    def needs_row_caster(self, signature):
+        """
+        True if the caster does more than cast the int fields, ie. it needs
+        to see each row, rather than casting whole columns.
+        """
+        return signature in [DELEGATE_CHANGED_2, PROPOSAL_CREATED_MODULE, PROPOSAL_CREATED_1, PROPOSAL_CREATED_2, PROPOSAL_CREATED_3, PROPOSAL_CREATED_4]
+
     def lookup(self, signature):
 
         abi_frag = self.abis.get_by_signature(signature)
 
-        int_fields = [camel_to_snake(o['name']) for o in abi_frag.inputs if o['type'] in INT_TYPES]
+        int_fields = self.int_fields(signature)
 
         # bytes_fields = [camel_to_snake(o['name']) for o in abi_frag.inputs if o['type'] in BYTE_TYPES]
 
@@ -160,6 +178,51 @@ class CSVClientCaster:
 
         return caster_fn
 
+CSV_BATCH_SIZE = 10_000
+CSV_QUEUE_BATCHES = 100
+
+def cast_columns(columns, header, fields, func):
+
+    for field in fields:
+        try:
+            i = header.index(field)
+        except ValueError:
+            print(f"E184250323 - Problem with getting {field} to {func.__name__}.")
+            continue
+
+        try:
+            columns[i] = [func(x) for x in columns[i]]
+        except ValueError:
+            # Fall back to casting value by value, leaving the bad ones as is.
+            columns[i] = [cast({field : x}, [field], func)[field] for x in columns[i]]
+
+    return columns
+
+def parse_csv_file(fname, int_fields, queue):
+    """
+    Runs in a worker process.  Parses one CSV file, casts the int fields a
+    whole column at a time, and streams (header, columns) batches back.
+    None marks the end of the file, and a str an error.
+    """
+
+    try:
+        with open(fname, 'r') as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+
+            while True:
+                rows = list(islice(reader, CSV_BATCH_SIZE))
+                if not rows:
+                    break
+
+                columns = [list(column) for column in zip(*rows)]
+                queue.put((header, cast_columns(columns, header, int_fields, int)))
+
+        queue.put(None)
+    except Exception as e:
+        queue.put(f"{type(e).__name__}: {e}")
+
+
 class SubscriptionPlannerMixin:
 
     def init(self):
@@ -187,8 +250,9 @@ class SubscriptionPlannerMixin:
 
 class CSVClient(SubscriptionPlannerMixin):
     timeliness = 'archive'
+    resumable = False # can it start reading from an arbitrary block, eg. after a snapshot restore.
 
-    def __init__(self, path):
+    def __init__(self, path, workers=0):
 
         if not isinstance(path, Path):
             self.path = Path(path)
@@ -196,6 +260,10 @@ class CSVClient(SubscriptionPlannerMixin):
             self.path = path
         self.init()
         self.casterCls = CSVClientCaster
+
+        # If > 0, parse the files in this many worker processes, ahead of
+        # the dispatcher.
+        self.workers = workers
     
     def is_valid(self):
         
@@ -232,6 +300,10 @@ class CSVClient(SubscriptionPlannerMixin):
     def read(self, after):
 
         assert after == 0
+
+        if self.workers:
+            yield from self.read_parallel()
+            return
         
         for event_or_block, subscription_meta in self.subscription_meta:
 
@@ -259,6 +331,91 @@ class CSVClient(SubscriptionPlannerMixin):
 
 
 
+    def read_parallel(self):
+        """
+        Same output as the serial read, but every file is parsed in a worker
+        process, up to `self.workers` at once, each streaming into its own
+        bounded queue.  Files are consumed in the planned order, so while
+        one is dispatched, the next ones are parsed.
+        """
+
+        mp = multiprocessing.get_context('spawn')
+
+        jobs = []
+        for event_or_block, subscription_meta in self.subscription_meta:
+
+            if event_or_block == 'event':
+                fname, chain_id, address, signature, abi_frag, caster_fn = subscription_meta
+                int_fields = ['log_index', 'transaction_index'] + self.caster.int_fields(signature)
+            elif event_or_block == 'block':
+                fname, chain_id = subscription_meta
+                int_fields = ['timestamp', 'block_number']
+            else:
+                raise Exception(f"Unknown event_or_block: {event_or_block}")
+
+            jobs.append((event_or_block, subscription_meta, fname, int_fields, mp.Queue(maxsize=CSV_QUEUE_BATCHES)))
+
+        procs = []
+
+        def start(job):
+            _, _, fname, int_fields, queue = job
+            proc = mp.Process(target=parse_csv_file, args=(str(fname), int_fields, queue), daemon=True)
+            proc.start()
+            procs.append(proc)
+
+        for job in jobs[:self.workers]:
+            start(job)
+
+        try:
+            for i, (event_or_block, subscription_meta, fname, _, queue) in enumerate(jobs):
+
+                new_signal = True
+
+                if event_or_block == 'event':
+                    _, chain_id, address, signature, abi_frag, caster_fn = subscription_meta
+                    signal = f"{chain_id}.{address}.{signature}"
+                    sighash = abi_frag.topic
+                    row_caster_fn = caster_fn if self.caster.needs_row_caster(signature) else None
+                else:
+                    _, chain_id = subscription_meta
+                    signal = f"{chain_id}.blocks"
+
+                for header, columns in self.drain(queue, fname):
+
+                    for values in zip(*columns):
+                        row = dict(zip(header, values))
+
+                        if event_or_block == 'event':
+                            row['signature'] = signature
+                            row['sighash'] = sighash
+
+                            if row_caster_fn:
+                                row = row_caster_fn(row)
+
+                        yield row, signal, new_signal
+                        new_signal = False
+
+                if i + self.workers < len(jobs):
+                    start(jobs[i + self.workers])
+        finally:
+            for proc in procs:
+                if proc.is_alive():
+                    proc.terminate()
+                proc.join()
+
+    def drain(self, queue, fname):
+
+        while True:
+            batch = queue.get()
+
+            if batch is None:
+                return
+
+            if isinstance(batch, str):
+                raise Exception(f"E414261017 - Problem parsing {fname}: {batch}")
+
+            yield batch
+
     def get_fallback_block(self):
         return 0
 
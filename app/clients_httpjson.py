@@ -1,9 +1,12 @@
 import json
 import os
+import ast
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from collections import defaultdict
 
-from web3 import Web3
+from web3 import Web3, AsyncWeb3
 from web3.exceptions import Web3RPCError
 from web3.middleware import ExtraDataToPOAMiddleware
 from sanic.log import logger as logr
@@ -48,6 +51,33 @@ def resolve_block_count_span(chain_id=None):
 
 
 DAO_NODE_USE_POA_MIDDLEWARE = os.getenv('DAO_NODE_USE_POA_MIDDLEWARE', "false").lower() in ('true', '1')
+DAO_NODE_ARCHIVE_NODE_HTTP_IN_FLIGHT = int(os.getenv('DAO_NODE_ARCHIVE_NODE_HTTP_IN_FLIGHT', 8))
+
+# Block range too large, or too many results, for the provider.
+SPLITTABLE_RPC_ERROR_CODES = (-32600, -32602)
+
+def rpc_error_code(e):
+    try:
+        return ast.literal_eval(str(e.args[0]))['code']
+    except Exception:
+        return None
+
+def run_coroutine(coro):
+    """
+    Run a coroutine to completion from synchronous code, even if this thread
+    already has a running event loop, in which case it blocks that loop.
+    The node itself awaits `fetch` instead, see Feed.read_archive.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+def log_sort_key(event):
+    return int(event['block_number']), event['transaction_index'], event['log_index']
 
 class JsonRpcHistHttpClientCaster:
     
@@ -184,6 +214,7 @@ class JsonRpcHistHttpClientCaster:
 
 class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
     timeliness = 'archive'
+    resumable = True # can it start reading from an arbitrary block, eg. after a snapshot restore.
 
     def __init__(self, url):
         self.url = url
@@ -198,6 +229,8 @@ class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
 
         self.noisy = True
 
+        self.in_flight = DAO_NODE_ARCHIVE_NODE_HTTP_IN_FLIGHT
+
     def connect(self):
         
         w3 = Web3(Web3.HTTPProvider(self.url))
@@ -206,6 +239,16 @@ class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
             w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
         
         return w3
+
+    def connect_async(self):
+
+        # The provider keeps one pooled aiohttp session for all requests.
+        w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(self.url))
+
+        if DAO_NODE_USE_POA_MIDDLEWARE:
+            w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+
+        return w3
         
     def plan_event(self, chain_id, address, signature):
 
@@ -360,9 +403,9 @@ class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
         except Exception as e:
             # catch and attempt to recover block limitation ranges
             if isinstance(e, Web3RPCError):
-                error_dict = eval(str(e.args[0]))  # Convert string representation to dict
-                api_error_code = error_dict['code']
-                if api_error_code == -32600 or api_error_code == -32602:
+                api_error_code = rpc_error_code(e)
+                # A single block can't be split any further.
+                if api_error_code in SPLITTABLE_RPC_ERROR_CODES and from_block < to_block:
                     # add one to recursion depth
                     new_recursion_depth = current_recursion_depth + 1
                     # split block range in half
@@ -371,7 +414,7 @@ class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
                     first_half = self.get_logs_by_block_range(
                         w3=w3,
                         from_block=from_block,
-                        to_block=mid - 1,
+                        to_block=mid,
                         contract_address=contract_address,
                         event_signature_hash=event_signature_hash,
                         current_recursion_depth=new_recursion_depth,
@@ -380,7 +423,7 @@ class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
 
                     second_half = self.get_logs_by_block_range(
                         w3=w3,
-                        from_block=mid,
+                        from_block=mid + 1,
                         to_block=to_block,
                         contract_address=contract_address,
                         event_signature_hash=event_signature_hash,
@@ -430,61 +473,154 @@ class JsonRpcHistHttpClient(SubscriptionPlannerMixin):
         for block in blocks:
             yield block
 
-    def read(self, after):
+    async def get_logs_by_block_range_async(self, w3, contract_address, topics, from_block, to_block,
+                                            current_recursion_depth=0, max_recursion_depth=2000):
+        """
+        The async counterpart of :py:meth:`get_logs_by_block_range`.  At most
+        `self.in_flight` requests are outstanding at once, and ranges the
+        provider rejects are split in half, and both halves fetched concurrently.
+        """
+
+        event_filter = {
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "address": contract_address,
+            "topics": [topics]
+        }
 
+        try:
+            async with self.in_flight_limit:
+                return await w3.eth.get_logs(event_filter)
+        except Web3RPCError as e:
+            # A single block can't be split any further.
+            if rpc_error_code(e) not in SPLITTABLE_RPC_ERROR_CODES or from_block >= to_block or current_recursion_depth >= max_recursion_depth:
+                raise
 
-        start_block = after
+        mid = (from_block + to_block) // 2
 
-        new_signal = True
+        halves = await asyncio.gather(
+            self.get_logs_by_block_range_async(w3, contract_address, topics, from_block, mid, current_recursion_depth + 1, max_recursion_depth),
+            self.get_logs_by_block_range_async(w3, contract_address, topics, mid + 1, to_block, current_recursion_depth + 1, max_recursion_depth),
+        )
 
-        for chain_id in self.block_subsription_meta:
-            blocks = self.read_blocks(chain_id, start_block)
-            for block in blocks:
-                yield block, f"{chain_id}.blocks", new_signal
-            new_signal = False
+        return [log for half in halves for log in half]
 
-        w3 = self.connect()
+    async def get_paginated_logs_async(self, w3, contract_address, topics, step, start_block, end_block):
 
-        all_logs = []
+        topics = list(topics)
+        topic_chunks = [topics[i:i + 4] for i in range(0, len(topics), 4)]
 
-        new_signal = True
-        for chain_id in self.event_subsription_meta.keys():
+        ranges = [(from_block, min(from_block + step - 1, end_block)) for from_block in range(start_block, end_block + 1, step)]
 
-            step = resolve_block_count_span(chain_id)
+        if self.noisy:
+            logr.info(f"👉 Fetching {len(ranges)} block range(s) x {len(topic_chunks)} topic chunk(s) for {contract_address} from block {start_block}")
 
-            for cs_address in self.event_subsription_meta[chain_id].keys():
+        results = await asyncio.gather(*[self.get_logs_by_block_range_async(w3, contract_address, topic_chunk, from_block, to_block)
+                                         for from_block, to_block in ranges
+                                         for topic_chunk in topic_chunks])
 
-                topics = self.event_subsription_meta[chain_id][cs_address].keys()
+        return [log for logs in results for log in logs]
 
-                logs = self.get_paginated_logs(w3, cs_address, topics, step, start_block)
+    async def get_paginated_blocks_async(self, w3, start_block, end_block, step):
 
-                for log in logs:
+        async def get_block(block_num):
+            async with self.in_flight_limit:
+                full_block = await w3.eth.get_block(block_num)
 
+            timestamp = full_block['timestamp']
+            assert isinstance(timestamp, int)
 
-                    topic = "0x" + log['topics'][0].hex()
+            block_number = full_block['number']
+            assert isinstance(block_number, int)
 
-                    caster_fn, signature = self.event_subsription_meta[chain_id][cs_address][topic]
+            return {'timestamp' : timestamp, 'block_number' : block_number}
 
-                    args = caster_fn(log)
+        return await asyncio.gather(*[get_block(block_num) for block_num in range(start_block, end_block, step)])
 
-                    out = {}
+    def to_event(self, chain_id, cs_address, log):
 
-                    out['block_number'] = str(log['blockNumber'])
-                    out['transaction_index'] = log['transactionIndex']
-                    out['log_index'] = log['logIndex']
+        topic = "0x" + log['topics'][0].hex()
 
-                    out.update(**args)
+        caster_fn, signature = self.event_subsription_meta[chain_id][cs_address][topic]
 
-                    signal = f"{chain_id}.{cs_address.lower()}.{signature}"
-                    out['signature'] = signature
-                    out['sighash'] = topic.replace("0x", "")
+        args = caster_fn(log)
 
-                    all_logs.append((out, signal, new_signal))
+        out = {}
 
-        all_logs.sort(key=lambda x: (x[0]['block_number'], x[0]['transaction_index'], x[0]['log_index']))   
+        out['block_number'] = str(log['blockNumber'])
+        out['transaction_index'] = log['transactionIndex']
+        out['log_index'] = log['logIndex']
 
-        for log in all_logs:
-            yield log
+        out.update(**args)
+
+        signal = f"{chain_id}.{cs_address.lower()}.{signature}"
+        out['signature'] = signature
+        out['sighash'] = topic.replace("0x", "")
+
+        return out, signal
+
+    async def fetch(self, after):
+
+        self.in_flight_limit = asyncio.Semaphore(self.in_flight)
+
+        w3 = self.connect_async()
+
+        try:
+            latest_block = await w3.eth.block_number
+
+            blocks = {}
+            if self.block_subsription_meta:
+                step = resolve_block_count_span(await w3.eth.chain_id)
+                for chain_id in self.block_subsription_meta:
+                    blocks[chain_id] = await self.get_paginated_blocks_async(w3, start_block=after, end_block=latest_block, step=step)
+
+            requests = []
+            for chain_id in self.event_subsription_meta.keys():
+
+                step = resolve_block_count_span(chain_id)
+
+                for cs_address in self.event_subsription_meta[chain_id].keys():
+                    topics = self.event_subsription_meta[chain_id][cs_address].keys()
+                    requests.append((chain_id, cs_address, self.get_paginated_logs_async(w3, cs_address, topics, step, after, latest_block)))
+
+            results = await asyncio.gather(*[request for _, _, request in requests])
+
+            logs = [(chain_id, cs_address, result) for (chain_id, cs_address, _), result in zip(requests, results)]
+        finally:
+            await w3.provider.disconnect()
+
+        return blocks, logs
+
+    def read(self, after):
+
+        # Every range is fetched concurrently, up front, then merged.
+        yield from self.events(*run_coroutine(self.fetch(after)))
+
+    def events(self, blocks, logs):
+        """
+        The (event, signal, new_signal) for what `fetch` returned, blocks
+        first, then the logs in chain order.
+        """
+
+        for chain_id, chain_blocks in blocks.items():
+            new_signal = True
+            for block in chain_blocks:
+                yield block, f"{chain_id}.blocks", new_signal
+                new_signal = False
+
+        all_logs = []
+
+        for chain_id, cs_address, address_logs in logs:
+            for log in address_logs:
+                all_logs.append(self.to_event(chain_id, cs_address, log))
+
+        all_logs.sort(key=lambda x: log_sort_key(x[0]))
+
+        signal = None
+
+        for out, new_signal_name in all_logs:
+            yield out, new_signal_name, new_signal_name != signal
+            signal = new_signal_name
 
 class JsonRpcRtHttpClient(JsonRpcHistHttpClient):
     timeliness = 'polling'
@@ -502,49 +638,56 @@ class JsonRpcRtHttpClient(JsonRpcHistHttpClient):
 
         self.noisy = False
 
+        self.in_flight = DAO_NODE_ARCHIVE_NODE_HTTP_IN_FLIGHT
 
-    async def read(self):
-
-        w3 = self.connect()
-
-        all_logs = []
+        self.w3 = None
+        self.last_polled_block = {}
 
-        latest_block = w3.eth.block_number
+    async def read(self):
+        """
+        Poll for the logs since the last fully-polled block, without blocking
+        the event loop.  The first poll looks back a few blocks, to cover the
+        hand-off from the archive.
+        """
 
-        for chain_id in self.event_subsription_meta.keys():
+        if self.w3 is None:
+            self.w3 = self.connect_async()
 
-            span = resolve_block_count_span(chain_id) 
-            lookback_block = latest_block - int(span / 200) # 10 blocks back for ETH, for example.
+        self.in_flight_limit = asyncio.Semaphore(self.in_flight)
 
-            for cs_address in self.event_subsription_meta[chain_id].keys():
+        latest_block = await self.w3.eth.block_number
 
-                topics = self.event_subsription_meta[chain_id][cs_address].keys()
+        requests = []
 
-                logs = self.get_paginated_logs(w3, cs_address, topics, step=span, start_block=lookback_block, end_block=latest_block)
+        for chain_id in self.event_subsription_meta.keys():
 
-                for log in logs:
+            span = resolve_block_count_span(chain_id)
 
-                    topic = "0x" + log['topics'][0].hex()
+            try:
+                start_block = self.last_polled_block[chain_id] + 1
+            except KeyError:
+                start_block = latest_block - int(span / 200) # 10 blocks back for ETH, for example.
 
-                    caster_fn, signature = self.event_subsription_meta[chain_id][cs_address][topic]
+            if start_block > latest_block:
+                continue
 
-                    args = caster_fn(log)
+            for cs_address in self.event_subsription_meta[chain_id].keys():
 
-                    out = {}
+                topics = self.event_subsription_meta[chain_id][cs_address].keys()
 
-                    out['block_number'] = str(log['blockNumber'])
-                    out['transaction_index'] = log['transactionIndex']
-                    out['log_index'] = log['logIndex']
+                requests.append((chain_id, cs_address, self.get_paginated_logs_async(self.w3, cs_address, topics, span, start_block, latest_block)))
 
-                    out.update(**args)
+        results = await asyncio.gather(*[request for _, _, request in requests])
 
-                    out['signal'] = f"{chain_id}.{cs_address.lower()}.{signature}"
-                    out['signature'] = signature
-                    out['sighash'] = topic.replace("0x", "")
+        all_logs = []
 
-                    all_logs.append(out)
+        for (chain_id, cs_address, _), logs in zip(requests, results):
+            for log in logs:
+                out, signal = self.to_event(chain_id, cs_address, log)
+                out['signal'] = signal
+                all_logs.append(out)
 
-        all_logs.sort(key=lambda x: (x['block_number'], x['transaction_index'], x['log_index']))   
+        all_logs.sort(key=log_sort_key)
 
         if self.noisy:
             logr.info(f"{self.name} read {len(all_logs)} logs")
@@ -552,4 +695,6 @@ class JsonRpcRtHttpClient(JsonRpcHistHttpClient):
         for log in all_logs:
             yield log
 
-    
+        # Only once every log up to latest_block has been handed over.
+        for chain_id in self.event_subsription_meta.keys():
+            self.last_polled_block[chain_id] = latest_block
@@ -1,36 +1,47 @@
 from collections import defaultdict
 from .abcs import DataModel
 
+def zero_fraction():
+    return (0, 0)
+
 class ParticipationRateModel(DataModel):
     def __init__(self):
-        self.completed_participation_fractions = defaultdict(lambda : (0, 0))
+        self.completed_participation_fractions = defaultdict(zero_fraction)
         self.future_participation_fractions = defaultdict(int)
 
+        self.version = 0 # bumped on every refresh, so dependants can tell the rates moved.
+
     def refresh_all_completed_participation_fractions(self, proposals_dp, votes_dp, delegations_dp):
         
-        new_fractions = defaultdict(lambda : (0, 0))
-        
-        # This should be a loop of no more than 10...
-        for proposal_id, start_block, _ in proposals_dp.prst.recently_completed_and_counted_proposals:
-
-            # this is a giant loop, but ~200K for Optimism...
-            for delegatee_addr in delegations_dp.delegatee_vp_history.keys():
-
-                # this is a bisect algo 
-                vp = delegations_dp.delegatee_vp_at_block(delegatee_addr, start_block)
-
-                if vp > 0:
-                        
-                    voted = votes_dp.participated[delegatee_addr][proposal_id]
-                        
-                    num, den = new_fractions[delegatee_addr]
-                        
-                    if voted:
+        new_fractions = defaultdict(zero_fraction)
+
+        # This should be a list of no more than 10...
+        proposals = [(proposal_id, int(start_block)) for proposal_id, start_block, _ in proposals_dp.prst.recently_completed_and_counted_proposals]
+
+        if not proposals:
+            self.completed_participation_fractions = new_fractions
+            return
+
+        has_voted = votes_dp.has_voted
+
+        # this is a giant loop, but ~200K for Optimism, so it's one pass over
+        # the delegates, with the bisect done in-place on each VP history.
+        for delegatee_addr, vp_history in delegations_dp.delegatee_vp_history.items():
+
+            num, den = 0, 0
+
+            for proposal_id, start_block in proposals:
+
+                # VP at the start block, see Delegations.delegatee_vp_at_block
+                if vp_history.vp_before(start_block) > 0:
+
+                    if has_voted(delegatee_addr, proposal_id):
                         num += 1
-                        
+
                     den += 1
-                        
-                    new_fractions[delegatee_addr] = (num, den)
+
+            if den:
+                new_fractions[delegatee_addr] = (num, den)
 
         self.completed_participation_fractions = new_fractions
    
@@ -39,24 +50,29 @@ class ParticipationRateModel(DataModel):
         
         new_fractions = defaultdict(int)
         
-        # This should be a loop of no more than 10...
-        for proposal_id, start_block, end_block in proposals_dp.prst.ending_in_future_proposals:
+        # This should be a list of no more than 10...
+        proposals = [(proposal_id, int(start_block)) for proposal_id, start_block, _ in proposals_dp.prst.ending_in_future_proposals]
 
-            # this is a giant loop, but ~200K for Optimism...
-            for delegatee_addr in delegations_dp.delegatee_vp_history.keys():
+        voter_history = votes_dp.voter_history
+        has_voted = votes_dp.has_voted
 
-                num = new_fractions[delegatee_addr]
+        for delegatee_addr, vp_history in delegations_dp.delegatee_vp_history.items():
 
-                # this is a bisect algo 
-                vp = delegations_dp.delegatee_vp_at_block(delegatee_addr, start_block)
+            # Only a vote can count towards the future fraction.
+            if not proposals or delegatee_addr not in voter_history:
+                continue
 
-                if vp > 0:
-                        
-                    voted = votes_dp.participated[delegatee_addr][proposal_id]
-                    
-                    if voted:
-                        num += 1
+            num = 0
+
+            for proposal_id, start_block in proposals:
+
+                if not has_voted(delegatee_addr, proposal_id):
+                    continue
+
+                if vp_history.vp_before(start_block) > 0:
+                    num += 1
 
+            if num:
                 new_fractions[delegatee_addr] = num
                                 
         self.future_participation_fractions = new_fractions
@@ -68,10 +84,12 @@ class ParticipationRateModel(DataModel):
         if proposal_dp.prst.flag_recently_completed_and_counted_has_changed:
             self.refresh_all_completed_participation_fractions(proposal_dp, votes_dp, delegations_dp)
             proposal_dp.prst.flag_recently_completed_and_counted_has_changed = False
+            self.version += 1
         
         if proposal_dp.prst.flag_ending_in_future_proposals_has_changed:
             self.refresh_all_future_participation_fractions(proposal_dp, votes_dp, delegations_dp)
             proposal_dp.prst.flag_ending_in_future_proposals_has_changed = False
+            self.version += 1
 
     def get_rate(self, delegatee_addr):
         
@@ -1,20 +1,40 @@
 from copy import copy
-from collections import defaultdict
-from sortedcontainers import SortedDict
+from collections import defaultdict, deque
+from functools import partial
+from sortedcontainers import SortedDict, SortedKeyList
 from abc import ABC, abstractmethod
 import json, time
-from bisect import bisect_left
+from bisect import bisect_left, bisect_right, insort
+from array import array
 from copy import deepcopy
 
 from eth_abi.abi import decode as decode_abi
 
 from .signatures import *
 from .abcs import DataProduct
+from .indexes import SortedIndex, PointInTimeIndex, BlockTimestampIndex, largest_first, LAST
+from .utils import to_address
+from .logsetup import get_logger
+
+logr = get_logger('data_products')
 
 class ToDo(NotImplementedError):
     pass
 
+NON_IVOTES_KEYFRAME_INTERVAL = 32
+
 class NonIVotesVP(DataProduct):
+    """
+    The VP snapper's snapshots of non-IVotes VP, in block order.
+
+    Every NON_IVOTES_KEYFRAME_INTERVAL-th snapshot is kept in full, as a
+    keyframe, and the rest only as the holders whose VP changed since the
+    prior snapshot (None for holders that dropped out).  The snapper's own
+    `diff` is against a snapshot a week back, so it can't be chained.
+
+    As-of queries bisect to the snapshot, then replay at most one
+    interval of deltas.
+    """
 
     @property
     def name(self):
@@ -26,69 +46,149 @@ class NonIVotesVP(DataProduct):
 
         self.change = defaultdict(dict)
 
-        self.total = []
-        self.history = []
-        self.history_len = 0
-        self.history_bn_to_pos = {}
-        self.history_ts_to_pos = {}
+        self.totals = PointInTimeIndex() # block number -> total, in block order, so positions line up
+        self.timestamps = []
+        self.keyframes = []
+        self.deltas = []
+        self.latest_vp = {}
 
     def handle(self, event):
 
-        if int(event['block_number']) not in self.history_bn_to_pos:
+        block_number = int(event['block_number'])
+
+        pos = self.totals.position(block_number)
+
+        if pos >= 0 and self.totals.block_numbers[pos] == block_number:
+            return
+
+        self.rx_event_cnt += 1
+
+        self.change = defaultdict(dict)
+        self.change.update(**event['diff'])
+
+        timestamp = int(event['timestamp'])
+
+        i = bisect_left(self.timestamps, timestamp)
+        assert i == len(self.timestamps) or self.timestamps[i] != timestamp, f"Duplicate timestamp: {event['timestamp']}"
+
+        if pos == self.history_len - 1:
+            self.append(block_number, timestamp, event['vp'], event['total'])
+            return
+
+        # A snapshot from before the latest, so re-encode, in block order.
+        snapshots = [(bn, ts, self.vp_at_position(p), total) for p, (bn, ts, total) in enumerate(zip(self.totals.block_numbers, self.timestamps, self.totals.values))]
+        snapshots.insert(pos + 1, (block_number, timestamp, event['vp'], event['total']))
+
+        self.totals = PointInTimeIndex()
+        self.timestamps = []
+        self.keyframes = []
+        self.deltas = []
+        self.latest_vp = {}
+
+        for snapshot in snapshots:
+            self.append(*snapshot)
+
+    def append(self, block_number, timestamp, vp, total):
+
+        if self.history_len % NON_IVOTES_KEYFRAME_INTERVAL == 0:
+            self.keyframes.append(vp)
+            delta = None
+        else:
+            prior = self.latest_vp
+            delta = {addr : value for addr, value in vp.items() if prior.get(addr) != value}
+            delta.update((addr, None) for addr in prior.keys() - vp.keys())
+
+        self.deltas.append(delta)
+        self.totals.set(block_number, total)
+        self.timestamps.append(timestamp)
+        self.latest_vp = vp
+
+    def vp_at_position(self, pos):
+
+        if pos == self.history_len - 1:
+            return self.latest_vp
+
+        k = pos // NON_IVOTES_KEYFRAME_INTERVAL
+
+        vp = dict(self.keyframes[k])
+
+        for delta in self.deltas[k * NON_IVOTES_KEYFRAME_INTERVAL + 1:pos + 1]:
+            for addr, value in delta.items():
+                if value is None:
+                    vp.pop(addr, None)
+                else:
+                    vp[addr] = value
+
+        return vp
+
+    def user_vp_at_position(self, address, pos):
+
+        k = pos // NON_IVOTES_KEYFRAME_INTERVAL
+
+        for j in range(pos, k * NON_IVOTES_KEYFRAME_INTERVAL, -1):
+            delta = self.deltas[j]
+            if address in delta:
+                value = delta[address]
+                return 0 if value is None else value
 
-            self.rx_event_cnt += 1
+        return self.keyframes[k].get(address, 0)
 
-            self.change = defaultdict(dict)
-            self.change.update(**event['diff'])
+    @property
+    def history_len(self):
+        return len(self.timestamps)
 
-            assert event['timestamp'] not in self.history_ts_to_pos, f"Duplicate timestamp: {event['timestamp']}"
+    @property
+    def total(self):
+        return self.totals.values
 
-            self.history.append(event['vp'])
-            self.total.append(event['total'])
-            self.history_bn_to_pos[int(event['block_number'])] = copy(self.history_len)
-            self.history_ts_to_pos[int(event['timestamp'])] = copy(self.history_len)
-            self.history_len += 1
-            self.history_bn_to_pos = dict(sorted(self.history_bn_to_pos.items()))
-            self.history_ts_to_pos = dict(sorted(self.history_ts_to_pos.items()))
+    @property
+    def history(self):
+        # Every snapshot in full, only for the data dump.
+        return [self.vp_at_position(pos) for pos in range(self.history_len)]
+
+    @property
+    def history_bn_to_pos(self):
+        return {bn : pos for pos, bn in enumerate(self.totals.block_numbers)}
+
+    @property
+    def history_ts_to_pos(self):
+        return {ts : pos for pos, ts in enumerate(self.timestamps)}
 
     @property
     def latest(self):
-        return self.history[self.history_ts_to_pos[max(self.history_ts_to_pos)]]
+        return self.latest_vp
     
     @property
     def latest_total(self):
-        return self.total[self.history_ts_to_pos[max(self.history_ts_to_pos)]]
+        return self.totals.values[-1]
 
     def block_number_to_snapshot_block_number(self, requested_bn):
-
-        requested_bn = int(requested_bn)
-        snapshot_bn = 0
-        for bn in self.history_bn_to_pos.keys():
-            if bn > requested_bn:
-                break
-            snapshot_bn = bn
-
-        return snapshot_bn
+        return self.totals.block_number_at(requested_bn, 0)
 
     def get_user_vp_at_block(self, address, block_number):
 
-        snapshot_bn = self.block_number_to_snapshot_block_number(block_number)
+        pos = self.totals.position(block_number)
 
-        if snapshot_bn == 0:
+        if pos < 0:
             return 0
         
-        return self.history[self.history_bn_to_pos[snapshot_bn]].get(address, 0)
+        return self.user_vp_at_position(address, pos)
     
     def get_total_asof_block_number(self, block_number):
+        return self.totals.at(block_number, 0)
 
-        snapshot_bn = self.block_number_to_snapshot_block_number(block_number)
+    def get_all_vp_at_block(self, block_number):
+        """
+        Returns (snapshot block number, {address : vp}) as of the block, or
+        (0, {}) before the first snapshot.
+        """
 
-        if snapshot_bn == 0:
-            return 0
-        
-        pos = self.history_bn_to_pos[snapshot_bn]
+        pos = self.totals.position(block_number)
 
-        return self.total[pos]
+        if pos < 0:
+            return 0, {}
+
+        return self.totals.block_numbers[pos], self.vp_at_position(pos)
     
     def to_dict(self):
 
@@ -103,8 +203,6 @@ class NonIVotesVP(DataProduct):
 
         }
 
-
-
 class Balances(DataProduct):
 
     def __init__(self, token_spec):
@@ -133,6 +231,26 @@ class Balances(DataProduct):
 
         self.balances[event['from']] -= event[field]
         self.balances[event['to']] += event[field]
+
+    def handle_batch(self, events):
+
+        # Net the transfers per address, then touch each balance once.
+        deltas = defaultdict(int)
+
+        if self.erc721:
+            for event in events:
+                deltas[event['from']] -= 1
+                deltas[event['to']] += 1
+        else:
+            field = self.value_field_name
+            for event in events:
+                value = event[field]
+                deltas[event['from']] -= value
+                deltas[event['to']] += value
+
+        balances = self.balances
+        for address, delta in deltas.items():
+            balances[address] += delta
     
     def balance_of(self, address):
         return self.balances[address]
@@ -143,12 +261,20 @@ class Balances(DataProduct):
         values.sort(key=lambda x:x[-1])
         return [v[0] for v in values[-1 * int(k):]]
 
+def scope_event_order(event):
+    return int(event['block_number']), int(event['transaction_index']), int(event['log_index'])
+
 class ProposalTypes(DataProduct):
     def __init__(self):
         self.proposal_types = defaultdict(dict)
         self.proposal_types_history = defaultdict(list)
+        self.proposal_types_index = {} # proposal_type_id -> PointInTimeIndex of ProposalTypeSet events
         self.scope_events = defaultdict(list)  # proposal_type_id -> list of scope events
 
+        self.scope_state = {}     # proposal_type_id -> {scope_id : scope}, kept up to date by handle
+        self.scope_last_key = {}  # proposal_type_id -> (bn, tid, lid) of the last scope event applied
+        self.resolved = {}        # proposal_type_id -> shared proposal type, with scopes and id
+
     def handle(self, event):
 
         signature = event['signature']
@@ -163,6 +289,8 @@ class ProposalTypes(DataProduct):
             if not 'scopes' in self.proposal_types[proposal_type_id].keys():
                 self.proposal_types[proposal_type_id]['scopes'] = []
             self.proposal_types_history[proposal_type_id].append(event)
+            self.proposal_types_index.setdefault(proposal_type_id, PointInTimeIndex()).set(event['block_number'], event)
+            self.resolved.pop(proposal_type_id, None)
 
         elif 'Scope' in signature:
             event_copy = copy(event)
@@ -177,89 +305,119 @@ class ProposalTypes(DataProduct):
             del event_copy['sighash']
             
             self.scope_events[proposal_type_id].append(event_copy)
+
+            key = scope_event_order(event_copy)
+
+            # Events normally arrive in order, and are applied as they come.
+            # One that arrives late means replaying them all, in order.
+            if proposal_type_id in self.scope_state and key >= self.scope_last_key[proposal_type_id]:
+                self._apply_scope_event(self.scope_state[proposal_type_id], event_copy)
+                self.scope_last_key[proposal_type_id] = key
+            else:
+                self.scope_state[proposal_type_id] = self._replay_scope_events(proposal_type_id)
+                self.scope_last_key[proposal_type_id] = max(key, self.scope_last_key.get(proposal_type_id, key))
+
+            self.resolved.pop(proposal_type_id, None)
             
         else:
             raise Exception(f"Event signature {signature} not handled.")
 
-    def _resolve_scope_state(self, proposal_type_id):
-        events = self.scope_events[proposal_type_id]
-        if not events:
-            return []
-        
-        events = sorted(events, key=lambda e: (int(e['block_number']), int(e['transaction_index']), int(e['log_index'])))
+    def _replay_scope_events(self, proposal_type_id):
+
+        events = sorted(self.scope_events[proposal_type_id], key=scope_event_order)
         
         scopes = {}
         
         for event in events:
-            signature = event['sig']
-            scope_key = event['scope_key']
-            selector = event.get('selector', '')
-            
-            scope_id = f"{scope_key}_{selector}"
-            
-            if signature == 'C':  # Created
-                scopes[scope_id] = {
-                    'scope_key': scope_key,
-                    'selector': selector,
-                    'status': 'created',
-                    'disabled_event': {},
-                    'deleted_event': {}
-                }
-                
-                for k, v in event.items():
-                    if k not in ['scope_key', 'proposal_type_id', 'sig', 'selector']:
-                        scopes[scope_id][k] = v
-                            
-            elif signature == 'D':  # Disabled
-                if 'idx' in event:  # v2 - ScopeDisabled(uint8,bytes24,uint8)
-                    idx = event['idx']
-                    active_scopes = [s for s in scopes.values() if s['scope_key'] == scope_key and s['status'] == 'created']
-                    if idx < len(active_scopes):
-                        target_scope = active_scopes[idx]
-                        target_scope['disabled_event'] = event
-                        target_scope['status'] = 'disabled'
-                else:  # v1 - disable all scopes with the scope_key
-                    for scope in scopes.values():
-                        if scope['scope_key'] == scope_key and scope['status'] == 'created':
-                            scope['disabled_event'] = event
-                            scope['status'] = 'disabled'
-                            
-            elif signature == 'X':  # Deleted
-                if 'idx' in event:  # v2 - ScopeDeleted(uint8,bytes24,uint8)
-                    idx = event['idx']
-                    active_scopes = [s for s in scopes.values() if s['scope_key'] == scope_key and s['status'] == 'created']
-                    if idx < len(active_scopes):
-                        target_scope = active_scopes[idx]
-                        target_scope['deleted_event'] = event
-                        target_scope['status'] = 'deleted'
-                else:  # v1 - delete all scopes with the scope_key
-                    for scope in scopes.values():
-                        if scope['scope_key'] == scope_key and scope['status'] == 'created':
-                            scope['deleted_event'] = event
-                            scope['status'] = 'deleted'
+            self._apply_scope_event(scopes, event)
+
+        return scopes
+
+    def _apply_scope_event(self, scopes, event):
+
+        signature = event['sig']
+        scope_key = event['scope_key']
+        selector = event.get('selector', '')
+        
+        scope_id = f"{scope_key}_{selector}"
         
-        return list(scopes.values())
+        if signature == 'C':  # Created
+            scopes[scope_id] = {
+                'scope_key': scope_key,
+                'selector': selector,
+                'status': 'created',
+                'disabled_event': {},
+                'deleted_event': {}
+            }
+            
+            for k, v in event.items():
+                if k not in ['scope_key', 'proposal_type_id', 'sig', 'selector']:
+                    scopes[scope_id][k] = v
+                        
+        elif signature == 'D':  # Disabled
+            if 'idx' in event:  # v2 - ScopeDisabled(uint8,bytes24,uint8)
+                idx = event['idx']
+                active_scopes = [s for s in scopes.values() if s['scope_key'] == scope_key and s['status'] == 'created']
+                if idx < len(active_scopes):
+                    target_scope = active_scopes[idx]
+                    target_scope['disabled_event'] = event
+                    target_scope['status'] = 'disabled'
+            else:  # v1 - disable all scopes with the scope_key
+                for scope in scopes.values():
+                    if scope['scope_key'] == scope_key and scope['status'] == 'created':
+                        scope['disabled_event'] = event
+                        scope['status'] = 'disabled'
+                        
+        elif signature == 'X':  # Deleted
+            if 'idx' in event:  # v2 - ScopeDeleted(uint8,bytes24,uint8)
+                idx = event['idx']
+                active_scopes = [s for s in scopes.values() if s['scope_key'] == scope_key and s['status'] == 'created']
+                if idx < len(active_scopes):
+                    target_scope = active_scopes[idx]
+                    target_scope['deleted_event'] = event
+                    target_scope['status'] = 'deleted'
+            else:  # v1 - delete all scopes with the scope_key
+                for scope in scopes.values():
+                    if scope['scope_key'] == scope_key and scope['status'] == 'created':
+                        scope['deleted_event'] = event
+                        scope['status'] = 'deleted'
+
+    def _resolve_scope_state(self, proposal_type_id):
+        return list(self.scope_state.get(proposal_type_id, {}).values())
 
     def get_scopes(self, proposal_type_id):
-        return self._resolve_scope_state(proposal_type_id)
+        return [copy(scope) for scope in self._resolve_scope_state(proposal_type_id)]
 
     def get_historic_proposal_type(self, proposal_type_id, block_number):
 
-        proposal_type_history = self.proposal_types_history[proposal_type_id]
-
-        pit_proposal_type = None
+        index = self.proposal_types_index.get(proposal_type_id)
 
-        for proposal_type in proposal_type_history:
-            if int(proposal_type['block_number']) > int(block_number):
-                break
-            pit_proposal_type = proposal_type
+        pit_proposal_type = index.at(block_number) if index else None
 
         return {k : pit_proposal_type[k] for k in ['quorum', 'approval_threshold', 'name']}
 
     def get_proposal_type_with_scopes(self, proposal_type_id):
-        proposal_type = self.proposal_types[proposal_type_id].copy()
+        proposal_type = self.proposal_types.get(proposal_type_id, {}).copy()
         proposal_type['scopes'] = self.get_scopes(proposal_type_id)
         return proposal_type
+
+    def get_resolved_proposal_type(self, proposal_type_id):
+        """
+        The proposal type, with its scopes and id, built once per change to
+        it, and shared by every caller, so it must not be mutated.
+        """
+
+        try:
+            return self.resolved[proposal_type_id]
+        except KeyError:
+            pass
+
+        proposal_type = self.get_proposal_type_with_scopes(proposal_type_id)
+        proposal_type['id'] = proposal_type_id
+
+        self.resolved[proposal_type_id] = proposal_type
+
+        return proposal_type
     
 def round_to_hour(ts):
     return ts - (ts % 3600)
@@ -271,6 +429,68 @@ def round_and_seven_days_ago(ts):
     tmp = round_to_hour(ts)
     return seven_days_ago(tmp)
 
+def trim_recent_history(recent_history, seven_day_block_number):
+    """
+    Drops the (block_number, vp) changes from the front of a delegate's
+    recent history, that are superseded before `seven_day_block_number`,
+    and returns the VP as of that block, ie the last change strictly
+    before it.
+    """
+
+    while len(recent_history) > 1 and recent_history[1][0] < seven_day_block_number:
+        recent_history.popleft()
+
+    if recent_history and recent_history[0][0] < seven_day_block_number:
+        return recent_history[0][1]
+
+    return 0
+
+class VPHistory:
+    """
+    A delegate's VP checkpoints, as parallel arrays: block numbers in an
+    array('Q'), and VPs in a list, since they outgrow 64 bits.  Appended
+    in block order, and bisected in place.
+    """
+
+    __slots__ = ('block_numbers', 'vps')
+
+    def __init__(self):
+        self.block_numbers = array('Q')
+        self.vps = []
+
+    def append(self, block_number, vp):
+        self.block_numbers.append(block_number)
+        self.vps.append(vp)
+
+    def position_before(self, block_number):
+        """
+        The position of the last checkpoint strictly before `block_number`,
+        or -1 if there is none.
+        """
+        return bisect_left(self.block_numbers, block_number) - 1
+
+    def vp_before(self, block_number):
+        i = bisect_left(self.block_numbers, block_number) - 1
+        return self.vps[i] if i >= 0 else 0
+
+    def items(self, start=0):
+        return list(zip(self.block_numbers[start:], self.vps[start:]))
+
+    def __len__(self):
+        return len(self.vps)
+
+    def __getitem__(self, i):
+        return self.block_numbers[i], self.vps[i]
+
+    def __eq__(self, other):
+        return isinstance(other, VPHistory) and self.block_numbers == other.block_numbers and self.vps == other.vps
+
+    def __getstate__(self):
+        return self.block_numbers, self.vps
+
+    def __setstate__(self, state):
+        self.block_numbers, self.vps = state
+
 class Delegations(DataProduct):
     def __init__(self):
         # Data about the delegatee (ie, the delegate's influence)
@@ -282,7 +502,7 @@ class Delegations(DataProduct):
 
         self.voting_power = 0
 
-        self.delegatee_vp_history = defaultdict(list)
+        self.delegatee_vp_history = defaultdict(VPHistory)
 
         # Track the oldest and latest delegation events for each delegate
         self.delegatee_oldest_event = defaultdict(dict)
@@ -294,8 +514,8 @@ class Delegations(DataProduct):
 
         self.delegator_delegate = defaultdict(set)
 
-        self.timestamp_to_block = SortedDict()
-        self.delegatee_vp_recent_history = defaultdict(SortedDict)
+        self.block_timestamps = BlockTimestampIndex()
+        self.delegatee_vp_recent_history = defaultdict(deque) # (block_number, vp), trimmed as the 7-day-ago block advances
 
         self.current_block_number = 0
         self.current_ts = 0
@@ -303,8 +523,6 @@ class Delegations(DataProduct):
 
         self.seven_day_block_number = 0
         self.seven_day_ts = 0
-
-        self.cached_seven_day_vp = defaultdict(lambda: (0, 0))
         
     def handle_block(self, event):
 
@@ -317,7 +535,7 @@ class Delegations(DataProduct):
         self.current_block_number = block_number
         self.current_ts = timestamp
 
-        self.timestamp_to_block[timestamp] = block_number
+        self.block_timestamps.add(block_number, timestamp)
 
         rounded_ts = round_to_hour(timestamp)
         self.rounded_seven_day_ts = seven_days_ago(rounded_ts)
@@ -325,12 +543,10 @@ class Delegations(DataProduct):
         if self.current_rounded_ts != rounded_ts:
             self.current_rounded_ts = rounded_ts
 
-            # bisect_right returns the first position after seven_days_ago, 
-            # so the -1 gets the previous block
-            index = self.timestamp_to_block.bisect_right(self.rounded_seven_day_ts)
-            if index != 0:
-                closest_key = self.timestamp_to_block.keys()[index - 1]
-                self.seven_day_block_number = self.timestamp_to_block[closest_key]
+            # The last block at or before seven days ago.
+            closest = self.block_timestamps.block_at_timestamp(self.rounded_seven_day_ts)
+            if closest is not None:
+                self.seven_day_block_number = closest[0]
             else:
                 pass # print("No timestamp found that is older than 7 days.")
 
@@ -346,9 +562,9 @@ class Delegations(DataProduct):
 
         if signature == DELEGATE_CHANGED_1:
 
-            delegator = event['delegator'].lower()
-            to_delegate = event['to_delegate'].lower()
-            from_delegate = event['from_delegate'].lower()
+            delegator = to_address(event['delegator'])
+            to_delegate = to_address(event['to_delegate'])
+            from_delegate = to_address(event['from_delegate'])
 
             self.delegatee_list[to_delegate][delegator] = (block_number, transaction_index)
 
@@ -388,7 +604,7 @@ class Delegations(DataProduct):
             self.delegatee_cnt[to_delegate] = len(self.delegatee_list[to_delegate])
 
         elif signature == DELEGATE_CHANGED_2:
-            delegator = event['delegator'].lower()
+            delegator = to_address(event['delegator'])
             
             # Parse old and new delegations
             old_delegatees = event.get('old_delegatees')
@@ -396,7 +612,7 @@ class Delegations(DataProduct):
             
             # Handle old delegations removal
             for old_delegation in old_delegatees:
-                old_delegate = old_delegation[0].lower()
+                old_delegate = to_address(old_delegation[0])
                 amount = old_delegation[1]
 
                 if old_delegate in self.delegatee_list:
@@ -419,7 +635,7 @@ class Delegations(DataProduct):
 
             # Handle new delegations addition
             for new_delegation in new_delegatees:
-                to_delegate = new_delegation[0].lower()
+                to_delegate = to_address(new_delegation[0])
                 amount = new_delegation[1]
                 
                 if not self.delegatee_oldest_event.get(to_delegate):
@@ -445,85 +661,92 @@ class Delegations(DataProduct):
                 
 
         elif signature == DELEGATE_VOTES_CHANGE:
+            self.handle_delegate_votes_changes([event])
+
+    def handle_batch(self, events):
 
-            delegatee = event['delegate'].lower()
+        if not events:
+            return
+
+        if 'timestamp' in events[0]:
+            for event in events:
+                self.handle_block(event)
+        elif all(event['signature'] == DELEGATE_VOTES_CHANGE for event in events):
+            self.handle_delegate_votes_changes(events)
+        else:
+            for event in events:
+                self.handle(event)
+
+    def handle_delegate_votes_changes(self, events):
+        """
+        DELEGATE_VOTES_CHANGE events, one from `handle`, or a batch from
+        the archive, with the lookups hoisted out of the loop.  These are
+        the bulk of the archive.
+        """
+
+        delegatee_vp = self.delegatee_vp
+        delegatee_vp_history = self.delegatee_vp_history
+        delegatee_vp_recent_history = self.delegatee_vp_recent_history
+        seven_day_block_number = self.seven_day_block_number
+
+        voting_power = self.voting_power
+
+        for event in events:
+
+            delegatee = to_address(event['delegate'])
 
             # TODO figure out why optimism's abi encode new_balance/previous_balance,
             # but more modern DAOs seem to rely on new_votes/previous_votes.
             new_votes = int(event.get('new_votes', event.get('new_balance', None)))
             previous_votes = int(event.get('previous_votes', event.get('previous_balance', None)))
 
-            assert new_votes is not None
-            assert previous_votes is not None
-
-            self.voting_power += (new_votes - previous_votes)
-            self.delegatee_vp[delegatee] = new_votes
+            voting_power += (new_votes - previous_votes)
+            delegatee_vp[delegatee] = new_votes
 
             block_number = int(event['block_number'])
 
-            self.delegatee_vp_history[delegatee].append((block_number, new_votes))
-
-            recent_history = self.delegatee_vp_recent_history[delegatee]
+            delegatee_vp_history[delegatee].append(block_number, new_votes)
 
-            recent_history[block_number] = new_votes
+            recent_history = delegatee_vp_recent_history[delegatee]
+            recent_history.append((block_number, new_votes))
 
-            if len(recent_history) > 1:
-                pos = recent_history.bisect_right(self.seven_day_block_number)
-                pos = max(pos - 1, 0)
-                prune_block = recent_history.keys()[pos]
+            trim_recent_history(recent_history, seven_day_block_number)
 
-                if pos != 0:
-                    recent_history = SortedDict((key, recent_history[key]) for key in recent_history.irange(minimum=prune_block))
-    
-            self.delegatee_vp_recent_history[delegatee] = recent_history
+        self.voting_power = voting_power
 
     def delegatee_vp_at_block(self, addr, block_number, include_history=False):
         block_number = int(block_number)
-        vp_history = [(0, 0)] + self.delegatee_vp_history[addr]
-        index = bisect_left(vp_history, (block_number,)) - 1
+        vp_history = self.delegatee_vp_history.get(addr)
 
-        index = max(index, 0)
+        if vp_history is None:
+            return (0, [(0, 0)]) if include_history else 0
 
-        try:
-            vp = vp_history[index][1]
-        except:
-            vp = 0
+        # The VP at a block, is the VP from the last change strictly before it.
+        i = vp_history.position_before(block_number)
+
+        vp = vp_history.vps[i] if i >= 0 else 0
 
         if include_history:
-            return vp, vp_history[index:]
+            return vp, vp_history.items(i) if i >= 0 else [(0, 0)] + vp_history.items()
         else:
             return vp
 
-    def get_seven_day_vp(self, delegatee):
-
-        vp, block_number = self.cached_seven_day_vp[delegatee]
-
-        if block_number == self.seven_day_block_number:
-            return vp
-
-        recent_history = self.delegatee_vp_recent_history[delegatee]
+    def delegatees_vp_at_block(self, addrs, block_number):
+        block_number = int(block_number)
+        return {addr : self.delegatee_vp_at_block(addr, block_number) for addr in addrs}
 
-        if len(recent_history) == 0:
-            return 0
+    def get_seven_day_vp(self, delegatee):
 
-        k = recent_history.bisect_left(self.seven_day_block_number) - 1
+        recent_history = self.delegatee_vp_recent_history.get(delegatee)
 
-        if k < 0:
+        if not recent_history:
             return 0
 
-        vp = recent_history[recent_history.keys()[k]]
-
-        self.cached_seven_day_vp[delegatee] = (vp, self.seven_day_block_number)
-
-        return vp
+        return trim_recent_history(recent_history, self.seven_day_block_number)
 
     def delegate_seven_day_vp_change(self, delegatee):
-        
-        cur_vp = self.delegatee_vp[delegatee]
-        old_vp = self.get_seven_day_vp(delegatee)
-        delta = cur_vp - old_vp
-
-        return delta 
+        # From the live VP, as partial delegations change it too, without a DelegateVotesChanged.
+        return self.delegatee_vp.get(delegatee, 0) - self.get_seven_day_vp(delegatee)
         
                 
 
@@ -662,7 +885,9 @@ class Proposal:
 
     def get_proposal_type(self, proposal_types):
         prop_type_id = self.create_event['proposal_type']
-        if hasattr(proposal_types, 'get_proposal_type_with_scopes'):
+        if hasattr(proposal_types, 'get_resolved_proposal_type'):
+            return proposal_types.get_resolved_proposal_type(prop_type_id) # shared, read-only
+        elif hasattr(proposal_types, 'get_proposal_type_with_scopes'):
             out = proposal_types.get_proposal_type_with_scopes(prop_type_id)
         else:
             out = deepcopy(proposal_types.get(prop_type_id))
@@ -994,16 +1219,99 @@ def check_weight_and_votes_are_int(event):
     else:
         raise Exception(f"weight or votes is missing from event: {event}")
 
+class VoteRecord:
+    """
+    One cast vote, shared by the voter's history and the proposal's vote
+    record.  Optional fields that the event didn't carry are None, and
+    anything unexpected is kept in `extra`.  Endpoints call `to_dict`
+    when serializing.
+    """
+
+    __slots__ = ('voter', 'proposal_id', 'support', 'weight', 'votes', 'reason', 'params', 'bn', 'tid', 'lid', 'extra')
+
+    FIELDS = frozenset(('voter', 'proposal_id', 'support', 'weight', 'votes', 'reason', 'params', 'block_number', 'transaction_index', 'log_index', 'signature', 'sighash'))
+
+    def __init__(self, event, keep_weight=True):
+
+        self.voter = event['voter']
+        self.proposal_id = str(event['proposal_id'])
+        self.support = event.get('support')
+        self.weight = event.get('weight') if keep_weight else None
+        self.votes = event.get('votes')
+        self.reason = event.get('reason') or None
+        self.params = event.get('params')
+        self.bn = event['block_number']
+        self.tid = event['transaction_index']
+        self.lid = event['log_index']
+
+        extra = {k : v for k, v in event.items() if k not in self.FIELDS}
+        self.extra = extra or None
+
+    @property
+    def vp(self):
+        return self.votes if self.weight is None else self.weight
+
+    def to_dict(self, include_proposal_id=True):
+
+        out = {'voter' : self.voter}
+
+        if include_proposal_id:
+            out['proposal_id'] = self.proposal_id
+
+        for field in ('support', 'weight', 'votes', 'reason', 'params'):
+            value = getattr(self, field)
+            if value is not None:
+                out[field] = value
+
+        out['bn'] = self.bn
+        out['tid'] = self.tid
+        out['lid'] = self.lid
+
+        if self.extra:
+            out.update(self.extra)
+
+        return out
+
+    def __eq__(self, other):
+        if not isinstance(other, VoteRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return f"VoteRecord({self.to_dict()})"
+
+def vote_vp_order(record):
+    # Ties are in block order, and stay in block order on a largest-first page, see vote_record_page.
+    return (record.vp or 0, int(record.bn), record.tid, record.lid)
+
+def vote_bn_order(record):
+    return int(record.bn)
+
+def vote_block_order(record):
+    return (int(record.bn), record.tid, record.lid)
+
+def vote_bn_tie_run(records, i):
+    bn = vote_bn_order(records[i])
+    return bisect_left(records, bn, key=vote_bn_order), bisect_right(records, bn, key=vote_bn_order)
+
+def vote_vp_tie_run(records, i):
+    vp = records[i].vp or 0
+    return records.bisect_key_left((vp,)), records.bisect_key_right((vp, LAST))
+
+def vote_vp_index():
+    return SortedKeyList(key=vote_vp_order)
+
 class Votes(DataProduct):
     def __init__(self, governor_spec, module_spec=None):
-        self.proposal_aggregations = defaultdict(lambda: VoteAggregation(module_spec))
+        self.proposal_aggregations = defaultdict(partial(VoteAggregation, module_spec))
 
         self.voter_history = defaultdict(list)
-        self.proposal_vote_record = defaultdict(list)
+        self.proposal_vote_record = defaultdict(list) # in block order
+        self.proposal_vote_record_by_vp = defaultdict(vote_vp_index) # the same records, in VP order
         
         self.latest_vote_block = defaultdict(int)
 
-        self.participated = defaultdict(lambda : defaultdict(lambda : False))
+        self.vote_index = defaultdict(list) # (voter, proposal_id) -> [VoteRecord, ...], as voter_history has them
         self.module_spec = module_spec
 
         if governor_spec['name'] == 'compound':
@@ -1012,51 +1320,370 @@ class Votes(DataProduct):
             self.proposal_id_field_name = 'proposal_id'
     
     def handle(self, event):
+        self.handle_batch([event])
+
+    def handle_batch(self, events):
+        """
+        Each proposal's VP index gets its batch's records in one update,
+        which sorts a large batch in one go, rather than inserting each vote.
+        """
+
+        proposal_aggregations = self.proposal_aggregations
+        voter_history = self.voter_history
+        vote_index = self.vote_index
+        proposal_vote_record = self.proposal_vote_record
+        latest_vote_block = self.latest_vote_block
+
+        keep_weight = not (self.module_spec and self.module_spec['name'] == 'WorldIDVoting')
+
+        by_proposal = defaultdict(list)
+
+        for event in events:
+
+            try:
+                proposal_id = str(event['proposal_id'])
+            except KeyError as e:
+                # Skipped, rather than tallied against the previous event's proposal.
+                logr.error(f"E292250323 - Problem with the following event {event}.")
+                continue
+
+            event = proposal_aggregations[proposal_id].tally(event)
+
+            assert check_weight_and_votes_are_int(event)
+
+            # One record, shared by both views.
+            record = VoteRecord(event, keep_weight=keep_weight)
+
+            voter = record.voter
+
+            voter_history[voter].append(record)
+
+            vote_index[(voter, proposal_id)].append(record)
+
+            records = proposal_vote_record[proposal_id]
+            if records and vote_block_order(records[-1]) > vote_block_order(record):
+                # The archive reads each signal in turn, so a VoteCastWithParams can land before an earlier VoteCast.
+                insort(records, record, key=vote_block_order)
+            else:
+                records.append(record)
+            by_proposal[proposal_id].append(record)
+
+            voter = to_address(voter)
+            block_number = int(event['block_number']) if isinstance(event['block_number'], str) else event['block_number']
+            if block_number > latest_vote_block[voter]:
+                latest_vote_block[voter] = block_number
+
+        for proposal_id, records in by_proposal.items():
+            self.proposal_vote_record_by_vp[proposal_id].update(records)
+
+    def get_votes(self, voter, proposal_id):
+        return self.vote_index.get((voter, proposal_id), [])
+
+    def has_voted(self, voter, proposal_id):
+        return (voter, proposal_id) in self.vote_index
+
+    def vote_record_page(self, proposal_id, sort_by='BN', reverse=False, offset=0, page_size=None):
+        """
+        Returns ([record, ...], has_more) for one page of a proposal's vote
+        record, sliced from the record in block order, or the VP index, in
+        either direction.  A falsy page_size means the rest of the record.
+        """
+
+        if sort_by == 'BN':
+            records = self.proposal_vote_record.get(proposal_id, ())
+        elif sort_by == 'VP':
+            records = self.proposal_vote_record_by_vp.get(proposal_id, ())
+        else:
+            raise Exception(f"Invalid sort_by: {sort_by}")
+
+        n = len(records)
+
+        stop = min(offset + page_size, n) if page_size else n
+
+        if offset >= stop:
+            return [], False
+
+        # Ties, in either direction, are broken by (block, tx, log), ascending.
+        if reverse and sort_by == 'BN':
+            page = largest_first(records, offset, stop, partial(vote_bn_tie_run, records))
+        elif reverse:
+            page = largest_first(records, offset, stop, partial(vote_vp_tie_run, records))
+        else:
+            page = records[offset:stop]
+
+        return page, stop < n
+
+class ProposalSummaries(DataProduct):
+    """
+    The `/v1/proposals` listings, cached per (set, sort) until the next
+    proposal or vote event.
+
+    Each proposal's entry, with its vote totals, is kept as a fragment,
+    and only rebuilt after an event for that proposal, so a new vote
+    costs one proposal's totals rather than every proposal's.
+    """
+
+    def __init__(self, proposals, votes):
+
+        self.proposals = proposals
+        self.votes = votes
+
+        self.version = 0
+
+        self.fragments = {}
+        self.dirty = set()
+
+        self.listings = {}
+
+    def handle(self, event):
+
+        if 'timestamp' in event:
+            return
+
+        # Proposals renames its id field to 'id', Votes leaves 'proposal_id'.
+        proposal_id = event.get('proposal_id', event.get('id'))
+
+        if proposal_id is None:
+            return
+
+        self.dirty.add(str(proposal_id))
+        self.version += 1
+
+    def fragment(self, proposal):
 
-        PROPOSAL_ID_FIELD = self.proposal_id_field_name
+        proposal_id = proposal.create_event['id']
+
+        if proposal_id in self.dirty or proposal_id not in self.fragments:
+
+            out = copy(proposal.to_dict())
+
+            aggregation = self.votes.proposal_aggregations.get(proposal_id)
+            out['totals'] = aggregation.totals() if aggregation else {}
+
+            self.fragments[proposal_id] = out
+            self.dirty.discard(proposal_id)
+
+        return self.fragments[proposal_id]
+
+    def listing(self, proposal_set='all', sort_key=''):
+
+        key = (proposal_set, sort_key)
 
         try:
-            proposal_id = str(event['proposal_id'])
-        except KeyError as e:
-            print(f"E292250323 - Problem with the following event {event}.")
+            version, out = self.listings[key]
+            if version == self.version:
+                return out
+        except KeyError:
+            pass
+
+        if proposal_set == 'relevant':
+            res = self.proposals.relevant()
+        else:
+            res = self.proposals.unfiltered()
 
-        event = self.proposal_aggregations[proposal_id].tally(event)
+        out = [self.fragment(prop) for prop in res]
 
-        event_cp = copy(event)
+        if sort_key:
+            out.sort(key=lambda x: x[sort_key], reverse=True)
 
-        del event_cp['sighash']
-        del event_cp['signature']
+        self.listings[key] = (self.version, out)
 
-        if "reason" in event_cp:
-            if event_cp['reason'] == "":
-                del event_cp['reason']
+        return out
 
-        # This is basically just a RAM & I/O optimization.
-        event_cp['bn'] = event_cp['block_number']
-        del event_cp['block_number']
-        event_cp['tid'] = event_cp['transaction_index']
-        del event_cp['transaction_index']
-        event_cp['lid'] = event_cp['log_index']
-        del event_cp['log_index']
+ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
+LEADERBOARD_SORT_KEYS = ('VP', 'DC', 'MRD', 'OLD', 'LVB', 'VPC', 'PR')
 
-        event_cp['proposal_id'] = str(event_cp['proposal_id'])
+class DelegateLeaderboard(DataProduct):
+    """
+    Sorted views of the delegates, one per `/v1/delegates` sort key, so a
+    page is a slice rather than a sort of every delegate.
 
-        assert check_weight_and_votes_are_int(event_cp)
-        voter = event['voter']
+    It listens to the same signals as the products it reads from, and
+    only records which delegates an event touched.  The indexes catch up
+    on read, so the archive replay pays nothing for them.
+    """
 
-        if self.module_spec and self.module_spec['name'] == 'WorldIDVoting':
-            del event_cp['weight']
+    def __init__(self, delegations, votes, non_ivotes_vp=None, participation_rate_model=None):
 
-        self.voter_history[voter].append(event_cp)
+        self.delegations = delegations
+        self.votes = votes
+        self.non_ivotes_vp = non_ivotes_vp
+        self.participation_rate_model = participation_rate_model
 
-        self.participated[voter][proposal_id] = True
+        self.indexes = {sort_by : SortedIndex() for sort_by in LEADERBOARD_SORT_KEYS}
 
-        event_cp = copy(event_cp)
-        del event_cp['proposal_id']
+        self.dirty = set()
+        self.stale = True
 
-        self.proposal_vote_record[proposal_id].append(event_cp)
-        
-        voter = event['voter'].lower()
-        block_number = int(event['block_number']) if isinstance(event['block_number'], str) else event['block_number']
-        if block_number > self.latest_vote_block[voter]:
-            self.latest_vote_block[voter] = block_number
\ No newline at end of file
+        self.non_ivotes_latest = {}
+        self.non_ivotes_change = {}
+
+        self.seven_day_block_number = None
+        self.participation_rate_version = None
+
+    def handle(self, event):
+
+        if self.stale or 'timestamp' in event:
+            return
+
+        signature = event.get('signature')
+
+        if signature == DELEGATE_CHANGED_1:
+            self.dirty.add(event['from_delegate'].lower())
+            self.dirty.add(event['to_delegate'].lower())
+        elif signature == DELEGATE_CHANGED_2:
+            for delegation in event['old_delegatees'] + event['new_delegatees']:
+                self.dirty.add(delegation[0].lower())
+        elif signature == DELEGATE_VOTES_CHANGE:
+            self.dirty.add(event['delegate'].lower())
+        elif signature in (VOTE_CAST_1, VOTE_CAST_WITH_PARAMS_1):
+            self.dirty.add(event['voter'].lower())
+        elif 'vp' in event:
+            self.handle_non_ivotes()
+
+    def handle_non_ivotes(self):
+
+        latest, change = self.get_non_ivotes()
+
+        for old, new in ((self.non_ivotes_latest, latest), (self.non_ivotes_change, change)):
+            self.dirty.update(addr for addr in old.keys() | new.keys() if old.get(addr) != new.get(addr))
+
+        self.non_ivotes_latest, self.non_ivotes_change = latest, change
+
+    def get_non_ivotes(self):
+
+        if self.non_ivotes_vp is None or not self.non_ivotes_vp.history_len:
+            return {}, {}
+
+        return self.non_ivotes_vp.latest, self.non_ivotes_vp.change
+
+    def sort_values(self, addr):
+        """
+        The value of every sort key for one delegate, or None if the
+        delegate isn't listed under that key.  Mirrors the unindexed path
+        in the `/v1/delegates` handler.
+        """
+
+        delegations = self.delegations
+
+        in_vp = addr in delegations.delegatee_vp
+        in_non_ivotes = addr in self.non_ivotes_latest
+
+        vp = delegations.delegatee_vp.get(addr, 0)
+        lvb = int(self.votes.latest_vote_block.get(addr, 0))
+
+        latest_event = delegations.delegatee_latest_event.get(addr)
+        oldest_event = delegations.delegatee_oldest_event.get(addr)
+
+        if in_vp:
+            vpc = delegations.delegate_seven_day_vp_change(addr)
+        else:
+            vpc = 0
+
+        pr = None
+        prm = self.participation_rate_model
+        if prm is not None and addr in prm.completed_participation_fractions:
+            pr = prm.get_rate(addr)
+
+        if self.non_ivotes_vp is None:
+            return {
+                'VP'  : vp if in_vp else None,
+                'DC'  : delegations.delegatee_cnt.get(addr),
+                'MRD' : int(latest_event['block_number']) if latest_event else None,
+                'OLD' : int(oldest_event['block_number']) if oldest_event else None,
+                'LVB' : lvb if in_vp and lvb > 0 else None,
+                'VPC' : vpc if in_vp else None,
+                'PR'  : pr,
+            }
+
+        total_vp = vp + int(self.non_ivotes_latest.get(addr, 0))
+
+        def or_zero(value, present):
+            if value is not None:
+                return value
+            return 0 if present else None
+
+        return {
+            'VP'  : total_vp if (in_vp or in_non_ivotes) and total_vp > 0 else None,
+            'DC'  : or_zero(delegations.delegatee_cnt.get(addr), in_non_ivotes),
+            'MRD' : or_zero(int(latest_event['block_number']) if latest_event else None, in_non_ivotes),
+            'OLD' : or_zero(int(oldest_event['block_number']) if oldest_event else None, in_non_ivotes),
+            'LVB' : lvb if (in_vp or in_non_ivotes) and lvb > 0 else None,
+            'VPC' : vpc + int(self.non_ivotes_change.get(addr, 0)) if in_vp or addr in self.non_ivotes_change else None,
+            'PR'  : or_zero(pr, in_non_ivotes),
+        }
+
+    def update(self, addr, sort_keys=LEADERBOARD_SORT_KEYS):
+
+        values = self.sort_values(addr)
+
+        for sort_by in sort_keys:
+            value = values[sort_by]
+            if value is None:
+                self.indexes[sort_by].discard(addr)
+            else:
+                self.indexes[sort_by].set(addr, value)
+
+    def addresses(self):
+
+        delegations = self.delegations
+
+        addrs = set(delegations.delegatee_vp)
+        addrs.update(delegations.delegatee_cnt)
+        addrs.update(delegations.delegatee_latest_event)
+        addrs.update(delegations.delegatee_oldest_event)
+        addrs.update(self.non_ivotes_latest)
+        addrs.update(self.non_ivotes_change)
+
+        if self.participation_rate_model is not None:
+            addrs.update(self.participation_rate_model.completed_participation_fractions)
+
+        addrs.discard(ZERO_ADDRESS)
+
+        return addrs
+
+    def rebuild(self, sort_keys=LEADERBOARD_SORT_KEYS):
+
+        columns = {sort_by : [] for sort_by in sort_keys}
+
+        for addr in self.addresses():
+            values = self.sort_values(addr)
+            for sort_by in sort_keys:
+                if values[sort_by] is not None:
+                    columns[sort_by].append((addr, values[sort_by]))
+
+        for sort_by in sort_keys:
+            self.indexes[sort_by].rebuild(columns[sort_by])
+
+    def refresh(self):
+
+        prm = self.participation_rate_model
+
+        if self.stale:
+            self.non_ivotes_latest, self.non_ivotes_change = self.get_non_ivotes()
+            self.seven_day_block_number = self.delegations.seven_day_block_number
+            self.participation_rate_version = prm.version if prm is not None else None
+            self.rebuild()
+            self.stale = False
+        else:
+            self.dirty.discard(ZERO_ADDRESS)
+            for addr in self.dirty:
+                self.update(addr)
+
+        self.dirty.clear()
+
+        # Every delegate's 7-day change moves when the 7-day-ago block rolls
+        # over (hourly), and every rate when the participation model refreshes.
+        if self.seven_day_block_number != self.delegations.seven_day_block_number:
+            self.rebuild(sort_keys=('VPC',))
+            self.seven_day_block_number = self.delegations.seven_day_block_number
+
+        if prm is not None and self.participation_rate_version != prm.version:
+            self.rebuild(sort_keys=('PR',))
+            self.participation_rate_version = prm.version
+
+    def page(self, sort_by, offset=0, page_size=None, reverse=True):
+
+        self.refresh()
+
+        return self.indexes[sort_by].page(offset, page_size, reverse)
@@ -0,0 +1,74 @@
+class SeenEvents:
+    """
+    The (transaction_index, log_index) pairs heard per block, over the
+    last `depth` blocks only, so competing realtime clients can be
+    de-duplicated without the history growing forever.
+
+    Blocks live in a ring buffer, slot = block_number % depth, holding a
+    set per block.  A slot is reused by the next block to land on it, so
+    old blocks are evicted as the head advances.  Keep depth well past the
+    deepest reorg, and the snapshot overlap.
+    """
+
+    def __init__(self, depth):
+        assert depth > 0
+        self.depth = depth
+        self.head = 0 # the highest block heard
+        self.blocks = [None] * depth
+        self.pairs = [None] * depth
+
+    def in_window(self, block_num):
+        return block_num > self.head - self.depth
+
+    def add(self, block_num, pair):
+        """
+        Returns True if the event is new, False if it was already heard,
+        and None if it is from below the window, so too old to tell.
+        Callers must not mistake None for heard.
+        """
+
+        if not self.in_window(block_num):
+            return None
+
+        slot = block_num % self.depth
+
+        if self.blocks[slot] != block_num:
+            self.blocks[slot] = block_num
+            self.pairs[slot] = {pair}
+        else:
+            pairs = self.pairs[slot]
+            if pair in pairs:
+                return False
+            pairs.add(pair)
+
+        if block_num > self.head:
+            self.head = block_num
+
+        return True
+
+    def __contains__(self, key):
+
+        block_num, pair = key
+
+        slot = block_num % self.depth
+
+        return self.in_window(block_num) and self.blocks[slot] == block_num and pair in self.pairs[slot]
+
+    def since(self, block):
+        """
+        Returns [(block_number, pair), ...] for the blocks still in the
+        window, from `block` onwards.
+        """
+
+        out = []
+
+        for block_num, pairs in zip(self.blocks, self.pairs):
+            if block_num is not None and block_num >= block and self.in_window(block_num):
+                out.extend((block_num, pair) for pair in pairs)
+
+        out.sort()
+
+        return out
+
+    def __len__(self):
+        return sum(len(pairs) for block_num, pairs in zip(self.blocks, self.pairs) if block_num is not None and self.in_window(block_num))
@@ -9,6 +9,7 @@ load_dotenv()
 CAPTURE_CLIENT_OUTPUTS_TO_DISK = bool(os.getenv('CAPTURE_CLIENT_OUTPUTS_TO_DISK', False))
 CAPTURE_WS_CLIENT_OUTPUTS = bool(os.getenv('CAPTURE_WS_CLIENT_OUTPUTS', True))
 PROFILE_ARCHIVE_CLIENT = bool(os.getenv('PROFILE_ARCHIVE_CLIENT', False))
+PROFILE_DISPATCH = bool(os.getenv('PROFILE_DISPATCH', False)) # at boot, toggled at runtime with /v1/profiler/<worker_id>/<state>
 
 ENABLE_BALANCES = bool(os.getenv('ENABLE_BALANCES', True))
 ENABLE_DELEGATION = bool(os.getenv('ENABLE_DELEGATION', True))
\ No newline at end of file
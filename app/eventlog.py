@@ -0,0 +1,172 @@
+import asyncio, pickle, struct
+
+from multiprocessing import shared_memory
+
+from .logsetup import get_logger
+
+######################################################################
+#
+# Shared-memory event log.
+#
+# One ingest process hears realtime events, and appends them here;
+# every HTTP worker follows the log, and applies the same events to its
+# own data products.  The segment is created before the processes fork,
+# so they all inherit it, each with its own read cursor.
+#
+# The segment is a header, then a ring of records:
+#
+#   <u64 total bytes ever written><u64 records dropped><u64 ingest restarts>
+#   <u32 length><pickled (signal, event)> ...
+#
+# A record that doesn't fit before the end of the ring is written from
+# the start, after a WRAP marker.  There is a single writer, which
+# copies a record in, and only then bumps the total, so readers never
+# see a partial record.  A reader that falls too far behind has lost
+# records, and is told so.  A record too large for the ring is dropped,
+# and counted in the header, as are the ingest process's restarts, so
+# every worker can report them.
+#
+######################################################################
+
+HEADER = struct.Struct('<QQQ')
+RECORD = struct.Struct('<I')
+WRAP = 0xFFFFFFFF
+
+logr = get_logger('eventlog')
+
+
+class SharedEventLog:
+
+    def __init__(self, capacity):
+
+        self.shm = shared_memory.SharedMemory(create=True, size=HEADER.size + capacity)
+        self.buf = self.shm.buf
+        self.capacity = capacity
+
+        # A record is at most half the ring.  The writer may be copying one
+        # in past the total, so a reader is only safe within the other half.
+        self.max_record = capacity // 2
+
+        self.written = 0  # the writer's position
+        self.dropped = 0  # records the writer dropped, as too large
+        self.restarts = 0 # times the writer restarted
+        self.cursor = 0   # this reader's position
+        self.overruns = 0 # times this reader was lapped, and lost records
+
+        self.publish()
+
+    def publish(self):
+        HEADER.pack_into(self.buf, 0, self.written, self.dropped, self.restarts)
+
+    def total(self):
+        return HEADER.unpack_from(self.buf, 0)[0]
+
+    def stats(self):
+        """
+        Returns (records dropped, restarts), as of the writer's last update.
+        """
+        return HEADER.unpack_from(self.buf, 0)[1:]
+
+    def restarted(self):
+        self.restarts += 1
+        self.publish()
+
+    def append(self, record):
+        """
+        Returns whether the record was appended.  One too large for the
+        ring is dropped, rather than raising in the writer's dispatch.
+        """
+
+        data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        size = RECORD.size + len(data)
+
+        if size > self.max_record:
+            self.dropped += 1
+            self.publish()
+            logr.error(f"E86261017 - Dropped a record of {size} bytes, too large for the {self.capacity} byte event log, for {record[0]}.  The workers won't see this event.")
+            return False
+
+        pos = self.written
+        offset = pos % self.capacity
+
+        if offset + size > self.capacity:
+            if self.capacity - offset >= RECORD.size:
+                RECORD.pack_into(self.buf, HEADER.size + offset, WRAP)
+            pos += self.capacity - offset
+            offset = 0
+
+        start = HEADER.size + offset
+        RECORD.pack_into(self.buf, start, len(data))
+        self.buf[start + RECORD.size:start + size] = data
+
+        self.written = pos + size
+        self.publish()
+
+        return True
+
+    def lapped(self, total):
+        return total - self.cursor > self.capacity - self.max_record
+
+    def overrun(self):
+        self.overruns += 1
+        self.cursor = self.total()
+        logr.error(f"E113261017 - Event log overrun, fell more than {self.capacity - self.max_record} bytes behind the writer.  Events were lost, and this process's data products diverged.")
+
+    def read(self):
+        """
+        Returns the records appended since the last read.  If the writer
+        lapped this reader, the lost records are skipped, and the cursor
+        moves to the head.
+        """
+
+        total = self.total()
+        out = []
+
+        while self.cursor < total:
+
+            if self.lapped(total):
+                self.overrun()
+                break
+
+            offset = self.cursor % self.capacity
+
+            if self.capacity - offset < RECORD.size:
+                self.cursor += self.capacity - offset
+                continue
+
+            start = HEADER.size + offset
+            (length,) = RECORD.unpack_from(self.buf, start)
+
+            if length == WRAP:
+                self.cursor += self.capacity - offset
+                continue
+
+            data = bytes(self.buf[start + RECORD.size:start + RECORD.size + length])
+
+            # The copy is only good if the writer didn't lap us during it.
+            if self.lapped(self.total()):
+                self.overrun()
+                break
+
+            self.cursor += RECORD.size + length
+            out.append(pickle.loads(data))
+
+        return out
+
+    async def follow(self, poll_interval=0.05):
+
+        while True:
+            records = self.read()
+
+            for record in records:
+                yield record
+
+            if not records:
+                await asyncio.sleep(poll_interval)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
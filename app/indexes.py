@@ -0,0 +1,220 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from sortedcontainers import SortedList
+
+
+class Last:
+    """
+    Sorts after anything, to bisect past every (value, key) of a value.
+    """
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+LAST = Last()
+
+
+def largest_first(items, offset, stop, tie_run):
+    """
+    Positions [offset, stop) of `items`, a sequence in ascending order,
+    read largest first, but with each run of ties kept in ascending order,
+    as a stable sort with reverse=True lists them.  `tie_run(i)` returns
+    the [start, end) of the run of ties around items[i].
+    """
+
+    n = len(items)
+    out = []
+
+    while offset < stop:
+
+        start, end = tie_run(n - 1 - offset)
+
+        # Largest first, the run is at [n - end, n - start).
+        i = start + offset - (n - end)
+        j = min(end, i + stop - offset)
+
+        out.extend(items[i:j])
+        offset += j - i
+
+    return out
+
+
+class SortedIndex:
+    """
+    A value-ordered view of a {key : value} mapping.
+
+    Updates are O(log n), and a page of k records, from any offset, in
+    either direction, is O(k log n) at worst.  Ties are listed by key, in
+    ascending order, in either direction.
+    """
+
+    def __init__(self, items=()):
+        self.rebuild(items)
+
+    def rebuild(self, items):
+        self.values = dict(items)
+        self.order = SortedList((value, key) for key, value in self.values.items())
+
+    def set(self, key, value):
+
+        try:
+            old = self.values[key]
+        except KeyError:
+            pass
+        else:
+            if old == value:
+                return
+            self.order.remove((old, key))
+
+        self.values[key] = value
+        self.order.add((value, key))
+
+    def discard(self, key):
+
+        try:
+            old = self.values.pop(key)
+        except KeyError:
+            return
+
+        self.order.remove((old, key))
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __len__(self):
+        return len(self.values)
+
+    def page(self, offset=0, page_size=None, reverse=False):
+        """
+        Returns [(key, value), ...] for the page, largest value first if
+        `reverse`.  A falsy page_size means the rest of the index.
+        """
+
+        n = len(self.order)
+
+        stop = min(offset + page_size, n) if page_size else n
+
+        if offset >= stop:
+            return []
+
+        if reverse:
+            items = largest_first(self.order, offset, stop, self.tie_run)
+        else:
+            items = self.order.islice(offset, stop)
+
+        return [(key, value) for value, key in items]
+
+    def tie_run(self, i):
+        value = self.order[i][0]
+        return self.order.bisect_left((value,)), self.order.bisect_right((value, LAST))
+
+class PointInTimeIndex:
+    """
+    Values that take effect at a block number, and stay in effect until
+    the next one.  The value as of any block is a bisect, so O(log n).
+
+    Values normally arrive in block order, and are appended.  Values set
+    at the same block are kept in arrival order, and the last one wins.
+    """
+
+    def __init__(self, items=()):
+        self.block_numbers = []
+        self.values = []
+
+        for block_number, value in items:
+            self.set(block_number, value)
+
+    def set(self, block_number, value):
+
+        block_number = int(block_number)
+
+        if not self.block_numbers or block_number >= self.block_numbers[-1]:
+            self.block_numbers.append(block_number)
+            self.values.append(value)
+        else:
+            i = bisect_right(self.block_numbers, block_number)
+            self.block_numbers.insert(i, block_number)
+            self.values.insert(i, value)
+
+    def position(self, block_number):
+        """
+        The position of the value in effect at `block_number`, or -1 if
+        there is none yet.
+        """
+        return bisect_right(self.block_numbers, int(block_number)) - 1
+
+    def at(self, block_number, default=None):
+        i = self.position(block_number)
+        return self.values[i] if i >= 0 else default
+
+    def block_number_at(self, block_number, default=0):
+        i = self.position(block_number)
+        return self.block_numbers[i] if i >= 0 else default
+
+    def __len__(self):
+        return len(self.block_numbers)
+
+class BlockTimestampIndex:
+    """
+    Block numbers and their timestamps, as two parallel typed arrays.
+    Both only go up with the chain, so either column can be bisected to
+    convert one to the other, in O(log n), at 16 bytes a block.
+
+    Blocks arrive in order, and are appended.  A block already indexed is
+    ignored, and an older one, eg from an overlapping replay, is inserted.
+    """
+
+    def __init__(self, items=()):
+        self.block_numbers = array('Q')
+        self.timestamps = array('Q')
+
+        for block_number, timestamp in items:
+            self.add(block_number, timestamp)
+
+    def add(self, block_number, timestamp):
+
+        if not self.block_numbers or block_number > self.block_numbers[-1]:
+            self.block_numbers.append(block_number)
+            self.timestamps.append(timestamp)
+            return
+
+        i = bisect_left(self.block_numbers, block_number)
+
+        if self.block_numbers[i] != block_number:
+            self.block_numbers.insert(i, block_number)
+            self.timestamps.insert(i, timestamp)
+
+    def block_at_timestamp(self, timestamp):
+        """
+        The (block_number, timestamp) of the last block at or before
+        `timestamp`, or None if there is none.
+        """
+
+        i = bisect_right(self.timestamps, timestamp) - 1
+
+        if i < 0:
+            return None
+
+        return self.block_numbers[i], self.timestamps[i]
+
+    def timestamp_at_block(self, block_number):
+        """
+        The (block_number, timestamp) of the last block at or before
+        `block_number`, or None if there is none.
+        """
+
+        i = bisect_right(self.block_numbers, block_number) - 1
+
+        if i < 0:
+            return None
+
+        return self.block_numbers[i], self.timestamps[i]
+
+    def __len__(self):
+        return len(self.block_numbers)
@@ -0,0 +1,158 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+######################################################################
+#
+# Metrics, in the Prometheus text exposition format.
+#
+# Counters, gauges and histograms, keyed by a tuple of label values.
+# Each worker has its own registry, and reports its own numbers, so
+# scrape every worker, or aggregate across them in the query.
+#
+# Recording is a dict lookup and an add (plus a bisect, for a
+# histogram), so it's cheap enough for every event and request.
+#
+######################################################################
+
+# Seconds, from 100 μs to 10 s.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names, values, extra=()):
+
+    pairs = list(zip(names, values)) + list(extra)
+
+    if not pairs:
+        return ''
+
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values = defaultdict(int)
+
+    def inc(self, *label_values, amount=1):
+        self.values[label_values] += amount
+
+    def samples(self):
+        for label_values, value in sorted(self.values.items()):
+            yield f'{self.name}{format_labels(self.labels, label_values)} {format_value(value)}'
+
+
+class Gauge(Counter):
+
+    kind = 'gauge'
+
+    def set(self, *label_values, value):
+        self.values[label_values] = value
+
+
+class Histogram(Metric):
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, *label_values, value):
+
+        try:
+            counts, totals = self.series[label_values]
+        except KeyError:
+            counts, totals = self.series[label_values] = ([0] * (len(self.buckets) + 1), [0, 0.0])
+
+        # Counts are per bucket, and only made cumulative on render.
+        counts[bisect_left(self.buckets, value)] += 1
+        totals[0] += 1
+        totals[1] += value
+
+    def samples(self):
+
+        for label_values, (counts, (count, total)) in sorted(self.series.items()):
+
+            cumulative = 0
+
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else format_value(bound)
+                yield f'{self.name}_bucket{format_labels(self.labels, label_values, [("le", le)])} {cumulative}'
+
+            yield f'{self.name}_sum{format_labels(self.labels, label_values)} {format_value(total)}'
+            yield f'{self.name}_count{format_labels(self.labels, label_values)} {count}'
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, metric):
+        assert metric.name not in self.metrics, f"Duplicate metric: {metric.name}"
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+
+        lines = []
+
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram('daonode_request_duration_seconds', 'Time spent in a route handler.', ['handler'])
+
+EVENTS = REGISTRY.counter('daonode_events_total', 'Events dispatched to the data products, by signal.', ['signal', 'source'])
+DISPATCH_SECONDS = REGISTRY.histogram('daonode_dispatch_seconds', 'Time spent in a data product, per dispatch: one event from realtime, one batch from the archive.', ['data_product', 'source'])
+
+REALTIME_HEARD = REGISTRY.counter('daonode_realtime_heard_total', 'Events heard by a realtime or polling client, before de-duplication.', ['client'])
+REALTIME_DUPLICATES = REGISTRY.counter('daonode_realtime_duplicates_total', 'Events skipped, as already heard.', ['client'])
+REALTIME_TOO_OLD = REGISTRY.counter('daonode_realtime_too_old_total', 'Events from below the dedupe window, too old to tell if heard, and dispatched.', ['client'])
+
+FEED_BLOCK = REGISTRY.gauge('daonode_feed_block', 'The latest block heard by the feed.')
+CHAIN_HEAD_BLOCK = REGISTRY.gauge('daonode_chain_head_block', 'The latest block reported by the chain, as of the last poll.')
+BLOCK_LAG = REGISTRY.gauge('daonode_block_lag', 'Blocks between the chain head, and the feed.')
+BLOCK_TIMESTAMP_LAG_SECONDS = REGISTRY.gauge('daonode_block_timestamp_lag_seconds', 'Wall clock, minus the timestamp of the latest block heard.')
+
+INGEST_RESTARTS = REGISTRY.gauge('daonode_ingest_restarts', 'Times the shared ingest process restarted, after one of its tasks failed.')
+EVENT_LOG_DROPPED = REGISTRY.gauge('daonode_event_log_dropped', 'Events the shared ingest process dropped, as too large for the event log.')
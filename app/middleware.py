@@ -1,8 +1,11 @@
 import time
+import hashlib
 from functools import wraps
 from sanic.request import Request
 from sanic import response, HTTPResponse
 
+from .metrics import REQUEST_SECONDS
+
 async def start_timer(request: Request):
     # Record the start time for this request
     request.ctx.start_time = time.monotonic()
@@ -16,6 +19,8 @@ async def add_server_timing_header(request: Request, res: response.HTTPResponse)
     res.headers["Server-Timing"] = res.headers.get("Server-Timing", "") + f'total;dur={duration_ms:.3f}'
 
 def measure(handler):
+
+    name = handler.__name__
     
     @wraps(handler)
     async def wrapper(request, *args, **kwargs):
@@ -24,10 +29,54 @@ def measure(handler):
         res = await handler(request, *args, **kwargs)
 
         end_time = time.time()
+        REQUEST_SECONDS.observe(name, value=end_time - start_time)
         duration_ms = (end_time - start_time) * 1000.0 # milliseconds.
 
         res.headers["Server-Timing"] = f'data;dur={duration_ms:.3f},'
 
         return res
 
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+
+def etag(*sources):
+    """
+    Tag a handler's response with a strong ETag, derived from the position
+    (the last event handled) of the data products it reads (by name, on
+    app.ctx), plus the path and query args, and answer a matching
+    If-None-Match with a 304, without running the handler.
+
+    Positions are on-chain, so workers, and regions, that have heard the
+    same events agree on the tag, and a load-balanced client still gets
+    its 304s.
+    """
+
+    def decorator(handler):
+
+        @wraps(handler)
+        async def wrapper(request, *args, **kwargs):
+
+            ctx = request.app.ctx
+
+            positions = [getattr(getattr(ctx, source, None), 'position', None) for source in sources]
+
+            key = f"{request.path}|{sorted(request.args.items())}|{positions}"
+            tag = '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+            if_none_match = request.headers.get('If-None-Match')
+            if if_none_match:
+                candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+                candidates = [candidate[2:] if candidate.startswith('W/') else candidate for candidate in candidates] # weak
+                if tag in candidates or '*' in candidates:
+                    return HTTPResponse(status=304, headers={'ETag' : tag})
+
+            res = await handler(request, *args, **kwargs)
+
+            if res.status == 200:
+                res.headers['ETag'] = tag
+
+            return res
+
+        return wrapper
+
+    return decorator
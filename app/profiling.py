@@ -1,13 +1,65 @@
-
 import time
+import math
 import threading
 import atexit
 from collections import defaultdict
 
+class LogHistogram:
+    """
+    Durations, in fixed memory, bucketed on a log scale: SUB_BUCKETS per
+    power of two of nanoseconds, so any percentile is within 12.5% of the
+    true value, from 1 ns to ~18 minutes.
+    """
+
+    SUB_BUCKETS = 8
+    POWERS = 40
+
+    __slots__ = ('counts',)
+
+    def __init__(self):
+        self.counts = [0] * (self.SUB_BUCKETS * self.POWERS)
+
+    def add(self, duration):
+
+        ns = duration * 1e9
+
+        if ns < 1:
+            i = 0
+        else:
+            # ns = m * 2**e, with 0.5 <= m < 1
+            m, e = math.frexp(ns)
+            i = min((e - 1) * self.SUB_BUCKETS + int((2 * m - 1) * self.SUB_BUCKETS), len(self.counts) - 1)
+
+        self.counts[i] += 1
+
+    @classmethod
+    def upper_bound(cls, i):
+        e, sub = divmod(i, cls.SUB_BUCKETS)
+        return (2 ** e) * (1 + (sub + 1) / cls.SUB_BUCKETS) / 1e9
+
+    def quantile(self, q):
+        """
+        The upper bound of the bucket holding the q-th quantile, in
+        seconds, or None if empty.
+        """
+
+        total = sum(self.counts)
+
+        if total == 0:
+            return None
+
+        rank = q * total
+        cumulative = 0
+
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if count and cumulative >= rank:
+                return self.upper_bound(i)
+
 class Profiler:
     def __init__(self, print_on_exit=False):
         self._lock = threading.Lock()
-        self._stats = defaultdict(lambda: {"count": 0, "total": 0.0})
+        self._stats = defaultdict(lambda: {"count": 0, "total": 0.0, "hist": LogHistogram()})
         self._sections = {}
         if print_on_exit:
             atexit.register(self.report)
@@ -24,18 +76,50 @@ class Profiler:
             return self
 
         def __exit__(self, exc_type, exc_val, exc_tb):
-            duration = time.perf_counter() - self.start
-            with self.profiler._lock:
-                stat = self.profiler._stats[self.label]
-                stat["count"] += 1
-                stat["total"] += duration
-                stat["min"] = min(stat["min"], duration) if "min" in stat else duration
-                stat["max"] = max(stat["max"], duration) if "max" in stat else duration
+            self.profiler.record(self.label, time.perf_counter() - self.start)
 
 
     def __call__(self, label=None):
         return self._Section(self, label)
 
+    def record(self, label, duration):
+        """
+        Record a duration already measured, without a section around it.
+        """
+        with self._lock:
+            stat = self._stats[label]
+            stat["count"] += 1
+            stat["total"] += duration
+            stat["min"] = min(stat["min"], duration) if "min" in stat else duration
+            stat["max"] = max(stat["max"], duration) if "max" in stat else duration
+            stat["hist"].add(duration)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def summary(self):
+        """
+        {label : {count, total, avg, min, max, p50, p99, p999}}, in seconds.
+        """
+
+        out = {}
+
+        with self._lock:
+            for label, stat in sorted(self._stats.items()):
+                count = stat["count"]
+                hist = stat["hist"]
+                out[label] = {"count" : count,
+                              "total" : stat["total"],
+                              "avg" : stat["total"] / count if count > 0 else 0,
+                              "min" : stat.get("min"),
+                              "max" : stat.get("max"),
+                              "p50" : hist.quantile(0.5),
+                              "p99" : hist.quantile(0.99),
+                              "p999" : hist.quantile(0.999)}
+
+        return out
+
     def report(self):
         print("\n--- Profiler Report ---")
         if len(self._stats) == 0:
@@ -43,11 +127,8 @@ class Profiler:
             return
         max_label = max(len(label) for label in self._stats.keys())
 
-        print(f"{'Label':<{max_label}} {'Count':<8} {'Total(s)':<12} {'Avg(s)':<20} {'Min(s)':<20} {'Max(s)':<20}")
+        print(f"{'Label':<{max_label}} {'Count':<8} {'Total(s)':<12} {'Avg(s)':<20} {'Min(s)':<20} {'Max(s)':<20} {'p50(s)':<14} {'p99(s)':<14} {'p999(s)':<14}")
+        print("-" * 56)
+        for label, stat in self.summary().items():
+            print(f"{label:<{max_label}} {stat['count']:<8} {stat['total']:<12.6f} {stat['avg']:<20.12f} {stat['min']:<20.12f} {stat['max']:<20.12f} {stat['p50']:<14.9f} {stat['p99']:<14.9f} {stat['p999']:<14.9f}")
         print("-" * 56)
-        for label, stat in sorted(self._stats.items()):
-            count = stat["count"]
-            total = stat["total"]
-            avg = total / count if count > 0 else 0
-            print(f"{label:<{max_label}} {count:<8} {total:<12.6f} {avg:<20.12f} {stat['min']:<20.12f} {stat['max']:<20.12f}")
-        print("-" * 56)
\ No newline at end of file
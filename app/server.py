@@ -7,7 +7,7 @@ load_dotenv()
 from importlib.metadata import version as importlib_version
 this_env = Environment()
 
-import time, os
+import time, os, gc
 import asyncio
 from collections import defaultdict
 from pathlib import Path
@@ -24,24 +24,28 @@ from pympler import asizeof
 from sanic_ext import openapi
 from sanic.worker.manager import WorkerManager
 from sanic import Sanic
-from sanic.response import html, json
+from sanic.response import html, json, text
 from sanic.blueprints import Blueprint
 from sanic.log import logger as logr
 
-from .middleware import start_timer, add_server_timing_header, measure
+from .middleware import start_timer, add_server_timing_header, measure, etag
 from .profiling import Profiler
+from .snapshots import read_snapshot, fork_snapshot
+from .dedupe import SeenEvents
+from .eventlog import SharedEventLog
+from .metrics import REGISTRY, EVENTS, DISPATCH_SECONDS, REALTIME_HEARD, REALTIME_DUPLICATES, REALTIME_TOO_OLD, FEED_BLOCK, CHAIN_HEAD_BLOCK, BLOCK_LAG, BLOCK_TIMESTAMP_LAG_SECONDS, INGEST_RESTARTS, EVENT_LOG_DROPPED
 
 from .clients_csv import CSVClient
 from .clients_httpjson import JsonRpcHistHttpClient, JsonRpcRtHttpClient
 from .clients_wsjson import JsonRpcRtWsClient
 
-from .data_products import Balances, NonIVotesVP, ProposalTypes, Delegations, Proposals, Votes
+from .data_products import Balances, NonIVotesVP, ProposalTypes, Delegations, Proposals, Votes, DelegateLeaderboard, ProposalSummaries, LEADERBOARD_SORT_KEYS
 from .data_models import ParticipationRateModel
 
 from .signatures import *
 from . import __version__
 from .logsetup import get_logger 
-from .dev_modes import CAPTURE_CLIENT_OUTPUTS_TO_DISK, CAPTURE_WS_CLIENT_OUTPUTS, PROFILE_ARCHIVE_CLIENT, ENABLE_BALANCES, ENABLE_DELEGATION
+from .dev_modes import CAPTURE_CLIENT_OUTPUTS_TO_DISK, CAPTURE_WS_CLIENT_OUTPUTS, PROFILE_ARCHIVE_CLIENT, PROFILE_DISPATCH, ENABLE_BALANCES, ENABLE_DELEGATION
 
 if  CAPTURE_WS_CLIENT_OUTPUTS:
     from copy import deepcopy
@@ -77,6 +81,8 @@ GIT_COMMIT_SHA = os.getenv('GIT_COMMIT_SHA', 'n/a')
 glogr.info(f"GIT_COMMIT_SHA={GIT_COMMIT_SHA}")
 
 DAO_NODE_DATA_PATH = Path(os.getenv('DAO_NODE_DATA_PATH', './data'))
+DAO_NODE_CSV_WORKERS = int(os.getenv('DAO_NODE_CSV_WORKERS', 0))
+DAO_NODE_DEDUPE_DEPTH = int(os.getenv('DAO_NODE_DEDUPE_DEPTH', 10_000))
 
 def secret_text(t, n):
     if len(t) > ((2 * n) + 3):
@@ -219,13 +225,18 @@ class Feed:
 
         self.event_history = [] # this one is for diagnostics, can be disabled after we're stable.
 
-        self.event_history_dict = defaultdict(list) # this one is for deduplicating events we've heard.  #TODO - prune this if we're stable fore more than a day.
-        self.event_history_tracking_lock = asyncio.Lock()
+        self.seen = SeenEvents(DAO_NODE_DEDUPE_DEPTH) # this one is for deduplicating events we've heard, over the last N blocks.
     
         self.archive_signal_counts = defaultdict(int)
         self.realtime_signal_counts = defaultdict(int)
         self.total_signal_counts = defaultdict(int)
 
+        self.archive_block = None # the block the archive replay finished at.
+        self.archive_read = asyncio.Event() # set once it has, see subscribe_feeds.
+
+        self.restored = False # True if booted from a snapshot.
+        self.restored_seen = set() # (block_number, transaction_index, log_index) already in the snapshot.
+
     def set_client_sequencer(self, client_sequencer):
         self.cs = client_sequencer
 
@@ -241,13 +252,49 @@ class Feed:
     def set_abis(self, abis):
         self.cs.set_abis(abis)
 
-    def read_archive(self):
+    def restore(self, block, seen):
+        """
+        Resume from a snapshot taken at `block`.  Only resumable archive
+        clients are read, from `block` onwards, skipping the events in
+        `seen` which the snapshot already reflects.
+        """
+
+        self.block = block
+        self.restored = True
+
+        for block_num, pair in seen:
+            self.restored_seen.add((block_num, *pair))
+            self.seen.add(block_num, pair)
+
+    def seen_since(self, block):
+        return self.seen.since(block)
+
+    def resumable(self):
+        """
+        True if an archive client can read on from a snapshot's block.
+        Without one, nothing would replay the events between the snapshot
+        and the start of realtime, so a snapshot is of no use.
+        """
+        return any(client.timeliness == 'archive' and getattr(client, 'resumable', False) for _, client in self.cs)
+
+    async def read_archive(self):
+        """
+        Yields a reader of (event, signal, new_signal), for each archive
+        client, in order.  A client that fetches over async RPC is awaited,
+        and its fallback block found off the loop, so catching up doesn't
+        block the event loop while the node waits on the provider.
+        """
 
         for i, client in self.cs:
 
             if client.timeliness == 'archive':
 
-                self.block = max(self.block, client.get_fallback_block())
+                if self.restored:
+                    if not getattr(client, 'resumable', False):
+                        logr.info(f"Skipping client #{i} of type {type(client).__name__}, restored from a snapshot.")
+                        continue
+                else:
+                    self.block = max(self.block, await asyncio.to_thread(client.get_fallback_block))
 
                 start = time.perf_counter()
 
@@ -255,40 +302,55 @@ class Feed:
 
                 logr.info(f"{emoji} Reading from client #{i} of type {type(client).__name__} from block {self.block}")
 
-                reader = client.read(after=self.block)
+                if hasattr(client, 'fetch'):
+                    reader = client.events(*await client.fetch(after=self.block))
+                else:
+                    reader = client.read(after=self.block)
 
-                cnt = 0
- 
-                for event, signal, new_signal in reader:
-                    cnt += 1
+                yield self.replay(client, reader, start, emoji)
+            
+            self.block = self.block + 1
 
-                    # TODO - make the archive produce a block-history, per tenant, not per chain
-                    # as is, the event-feed won't line up.
-                    if 'blocks' not in signal:
-                        self.block = max(self.block, int(event['block_number']))
+        self.archive_block = self.block
 
-                    self.archive_signal_counts[signal] += 1
-                    self.total_signal_counts[signal] += 1
+    def replay(self, client, reader, start, emoji):
 
-                    if CAPTURE_CLIENT_OUTPUTS_TO_DISK:
-                        self.capture_client_output_to_disk(event, client_type=type(client))                        
+        cnt = 0
 
-                    if PROFILE_ARCHIVE_CLIENT:
-                        with self.profiler(signal):
-                            yield event, signal, new_signal
-                    else:
-                        yield event, signal, new_signal
+        for event, signal, new_signal in reader:
 
-                end = time.perf_counter()
+            if self.restored_seen:
+                key = int(event['block_number']), event.get('transaction_index', -1), event.get('log_index', -1)
+                if key in self.restored_seen:
+                    continue
 
-                dur = end - start
+            cnt += 1
 
-                if PROFILE_ARCHIVE_CLIENT:
-                    self.profiler.report()
+            # TODO - make the archive produce a block-history, per tenant, not per chain
+            # as is, the event-feed won't line up.
+            if 'blocks' not in signal:
+                self.block = max(self.block, int(event['block_number']))
 
-                logr.info(f"{emoji} Done reading {cnt} block-headers and event-logs as of block {self.block}.  Took {dur:.2f} seconds.")
-            
-            self.block = self.block + 1
+            self.archive_signal_counts[signal] += 1
+            self.total_signal_counts[signal] += 1
+
+            if CAPTURE_CLIENT_OUTPUTS_TO_DISK:
+                self.capture_client_output_to_disk(event, client_type=type(client))                        
+
+            if PROFILE_ARCHIVE_CLIENT:
+                with self.profiler(signal):
+                    yield event, signal, new_signal
+            else:
+                yield event, signal, new_signal
+
+        end = time.perf_counter()
+
+        dur = end - start
+
+        if PROFILE_ARCHIVE_CLIENT:
+            self.profiler.report()
+
+        logr.info(f"{emoji} Done reading {cnt} block-headers and event-logs as of block {self.block}.  Took {dur:.2f} seconds.")
 
     def capture_ws_client_output(self, event):
         self.event_history.append(event)
@@ -334,6 +396,8 @@ class Feed:
 
                 async for event in client.read():
 
+                    REALTIME_HEARD.inc(rt_client_num)
+
                     block_num = int(event['block_number'])
                     self.block = max(self.block, block_num)
 
@@ -347,10 +411,17 @@ class Feed:
                     except:
                         pair = -1, -1 # block
 
-                    async with self.event_history_tracking_lock:
-                        if pair in self.event_history_dict[block_num]:
-                            continue                    
-                        self.event_history_dict[block_num].append(pair)
+                    # No await between the check and the add, so no lock is needed.
+                    heard = self.seen.add(block_num, pair)
+
+                    if heard is False:
+                        REALTIME_DUPLICATES.inc(rt_client_num)
+                        continue
+
+                    # Too old to tell, eg. backfilled after a reconnect, so it's let through.
+                    if heard is None:
+                        REALTIME_TOO_OLD.inc(rt_client_num)
+                        logr.warning(f"E425261017 - Event at block {block_num} {pair} is below the {self.seen.depth} block dedupe window, head {self.seen.head}, dispatching it anyway.")
 
                     self.realtime_signal_counts[event['signal']] += 1
                     self.total_signal_counts[event['signal']] += 1
@@ -371,6 +442,9 @@ class Feed:
 
 
 
+def event_position(event):
+    return int(event.get('block_number', -1)), event.get('transaction_index', -1), event.get('log_index', -1)
+
 class DataProductContext:
     def __init__(self):
 
@@ -378,6 +452,21 @@ class DataProductContext:
         self.dps_names = defaultdict(list)
         self.feed = Feed()
 
+        self.data_products = {}
+        self.models = {}
+
+        # Set once the archive was replayed in the main process, see DAO_NODE_BOOT_ONCE.
+        self.booted_once = False
+
+        # With DAO_NODE_SHARED_INGEST, the ingest process publishes realtime
+        # events to this log, and the workers follow it.
+        self.event_log = None
+        self.publish = False
+
+        # Per signal & data product, the time spent in each dispatch, with percentiles.
+        self.profiler = Profiler()
+        self.profiling = PROFILE_DISPATCH
+
     def register_onchain(self, chain_id_contract_signature, data_product):
 
         if 'blocks' in chain_id_contract_signature:
@@ -387,22 +476,80 @@ class DataProductContext:
             self.feed.plan_event(chain_id=int(chain_id), address=address, signature=signature)
 
         self.dps[chain_id_contract_signature].append(data_product)
+        self.data_products[data_product.name] = data_product
         setattr(self, data_product.name, data_product)
     
     def register_offchain(self, channel, data_product):
 
         self.dps[channel].append(data_product)
+        self.data_products[data_product.name] = data_product
         setattr(self, data_product.name, data_product)
     
     def register_model(self, model):
+        self.models[model.name] = model
         setattr(self, model.name, model)
 
+    def register_derived(self, data_product, *sources):
+        """
+        Register a data product built from other data products, on every
+        signal those sources listen to.  It is dispatched after them.
+        """
+
+        for dps in self.dps.values():
+            if any(source in dps for source in sources):
+                dps.append(data_product)
+
+        self.data_products[data_product.name] = data_product
+        setattr(self, data_product.name, data_product)
+
+    def restore(self, payload):
+        """
+        Swap the freshly registered data products and models for the ones
+        in a snapshot payload, keeping the signal wiring from registration.
+        """
+
+        for name, data_product in payload['data_products'].items():
+            stale = self.data_products[name]
+            for dps in self.dps.values():
+                for i, dp in enumerate(dps):
+                    if dp is stale:
+                        dps[i] = data_product
+            self.data_products[name] = data_product
+            setattr(self, name, data_product)
+
+        for name, model in payload['models'].items():
+            self.models[name] = model
+            setattr(self, name, model)
+
+        for attr in ('archive_signal_counts', 'realtime_signal_counts', 'total_signal_counts'):
+            getattr(self.feed, attr).update(payload[attr])
+
     def set_signal_context(self, chain_id_contract_signature):
+        self.signal = chain_id_contract_signature
         self.signal_context = self.dps[chain_id_contract_signature]
 
+    def observe_dispatch(self, source, signal, data_product, duration):
+        name = type(data_product).__name__
+        DISPATCH_SECONDS.observe(name, source, value=duration)
+        if self.profiling:
+            self.profiler.record(f"{source} {signal} {name}", duration)
+
     def dispatch_from_archive(self, event):
+        EVENTS.inc(self.signal, 'archive')
         for data_product in self.signal_context:
+            start = time.perf_counter()
             data_product.handle(event)
+            self.observe_dispatch('archive', self.signal, data_product, time.perf_counter() - start)
+            data_product.position = event_position(event)
+
+    def dispatch_batch_from_archive(self, events):
+        EVENTS.inc(self.signal, 'archive', amount=len(events))
+        position = event_position(events[-1])
+        for data_product in self.signal_context:
+            start = time.perf_counter()
+            data_product.handle_batch(events)
+            self.observe_dispatch('archive-batch', self.signal, data_product, time.perf_counter() - start)
+            data_product.position = position
 
 
     async def dispatch_from_realtime(self, event):
@@ -411,8 +558,19 @@ class DataProductContext:
         del event['signal']
         dps = self.dps[chain_id_contract_signature]
 
+        # Published before handling, since handlers may hold on to, and amend, the event.
+        if self.publish:
+            self.event_log.append((chain_id_contract_signature, event))
+
+        EVENTS.inc(chain_id_contract_signature, 'realtime')
+
+        position = event_position(event)
+
         for data_product in dps:
+            start = time.perf_counter()
             data_product.handle(event)  
+            self.observe_dispatch('realtime', chain_id_contract_signature, data_product, time.perf_counter() - start)
+            data_product.position = position
     
 app = Sanic('DaoNode', ctx=DataProductContext())
 app.middleware('request')(start_timer)
@@ -508,6 +666,7 @@ if INCLUDE_BALANCES:
     description="Key to sort the list of proposals by.  Recommended values: id, block_number, proposer, start_block, end_block"
 )
 @measure
+@etag('proposals', 'votes')
 async def proposals(request):
     return await proposals_handler(app, request)
 
@@ -515,6 +674,10 @@ async def proposals_handler(app, request):
     proposal_set = request.args.get("set", "all").lower()
     sort_key = request.args.get("sort", "").lower()
 
+    summaries = getattr(app.ctx, 'proposal_summaries', None)
+
+    if isinstance(summaries, ProposalSummaries):
+        return json({'proposals' : summaries.listing(proposal_set, sort_key)})
 
     if proposal_set == 'relevant':
         res = app.ctx.proposals.relevant()
@@ -556,6 +719,7 @@ None
 
 """)
 @measure
+@etag('proposals', 'votes')
 async def proposal(request, proposal_id:str):
     return await proposal_handler(app, request, proposal_id)
 
@@ -625,6 +789,7 @@ VOTE_RECORD_DEFAULT_OFFSET = 0
     description="Ignore pagination parameters and return the full vote record."
 )
 @measure
+@etag('votes', 'proposals', 'proposal_types')
 async def vote_record(request, proposal_id):
 
     return await vote_record_handler(app, request, proposal_id)
@@ -635,33 +800,19 @@ async def vote_record_handler(app, request, proposal_id):
     reverse = request.args.get("reverse", "false").lower() == "true"
     full = request.args.get("full", "false").lower() == "true"
 
-    if sort_by == 'BN':
-        if reverse:
-            vr = deepcopy(app.ctx.votes.proposal_vote_record[proposal_id])
-            vr.sort(key=lambda x: int(x['bn']), reverse=True)
-        else:
-            # Since the events are ordered, we don't need to take a 
-            # deep copy nor sort.  This reduces the API call from 35 ms to 1 ms 
-            # when loading a chart in chronological order.
-            vr = app.ctx.votes.proposal_vote_record[proposal_id]
-    elif sort_by == 'VP':
-        vr = deepcopy(app.ctx.votes.proposal_vote_record[proposal_id])
-        key = 'weight' if 'weight' in vr[0] else 'votes'    
-        vr.sort(key=lambda x: x[key], reverse=reverse)
-    else:
-        raise Exception(f"Invalid sort_by: {sort_by}")
-
     offset = int(request.args.get("offset", VOTE_RECORD_DEFAULT_OFFSET))
     page_size = int(request.args.get("page_size", VOTE_RECORD_DEFAULT_PAGE_SIZE))
 
+    # The record is kept in block order, and in VP order, so any page is a
+    # slice, and only the page is turned into dicts.
     if full:
-        has_more = False
+        vr, has_more = app.ctx.votes.vote_record_page(proposal_id, sort_by, reverse)
     else:
-        vr = vr[offset:]
-        has_more = len(vr) > page_size
-        vr = vr[:page_size]
+        vr, has_more = app.ctx.votes.vote_record_page(proposal_id, sort_by, reverse, offset, page_size)
 
-    proposal_type = app.ctx.proposals.proposals[proposal_id].get_proposal_type(app.ctx.proposal_types.proposal_types)
+    vr = [record.to_dict(include_proposal_id=False) for record in vr]
+
+    proposal_type = app.ctx.proposals.proposals[proposal_id].get_proposal_type(app.ctx.proposal_types)
     return json({'vote_record' : vr,
                  'has_more' : has_more,
                  'proposal_type' : proposal_type})
@@ -690,8 +841,7 @@ async def vote_handler(app, request):
     proposal_id = request.args.get("proposal_id")
     voter = request.args.get("voter")
 
-    votes = app.ctx.votes.voter_history[voter]
-    vote = [v for v in votes if v['proposal_id'] == proposal_id]
+    vote = [v.to_dict() for v in app.ctx.votes.get_votes(voter, proposal_id)]
     return json({'vote' : vote})
 
 @app.route('/v1/voter_history/<voter>')
@@ -712,11 +862,11 @@ async def voter_history_handler(app, request, voter):
     # a problem, we we can always move it to the client later.
     # I don't think it will be, because a delegate's page
     # doesn't get bombarded with requests.
-    vh = deepcopy(app.ctx.votes.voter_history[voter])
+    vh = [v.to_dict() for v in app.ctx.votes.voter_history.get(voter, [])]
 
     out = []
     for v in vh:
-        v['proposal_type'] = app.ctx.proposals.proposals[v['proposal_id']].get_proposal_type(app.ctx.proposal_types.proposal_types)
+        v['proposal_type'] = app.ctx.proposals.proposals[v['proposal_id']].get_proposal_type(app.ctx.proposal_types)
         out.append(v)
     
     return json({'voter_history' : out})
@@ -747,27 +897,21 @@ DEFAULT_OFFSET = 0
 Get full list of delegates sorted by number of delegators.
 
 ## Methodology
-We're storing the full dataset, looking up each delegate's count and vp, to compile objects at time of request, then sorting them at time of request.
+A `DelegateLeaderboard` keeps one sorted index per sort key, updated from the same events as the delegation, vote and non-IVotes data products.  A page is a slice of the index.  Filtering by `delegator` falls back to looking up and sorting the (few) matching delegates at time of request.
 
 ## Performance
 
-The performance of this endpoint is a function of the sort, enriching options, and some base costs.  
-
-The sort is done on the full list of all known delegates, at endpoint invocation time.
+The performance of this endpoint is a function of the page-size and enriching options.  
 
-Enriching happens after the sort and crop to the page-size, so only the response is enriched.
+Enriching happens after the slice to the page-size, so only the response is enriched.
 
-### 🟡 Base Costs
+### 🟢 Base Costs
 
-Regardless of options, there are two base steps in all responses:
-
-- 🔴 O(n) for purging delegates with 0 Voting Power (VP) or Delegator Count (DC).  🚧 This should move to the indexing in the long-run.
+- 🟢 O(d * log(n)) to catch the indexes up with the d delegates touched by events since the last request.
+- 🟢 O(log(n) + page_size) for the slice.
 - 🟢 O(page_size) loop added to serialize the response.
 
-### 🟡 Sorting only (by VP, Delegator-Count, or Last-Vote-Block)
-O(n * log(n)) is the average for python's built in `sort` method.
-
-This could be improved by moving the sort upstream to the indexing stage, perhaps on completion of the boot. Framework enhancements are needed to achieve this.
+Once an hour, when the 7-day look-back block rolls over, the 7-day-voting-power-change index is rebuilt in O(n * log(n)).  Likewise the participation rate index, when the participation rates are refreshed.
 
 ### Enriching 
 #### 🟢 With Voting Power and/or Delegator-Count 
@@ -780,13 +924,8 @@ Opr = O(page_size * min(# of proposals, 10) * min(# of votes, 10))
 
 the upper bound is O(page_size * 10 * 10)
 
-#### Total for a fully enriched response
-
-Total = O(n) + O(page_size) + O(n * log(n)) + O(page_size) + Opr = O(n) + O(n * log(n)) + O(102 * page_size)
-
 ## Enhancements
 
-- Maintain the sorted view of the list in indexing
 - Calculate Participation rate on proposal complete
 
 ## Test Coverage
@@ -842,6 +981,7 @@ Total = O(n) + O(page_size) + O(n * log(n)) + O(page_size) + Opr = O(n) + O(n *
     description="Filter the list to show only the delegate to whom the specified delegator address has delegated their votes. If provided, the list will typically contain zero or one delegate or more if partial delegation is used."
 )
 @measure
+@etag('delegations', 'votes', 'proposals', 'non_ivotes_vp')
 async def delegates(request):
     return await delegates_handler(app, request)
 
@@ -927,8 +1067,17 @@ async def delegates_handler(app, request):
     else:
         sorter_func = _get_delegate_sort_value
 
+    delegate_leaderboard = getattr(app.ctx, 'delegate_leaderboard', None)
+    indexed = not delegator_address_filter and isinstance(delegate_leaderboard, DelegateLeaderboard)
+
     out = []
-    if delegator_address_filter:
+    if indexed:
+        if sort_by not in LEADERBOARD_SORT_KEYS:
+            raise Exception(f"Sort by '{sort_by}' not implemented.")
+
+        out = delegate_leaderboard.page(sort_by, offset, page_size, reverse)
+
+    elif delegator_address_filter:
         delegator_address_filter_lower = delegator_address_filter.lower()
         target_delegatee_addresses = app.ctx.delegations.delegator_delegate[delegator_address_filter_lower]
 
@@ -1041,14 +1190,15 @@ async def delegates_handler(app, request):
         else:
             raise Exception(f"Sort by '{sort_by}' not implemented.")
 
-    out.sort(key=lambda x: x[1], reverse=reverse)    
+    if not indexed:
+        out.sort(key=lambda x: x[1], reverse=reverse)    
 
-    if offset:
-        out = out[offset:]
+        if offset:
+            out = out[offset:]
 
-    if page_size:
-        if len(out) > page_size:
-            out = out[:page_size]
+        if page_size:
+            if len(out) > page_size:
+                out = out[:page_size]
 
     # Cast big numbers to str, only after sorting and cropping...
     if sort_by_vp or sort_by_vpc:
@@ -1142,7 +1292,7 @@ async def delegate_handler(app, request, addr):
         'from_cnt' : app.ctx.delegations.delegatee_cnt[addr],
         'from_list' : from_list_with_info,
         'voting_power' : str(total_vp),
-        'history' : app.ctx.delegations.delegatee_vp_history[addr],
+        'history' : app.ctx.delegations.delegatee_vp_history[addr].items(),
         'participation' : participation
     }
 
@@ -1165,7 +1315,7 @@ async def delegate(request, addr):
 @openapi.summary("Information about a specific delegate's voting history")
 @measure
 async def delegate_voting_history(request, addr):
-    voting_history = app.ctx.votes.voter_history[addr]
+    voting_history = [v.to_dict() for v in app.ctx.votes.voter_history.get(addr, [])]
 
     return json({'voting_history' : voting_history})
 
@@ -1203,6 +1353,110 @@ async def delegate_vp_handler(app, request, addr, block_number):
                  'block_number' : block_number,
                  'history' : history})
 
+@app.route('/v1/delegates_vp/<block_number>')
+@openapi.tag("Delegation State")
+@openapi.summary("Voting power at a block for many delegates.")
+@openapi.parameter("addresses", str, "query", description="Comma separated delegate addresses.")
+@openapi.description("""
+## Description
+Get the voting power of a list of delegates, as of a specific block height, in one request.  Delegates without history have 0 voting power.
+
+## Methodology
+Same as `delegate_vp`, per address: each delegate's history is stored as a block number array alongside its VPs, and bisected in place.
+
+## Performance
+- 🟢 
+- k x (Lookup delegate + Bisect Search) = k x (O(1) + O(log n))
+- E(t) <= 1 ms for a few hundred addresses.
+
+""")
+@measure
+async def delegates_vp(request, block_number : str):
+    return await delegates_vp_handler(app, request, block_number)
+
+async def delegates_vp_handler(app, request, block_number):
+
+    addresses = request.args.get("addresses", "")
+    addresses = [addr.strip().lower() for addr in addresses.split(",") if addr.strip()]
+
+    if not addresses:
+        return json({'error' : 'addresses is required'}, status=400)
+
+    block_number = int(block_number)
+
+    voting_power = app.ctx.delegations.delegatees_vp_at_block(addresses, block_number)
+
+    return json({'voting_power' : voting_power,
+                 'block_number' : block_number})
+
+@app.route('/v1/block_at_timestamp/<timestamp>')
+@openapi.tag("Block State")
+@openapi.summary("The last block at or before a timestamp.")
+@openapi.description("""
+## Description
+Convert a unix timestamp to the last block heard at or before it, with that block's timestamp.  404 if no block that old was heard.
+
+## Methodology
+Blocks are indexed as two typed arrays, block numbers and timestamps, appended in order.  We bisect the timestamps.
+
+Blocks are only as fine as the blocks feed, which may sample every Nth block.
+
+## Performance
+- 🟢 
+- Bisect Search = O(log n)
+- E(t) <= 100 μs
+
+""")
+@measure
+async def block_at_timestamp(request, timestamp : str):
+    return await block_at_timestamp_handler(app, request, timestamp)
+
+async def block_at_timestamp_handler(app, request, timestamp):
+
+    block = app.ctx.delegations.block_timestamps.block_at_timestamp(int(timestamp))
+
+    if block is None:
+        return json({'error' : f'No block heard at or before timestamp {timestamp}'}, status=404)
+
+    block_number, block_timestamp = block
+
+    return json({'block_number' : block_number,
+                 'timestamp' : block_timestamp})
+
+@app.route('/v1/timestamp_at_block/<block_number>')
+@openapi.tag("Block State")
+@openapi.summary("The timestamp of a block.")
+@openapi.description("""
+## Description
+Convert a block number to the timestamp of the last block heard at or before it.  404 if no block that old was heard.
+
+## Methodology
+Same index as `block_at_timestamp`.  We bisect the block numbers.
+
+Blocks are only as fine as the blocks feed, which may sample every Nth block, so the returned `block_number` may be earlier than the one asked for.
+
+## Performance
+- 🟢 
+- Bisect Search = O(log n)
+- E(t) <= 100 μs
+
+""")
+@measure
+async def timestamp_at_block(request, block_number : str):
+    return await timestamp_at_block_handler(app, request, block_number)
+
+async def timestamp_at_block_handler(app, request, block_number):
+
+    block = app.ctx.delegations.block_timestamps.timestamp_at_block(int(block_number))
+
+    if block is None:
+        return json({'error' : f'No block heard at or before block {block_number}'}, status=404)
+
+    block_number, block_timestamp = block
+
+    return json({'block_number' : block_number,
+                 'timestamp' : block_timestamp})
+
 
 #################################################################################################################################################
 
@@ -1249,6 +1503,59 @@ async def ram(request, worker_id):
                  'app.ctx.votes' : sizeof(app.ctx.votes)
                 })
 
+@app.route('/v1/profiler/<worker_id>')
+@openapi.tag("Diagnostics")
+@openapi.summary("Time spent dispatching events, per signal & data product, for one worker.")
+@openapi.description("""
+## Description
+Count, total, min, max, p50, p99 and p999 seconds, of every dispatch to a data product, keyed by source (`realtime`, `archive`, or `archive-batch` for one batch), signal, and data product.
+
+Only recorded while profiling is on, see `/v1/profiler/<worker_id>/<state>`, or `PROFILE_DISPATCH` at boot.
+
+## Methodology
+Each label keeps a fixed-memory, log-bucketed histogram, 8 buckets per power of two of nanoseconds.  Percentiles are bucket upper bounds, within 12.5%.
+
+""")
+@measure
+async def profiler(request, worker_id):
+    return await profiler_handler(app, request, worker_id)
+
+async def profiler_handler(app, request, worker_id):
+
+    if worker_id != WORKER_ID:
+        return json({'error' : 'worker_id required'})
+
+    return json({'profiling' : app.ctx.profiling,
+                 'stats' : app.ctx.profiler.summary()})
+
+@app.route('/v1/profiler/<worker_id>/<state>')
+@openapi.tag("Diagnostics")
+@openapi.summary("Turn dispatch profiling on or off, or reset it, for one worker.")
+@openapi.description("""
+## Description
+`state` is `on`, `off` or `reset`.  Takes effect immediately, without a redeploy.
+
+""")
+@measure
+async def profiler_state(request, worker_id, state):
+    return await profiler_state_handler(app, request, worker_id, state)
+
+async def profiler_state_handler(app, request, worker_id, state):
+
+    if worker_id != WORKER_ID:
+        return json({'error' : 'worker_id required'})
+
+    if state == 'on':
+        app.ctx.profiling = True
+    elif state == 'off':
+        app.ctx.profiling = False
+    elif state == 'reset':
+        app.ctx.profiler.reset()
+    else:
+        return json({'error' : f"state must be one of on, off or reset, not '{state}'"}, status=400)
+
+    return json({'profiling' : app.ctx.profiling})
+
 
 def check_addresses(addr_iter, expecting='lower'):
 
@@ -1301,7 +1608,7 @@ async def integrity(request):
     out['votes.proposal_aggregations'] = check(app.ctx.votes.proposal_aggregations)
 
     check = check_addresses
-    out['votes.participated'] = check(app.ctx.votes.participated)
+    out['votes.vote_index'] = check(voter for voter, _ in app.ctx.votes.vote_index)
     out['votes.voter_history'] = check(app.ctx.votes.voter_history)
     out['votes.latest_vote_block'] = check(app.ctx.votes.latest_vote_block)
 
@@ -1335,6 +1642,47 @@ async def diagnostics(request, safe_mode: bool):
                  'git_commit_sha' : GIT_COMMIT_SHA,
                  })
 
+@app.route('/metrics')
+@openapi.tag("Diagnostics")
+@openapi.summary("Metrics, in the Prometheus text format, for this worker.")
+@openapi.description("""
+## Description
+Route latency histograms, events dispatched by signal, time spent in each data product, realtime de-duplication, and how far the feed lags the chain, in blocks and in seconds.
+
+Each worker keeps its own metrics, so scrape every worker, or aggregate across them.
+
+## Performance
+- 🟢 
+- O(number of series)
+
+""")
+async def metrics(request):
+    return await metrics_handler(app, request)
+
+async def metrics_handler(app, request):
+
+    feed = app.ctx.feed
+    FEED_BLOCK.set(value=feed.block)
+
+    heads = [block for client in getattr(getattr(feed, 'cs', None), 'clients', [])
+                   for block in getattr(client, 'last_polled_block', {}).values()]
+
+    if heads:
+        head = max(heads)
+        CHAIN_HEAD_BLOCK.set(value=head)
+        BLOCK_LAG.set(value=max(head - feed.block, 0))
+
+    delegations = getattr(app.ctx, 'delegations', None)
+    if isinstance(delegations, Delegations) and delegations.current_ts:
+        BLOCK_TIMESTAMP_LAG_SECONDS.set(value=time.time() - delegations.current_ts)
+
+    if app.ctx.event_log is not None:
+        dropped, restarts = app.ctx.event_log.stats()
+        EVENT_LOG_DROPPED.set(value=dropped)
+        INGEST_RESTARTS.set(value=restarts)
+
+    return text(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/v1/progress')
 @openapi.tag("Diagnostics")
 @openapi.summary("Current Block Header + Num of Events Processed")
@@ -1483,13 +1831,9 @@ if INCLUDE_NON_IVOTES_VP:
     async def non_ivotes_all_at_block(request, block_number):
         non_ivotes = app.ctx.non_ivotes_vp
 
-        snapshot_bn = non_ivotes.block_number_to_snapshot_block_number(int(block_number))
+        snapshot_bn, all_nonivotes_vp = non_ivotes.get_all_vp_at_block(int(block_number))
 
-        if snapshot_bn == 0:
-            formatted = {}
-        else:
-            all_nonivotes_vp = non_ivotes.history[non_ivotes.history_bn_to_pos[snapshot_bn]]
-            formatted = {user: str(amount) for user, amount in all_nonivotes_vp.items()}
+        formatted = {user: str(amount) for user, amount in all_nonivotes_vp.items()}
 
         return json({
             'block_number': snapshot_bn,
@@ -1519,15 +1863,118 @@ NUM_ARCHIVE_CLIENTS = int(os.getenv('NUM_ARCHIVE_CLIENTS', 2))
 NUM_REALTIME_CLIENTS = int(os.getenv('NUM_REALTIME_CLIENTS', 2))
 NUM_POLLING_CLIENTS = int(os.getenv('NUM_POLLING_CLIENTS', 1))
 
+ARCHIVE_BATCH_SIZE = 10_000
+
+DAO_NODE_SNAPSHOT_PATH = os.getenv('DAO_NODE_SNAPSHOT_PATH', None)
+DAO_NODE_SNAPSHOT_MAX_AGE = int(os.getenv('DAO_NODE_SNAPSHOT_MAX_AGE', 24 * 60 * 60))
+DAO_NODE_SNAPSHOT_INTERVAL = int(os.getenv('DAO_NODE_SNAPSHOT_INTERVAL', 60 * 60))
+DAO_NODE_SNAPSHOT_OVERLAP = int(os.getenv('DAO_NODE_SNAPSHOT_OVERLAP', 100))
+
+# Boot & replay the archive once, in the main process, then fork the workers
+# off it, instead of every worker booting its own copy of the data products.
+DAO_NODE_BOOT_ONCE = bool(int(os.getenv('DAO_NODE_BOOT_ONCE', 0)))
+
+# On top of booting once, hear realtime events once per host, in an ingest
+# process, that publishes them to the workers over shared memory.
+DAO_NODE_SHARED_INGEST = DAO_NODE_BOOT_ONCE and bool(int(os.getenv('DAO_NODE_SHARED_INGEST', 0)))
+DAO_NODE_EVENT_LOG_SIZE = int(os.getenv('DAO_NODE_EVENT_LOG_SIZE', 64 * 1024 * 1024))
+DAO_NODE_INGEST_RESTART_DELAY = int(os.getenv('DAO_NODE_INGEST_RESTART_DELAY', 5))
+
+if DAO_NODE_BOOT_ONCE:
+    Sanic.start_method = "fork"
+
+@app.main_process_start
+async def boot_once(app, loop):
+
+    if not DAO_NODE_BOOT_ONCE:
+        return
+
+    start = time.time()
+
+    dcqs = await setup_data_feeds(app)
+    await read_archive(app, dcqs)
+
+    # Everything allocated so far is long-lived, and shared with the workers
+    # copy-on-write.  Freezing it keeps the workers' garbage collector from
+    # writing to those pages, and so copying them.
+    gc.collect()
+    gc.freeze()
+
+    app.ctx.booted_once = True
+
+    logr.info(f"Booted once, in the main process, {gc.get_freeze_count()} objects frozen [{time.time() - start:.2f}s]")
+
+    if DAO_NODE_SHARED_INGEST:
+        app.ctx.event_log = SharedEventLog(DAO_NODE_EVENT_LOG_SIZE)
+
+@app.main_process_ready
+async def start_ingest(app, loop):
+
+    # Sanic's worker manager forks it, with the workers, once the main
+    # process's loop has stopped, so the ingest process starts with no loop.
+    if app.ctx.event_log is not None:
+        app.manager.manage('DaoNodeIngest', run_ingest, {})
+
+@app.main_process_stop
+async def release_event_log(app, loop):
+
+    if app.ctx.event_log is not None:
+        app.ctx.event_log.close()
+        app.ctx.event_log.unlink()
+
+def run_ingest():
+    """
+    The ingest process's entry point, see start_ingest.
+
+    If any of its tasks fail, the rest are cancelled, and they all start
+    over, with the clients and the dedupe as they were, so the workers
+    keep getting events.
+    """
+
+    logr.info(f"Ingest process {os.getpid()} started, publishing to a {DAO_NODE_EVENT_LOG_SIZE} byte event log")
+
+    while True:
+        try:
+            asyncio.run(ingest(app))
+            return
+        except Exception as e:
+            app.ctx.event_log.restarted()
+            logr.exception(f"E1937261017 - Ingest failed, restarting in {DAO_NODE_INGEST_RESTART_DELAY}s: {e}")
+            time.sleep(DAO_NODE_INGEST_RESTART_DELAY)
+
+async def ingest(app):
+    """
+    The ingest process, started off the main process after boot.  It owns
+    the realtime clients, the dedupe and the snapshots, keeps its own copy
+    of the data products current, and publishes every event it dispatches
+    to the workers.
+    """
+
+    app.ctx.publish = True
+
+    await asyncio.gather(index_proposals(app), *realtime_tasks(app))
+
 @app.before_server_start(priority=0)
 async def bootstrap_data_feeds(app, loop):
 
+    if app.ctx.booted_once:
+        # Forked workers would otherwise share the main process's id, see /v1/ram & /v1/profiler.
+        global WORKER_ID
+        WORKER_ID = str(randint(0, 100000000000000000))
+        return
+
+    dcqs = await setup_data_feeds(app)
+
+    app.add_task(read_archive(app, dcqs))
+
+async def setup_data_feeds(app):
+
     #################################################################################
     # ⚡️ 📀 Client Setup
 
     clients = []
 
-    csvc = CSVClient(DAO_NODE_DATA_PATH)
+    csvc = CSVClient(DAO_NODE_DATA_PATH, workers=DAO_NODE_CSV_WORKERS)
     if csvc.is_valid():
         clients.append(csvc)
 
@@ -1660,12 +2107,20 @@ async def bootstrap_data_feeds(app, loop):
         for VOTE_EVENT in VOTE_EVENTS:
             app.ctx.register_onchain(f'{chain_id}.{gov_addr}.' + VOTE_EVENT, votes)
         
+    app.ctx.register_derived(ProposalSummaries(proposals, votes), proposals, votes)
+
     pr = ParticipationRateModel()
     app.ctx.register_model(pr)
 
     if INCLUDE_NON_IVOTES_VP:
         non_ivotes_vp = NonIVotesVP()
         app.ctx.register_offchain('non_ivotes_vp', non_ivotes_vp)
+    else:
+        non_ivotes_vp = None
+
+    if ENABLE_DELEGATION and 'token' in deployment:
+        delegate_leaderboard = DelegateLeaderboard(delegations, votes, non_ivotes_vp=non_ivotes_vp, participation_rate_model=pr)
+        app.ctx.register_derived(delegate_leaderboard, *[dp for dp in (delegations, votes, non_ivotes_vp) if dp])
 
 
     # This is so certain endpoints can access empty data-products
@@ -1674,7 +2129,7 @@ async def bootstrap_data_feeds(app, loop):
         if not hasattr(app.ctx, data_product.name):
             setattr(app.ctx, data_product.name, data_product)
 
-    app.add_task(read_archive(app, dcqs))
+    return dcqs
 
 
 async def index_proposals(app):
@@ -1691,29 +2146,91 @@ async def read_archive(app, dcqs):
     
     app.ctx.feed.set_client_sequencer(dcqs)
 
-    for event, signal, new_signal in app.ctx.feed.read_archive():
+    if DAO_NODE_SNAPSHOT_PATH and not app.ctx.feed.resumable():
+        logr.info(f"No archive client can resume from a snapshot, doing a full replay.")
+    elif DAO_NODE_SNAPSHOT_PATH:
+        snapshot = read_snapshot(DAO_NODE_SNAPSHOT_PATH, app.ctx, max_age=DAO_NODE_SNAPSHOT_MAX_AGE)
+        if snapshot:
+            header, payload = snapshot
+            app.ctx.restore(payload)
+            app.ctx.feed.restore(header['block'], payload['seen'])
+
+    # Events are dispatched in runs of the same signal, so the data 
+    # products can amortize their work over a batch.
+    try:
+        async for reader in app.ctx.feed.read_archive():
+
+            batch = []
 
-        if new_signal:
-            app.ctx.set_signal_context(signal)
+            for event, signal, new_signal in reader:
 
-        app.ctx.dispatch_from_archive(event)
+                if new_signal or len(batch) >= ARCHIVE_BATCH_SIZE:
+                    if batch:
+                        app.ctx.dispatch_batch_from_archive(batch)
+                        batch = []
+
+                    if new_signal:
+                        app.ctx.set_signal_context(signal)
+
+                batch.append(event)
+
+            if batch:
+                app.ctx.dispatch_batch_from_archive(batch)
+    finally:
+        # Even on failure, as realtime always followed the archive, complete or not.
+        app.ctx.feed.archive_read.set()
 
 @app.after_server_start
 async def subscribe_feeds(app):
 
+    if app.ctx.event_log is not None:
+        logr.info(f"Following the ingest process's event log")
+        tasks = [read_event_log(app)]
+    else:
+        tasks = realtime_tasks(app)
+
+    tasks.append(index_proposals(app))
+
+    for task in tasks:
+        app.add_task(after_archive(app, task))
+
+async def after_archive(app, coro):
+    # The archive read awaits the provider, so these could otherwise run
+    # mid-catch-up, and dispatch realtime events ahead of older ones.
+    await app.ctx.feed.archive_read.wait()
+    await coro
+
+def realtime_tasks(app):
+
+    tasks = []
+
     for i in range(NUM_REALTIME_CLIENTS):
         logr.info(f"Realtime client {1 + NUM_ARCHIVE_CLIENTS + i} started")
-        app.add_task(read_realtime(app, 1 + NUM_ARCHIVE_CLIENTS + i))
-
-    app.add_task(index_proposals(app))
+        tasks.append(read_realtime(app, 1 + NUM_ARCHIVE_CLIENTS + i))
 
     for i in range(NUM_POLLING_CLIENTS):
         logr.info(f"Polling client {1 + NUM_ARCHIVE_CLIENTS + NUM_REALTIME_CLIENTS + i} started")
-        app.add_task(read_polling(app, 1 + NUM_ARCHIVE_CLIENTS + NUM_REALTIME_CLIENTS + i))
+        tasks.append(read_polling(app, 1 + NUM_ARCHIVE_CLIENTS + NUM_REALTIME_CLIENTS + i))
     
     if INCLUDE_NON_IVOTES_VP:
         logr.info(f"Non IVotes VP client started")
-        app.add_task(read_naive_socket(app, VPSnappercWsClient(DAO_NODE_VPSNAPPER_WS)))
+        tasks.append(read_naive_socket(app, VPSnappercWsClient(DAO_NODE_VPSNAPPER_WS)))
+
+    if DAO_NODE_SNAPSHOT_PATH:
+        logr.info(f"Snapshotting to {DAO_NODE_SNAPSHOT_PATH} every {DAO_NODE_SNAPSHOT_INTERVAL}s")
+        tasks.append(write_snapshots(app))
+
+    return tasks
+
+async def read_event_log(app):
+
+    feed = app.ctx.feed
+
+    async for signal, event in app.ctx.event_log.follow():
+        if 'block_number' in event:
+            feed.block = max(feed.block, int(event['block_number']))
+        event['signal'] = signal
+        await app.ctx.dispatch_from_realtime(event)
 
 async def read_realtime(app, rt_client_num):
     async for event in app.ctx.feed.realtime_async_read(rt_client_num):
@@ -1734,9 +2251,8 @@ async def read_polling(app, polling_client_num):
 
     If everything is working, none of the events caught in polling, would ever be needed. 
 
-    Note that the "wait_cycle" needs to match the look back in blocks configured in the JsonRpcRtHttpClient.read().
-
-    Note that this blocks for the duration of the wait_cycle, so it should be as short as possible, TODO - make it fully async.
+    Each cycle only asks for the blocks since the previous cycle, see JsonRpcRtHttpClient.read(), 
+    and the RPC calls are async, so polling doesn't stall the API.
     """
 
     wait_cycle = int(os.getenv('POLLING_WAIT_CYCLE', 120))
@@ -1750,6 +2266,33 @@ async def read_polling(app, polling_client_num):
         logr.info(f"Polling client {polling_client_num} [{time.perf_counter() - start_time:.2f}s] [{cnt} events]")
         await asyncio.sleep(wait_cycle)
 
+async def write_snapshots(app):
+    """
+    Periodically snapshot the data products, so the next boot can skip
+    the full archive replay.
+
+    A snapshot is only taken once realtime has moved past the archive by
+    more than the overlap, so that every event in the overlap window is
+    in the realtime dedupe history, and gets skipped on resume.
+
+    A forked child pickles the process as it was at the fork, so no event
+    can land mid-snapshot, and this worker keeps serving meanwhile.
+    """
+
+    while True:
+        await asyncio.sleep(DAO_NODE_SNAPSHOT_INTERVAL)
+
+        feed = app.ctx.feed
+
+        if feed.archive_block is None or feed.block - DAO_NODE_SNAPSHOT_OVERLAP <= feed.archive_block:
+            continue
+
+        try:
+            pid = fork_snapshot(DAO_NODE_SNAPSHOT_PATH, app.ctx, overlap=DAO_NODE_SNAPSHOT_OVERLAP, min_interval=DAO_NODE_SNAPSHOT_INTERVAL / 2)
+            await asyncio.to_thread(os.waitpid, pid, 0)
+        except Exception as e:
+            logr.error(f"E1856261017 - Could not write snapshot to {DAO_NODE_SNAPSHOT_PATH}: {e}")
+
 ##################################
 #
 # Tactical DevOps Testing Endpoint
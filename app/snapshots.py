@@ -0,0 +1,179 @@
+import os, json, time, pickle, hashlib, fcntl
+
+from pathlib import Path
+
+from . import __version__
+from .logsetup import get_logger
+
+######################################################################
+#
+# Boot snapshots.
+#
+# A snapshot is the full in-RAM state of every registered data product
+# and data model, plus the Feed's position, written to a single file:
+#
+#   DAONODE-SNAPSHOT\n
+#   <one line of JSON header>\n
+#   <pickle payload>
+#
+# The header is readable without unpickling anything, so a stale or
+# incompatible snapshot is rejected cheaply.  Bump
+# SNAPSHOT_FORMAT_VERSION whenever a data product's internal layout
+# changes, so old snapshots fall back to a full replay.
+#
+# Snapshots are trusted local files (pickle), never load one from an
+# untrusted source.
+#
+######################################################################
+
+SNAPSHOT_FORMAT_VERSION = 17
+MAGIC = b'DAONODE-SNAPSHOT\n'
+
+logr = get_logger('snapshots')
+
+
+def fingerprint(ctx):
+    """
+    Identifies the set of signals (chain, contract & event signature)
+    feeding the data products.  A snapshot taken under a different
+    config is not usable.
+    """
+    signals = sorted(ctx.dps.keys())
+    raw = json.dumps({'signals' : signals, 'version' : __version__})
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def write_snapshot(path, ctx, overlap, min_interval=0):
+    """
+    Serialize the context to `path`, atomically.
+
+    Returns False if another worker holds the snapshot lock, or already
+    wrote one within `min_interval` seconds, so hosts running several
+    workers only pay for one writer per interval.
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(f"{path}.lock", 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        if path.exists():
+            with open(path, 'rb') as f:
+                header = read_snapshot_header(f)
+            if header and time.time() - header['created_at'] < min_interval:
+                return False
+
+        start = time.perf_counter()
+
+        feed = ctx.feed
+        resume_block = feed.block - overlap
+
+        payload = {
+            'data_products' : ctx.data_products,
+            'models' : ctx.models,
+            'seen' : feed.seen_since(resume_block),
+            'archive_signal_counts' : dict(feed.archive_signal_counts),
+            'realtime_signal_counts' : dict(feed.realtime_signal_counts),
+            'total_signal_counts' : dict(feed.total_signal_counts),
+        }
+
+        body = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+        header = {
+            'format_version' : SNAPSHOT_FORMAT_VERSION,
+            'fingerprint' : fingerprint(ctx),
+            'block' : resume_block,
+            'created_at' : int(time.time()),
+            'size' : len(body),
+        }
+
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(MAGIC)
+            f.write(json.dumps(header).encode() + b'\n')
+            f.write(body)
+        os.replace(tmp, path)
+
+        logr.info(f"Wrote snapshot at block {resume_block} to {path} [{len(body) / 1024 / 1024:.1f} MB, {time.perf_counter() - start:.2f}s]")
+
+    return True
+
+
+def fork_snapshot(path, ctx, overlap, min_interval=0):
+    """
+    Forks a child, which writes the snapshot from its copy-on-write image
+    of the context, and exits, so the parent's event loop keeps serving
+    while it pickles.  Returns the child's pid, to reap with os.waitpid;
+    it exits 0 once written, 2 if it was another worker's turn, and 1 if
+    it failed.
+    """
+
+    pid = os.fork()
+
+    if pid:
+        return pid
+
+    status = 1
+
+    try:
+        status = 0 if write_snapshot(path, ctx, overlap, min_interval) else 2
+    except Exception as e:
+        logr.error(f"E127261017 - Could not write snapshot to {path}: {e}")
+    finally:
+        os._exit(status)
+
+
+def read_snapshot_header(f):
+
+    if f.readline() != MAGIC:
+        return None
+
+    try:
+        return json.loads(f.readline())
+    except ValueError:
+        return None
+
+
+def read_snapshot(path, ctx, max_age):
+    """
+    Returns (header, payload) for a usable snapshot at `path`, or None if
+    it is missing or stale, in which case the caller does a full replay.
+    """
+
+    path = Path(path)
+
+    if not path.exists():
+        logr.info(f"No snapshot at {path}, doing a full replay.")
+        return None
+
+    with open(path, 'rb') as f:
+
+        header = read_snapshot_header(f)
+
+        if header is None:
+            logr.info(f"Snapshot at {path} is unreadable, doing a full replay.")
+            return None
+
+        if header.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+            logr.info(f"Snapshot format {header.get('format_version')} != {SNAPSHOT_FORMAT_VERSION}, doing a full replay.")
+            return None
+
+        if header.get('fingerprint') != fingerprint(ctx):
+            logr.info(f"Snapshot was taken for a different set of signals, doing a full replay.")
+            return None
+
+        age = time.time() - header['created_at']
+        if age > max_age:
+            logr.info(f"Snapshot is {age / 3600:.1f} hours old, doing a full replay.")
+            return None
+
+        start = time.perf_counter()
+        payload = pickle.load(f)
+
+    logr.info(f"Loaded snapshot at block {header['block']} from {path} [{time.perf_counter() - start:.2f}s]")
+
+    return header, payload
@@ -2,4 +2,10 @@ import re
 
 pattern = re.compile(r"(?<=[a-z])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])")
 def camel_to_snake(a_str):
-    return pattern.sub('_', a_str).lower()
\ No newline at end of file
+    return pattern.sub('_', a_str).lower()
+
+def to_address(addr):
+    """
+    The lowercase address, as data products key addresses.
+    """
+    return addr.lower()
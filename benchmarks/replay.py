@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Replay the tests/data archives through CSVClient and the matching data
+products, the way the node boots, and measure each one:
+
+- read_s, handle_s : seconds decoding the CSVs, and seconds in the data product
+- events_per_s     : events handled per second
+- peak_rss_bytes   : the peak RSS of the process replaying it, each scenario runs in its own
+- bytes            : deep size of the data product, after the replay
+- bytes_per_entity : bytes, per proposal, vote, delegate, etc.
+
+Results are written as JSON, one file per commit, to diff across commits:
+
+    python benchmarks/replay.py run
+    python benchmarks/replay.py run --only votes --repeat 5
+    python benchmarks/replay.py compare benchmarks/results/<before>.json benchmarks/results/<after>.json
+
+Run it from the repo root.
+"""
+
+import os, sys, json, glob, time, platform, resource, subprocess
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from argh import arg, dispatch_commands
+from pympler import asizeof
+from abifsm import ABI, ABISet
+
+from app.clients_csv import CSVClient
+from app.data_products import Proposals, Votes, ProposalTypes, Delegations, NonIVotesVP
+from app.signatures import *
+
+BATCH_SIZE = 10_000 # as ARCHIVE_BATCH_SIZE in app/server.py
+
+RESULTS_PATH = Path('benchmarks/results')
+
+UNI_GOV = '0x408ed6354d4973f66138c91495f2f2fcbd8724c3'
+OP_GOV = '0xcdf27f107725988f2261ce2256bdfcde8b382b10'
+OP_TOKEN = '0x4200000000000000000000000000000000000042'
+PGUILD_PTC = '0xb7687e62d6b2cafb3ed3c3c81b0b6cf0a3884602'
+
+# name : (archive, [(abi name, abi file), ...], [(chain_id, address, signature), ...], blocks chain_id, data product factory, entity counter)
+SCENARIOS = {
+    'uniswap-proposals' : ('1000-all-uniswap-to-PID83', [('gov', 'uni-gov.json')],
+                           [(1, UNI_GOV, PROPOSAL_CREATED_1)], None,
+                           lambda: Proposals(governor_spec={'name': 'compound'}), lambda dp: len(dp.proposals)),
+
+    'uniswap-votes' : ('2000-uniswap-PID83-only', [('gov', 'uni-gov.json')],
+                       [(1, UNI_GOV, VOTE_CAST_1)], None,
+                       lambda: Votes(governor_spec={'name': 'compound'}), lambda dp: len(dp.vote_index)),
+
+    'op-approval-votes' : ('3000-op-approval-PID31049', [('gov', 'op-gov.json')],
+                           [(10, OP_GOV, VOTE_CAST_1), (10, OP_GOV, VOTE_CAST_WITH_PARAMS_1)], None,
+                           lambda: Votes(governor_spec={'name': 'agora', 'version': 0.1}), lambda dp: len(dp.vote_index)),
+
+    'op-proposals' : ('5000-all-optimism-proposalcreated-to-20250425', [('gov', 'op-gov.json')],
+                      [(10, OP_GOV, signature) for signature in (PROPOSAL_CREATED_1, PROPOSAL_CREATED_2, PROPOSAL_CREATED_3, PROPOSAL_CREATED_4)], None,
+                      lambda: Proposals({'name': 'agora', 'version': 0.1}, {}), lambda dp: len(dp.proposals)),
+
+    'op-delegate-votes' : ('5500-10Koptimism-dvc-w-blocks', [('token', 'scroll-token.json')],
+                           [(10, OP_TOKEN, DELEGATE_VOTES_CHANGE)], 10,
+                           Delegations, lambda dp: len(dp.delegatee_vp)),
+
+    'partial-delegations' : ('6000-delegations', [('token', 'scroll-token.json')],
+                             [(1, '0x1234567890123456789012345678901234567890', DELEGATE_CHANGED_2)], None,
+                             Delegations, lambda dp: len(dp.delegatee_list)),
+
+    'pguild-proposal-types' : ('4000-pguild-ptc-w-scopes', [('ptc', 'pguild-ptc.json')],
+                               [(1115511, PGUILD_PTC, PROP_TYPE_SET_4), (1115511, PGUILD_PTC, SCOPE_CREATED)], None,
+                               ProposalTypes, lambda dp: len(dp.proposal_types)),
+
+    'v2-scope-disabled' : ('7000-v2-scope-disabled', [('ptc', 'world-ptc.json')],
+                           [(1, '0xtest1', signature) for signature in (PROP_TYPE_SET_4, SCOPE_CREATED, SCOPE_DISABLED_2)], None,
+                           ProposalTypes, lambda dp: len(dp.proposal_types)),
+
+    'v2-scope-deleted' : ('8000-v2-scope-deleted', [('ptc', 'world-ptc.json')],
+                          [(1, '0xtest2', signature) for signature in (PROP_TYPE_SET_4, SCOPE_CREATED, SCOPE_DELETED_2)], None,
+                          ProposalTypes, lambda dp: len(dp.proposal_types)),
+
+    'v1-scope-disabled' : ('9000-v1-scope-disabled', [('ptc', 'pguild-ptc.json')],
+                           [(1, '0xtest3', signature) for signature in (PROP_TYPE_SET_4, SCOPE_CREATED, SCOPE_DISABLED)], None,
+                           ProposalTypes, lambda dp: len(dp.proposal_types)),
+
+    'agora-v2-proposals' : ('10000-agora-v2-proposals', [('gov', 'world-gov.json'), ('voting_module', 'world-voting_module.json')],
+                            [(1, '0xtest4', PROPOSAL_CREATED_1), (1, '0xtest4', PROPOSAL_CREATED_MODULE)], None,
+                            lambda: Proposals(governor_spec={'name': 'agora', 'version': 2.0}), lambda dp: len(dp.proposals)),
+}
+
+
+def read_csv_archive(archive, abi_files, plan, blocks_chain_id):
+    """
+    Returns [[event, ...], ...], in runs of the same signal, of at most
+    BATCH_SIZE events, as `read_archive` in app/server.py dispatches them.
+    """
+
+    csvc = CSVClient(f'tests/data/{archive}')
+    csvc.set_abis(ABISet('benchmarks', [ABI.from_file(name, os.path.join('tests', 'abis', fname)) for name, fname in abi_files]))
+
+    if blocks_chain_id is not None:
+        csvc.plan_block(blocks_chain_id)
+
+    for chain_id, address, signature in plan:
+        csvc.plan_event(chain_id, address, signature)
+
+    batches = []
+
+    for event, _, new_signal in csvc.read(after=0):
+        if new_signal or len(batches[-1]) >= BATCH_SIZE:
+            batches.append([])
+        batches[-1].append(event)
+
+    return batches
+
+
+def read_nonivotes_archive():
+    fnames = sorted(glob.glob('tests/data/nonivotes-syndicate/*.json'), key=lambda fname: int(Path(fname).name.split('-')[0]))
+    return [[json.load(open(fname))] for fname in fnames]
+
+
+def replay(name, repeat):
+
+    best = None
+
+    for _ in range(repeat):
+
+        start = time.perf_counter()
+
+        if name == 'nonivotes':
+            batches = read_nonivotes_archive()
+            data_product, entities = NonIVotesVP(), lambda dp: len(dp.latest)
+        else:
+            archive, abi_files, plan, blocks_chain_id, factory, entities = SCENARIOS[name]
+            batches = read_csv_archive(archive, abi_files, plan, blocks_chain_id)
+            data_product = factory()
+
+        read_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+
+        for batch in batches:
+            data_product.handle_batch(batch)
+
+        handle_s = time.perf_counter() - start
+
+        if best is None or handle_s < best['handle_s']:
+            best = {'read_s' : read_s, 'handle_s' : handle_s, 'data_product' : data_product}
+
+    data_product = best.pop('data_product')
+
+    events = sum(len(batch) for batch in batches)
+    size = asizeof.asizeof(data_product)
+    count = entities(data_product)
+
+    return dict(best,
+                events=events,
+                events_per_s=events / best['handle_s'] if best['handle_s'] else None,
+                peak_rss_bytes=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024),
+                bytes=size,
+                entities=count,
+                bytes_per_entity=size / count if count else None)
+
+
+def git(*args):
+    try:
+        return subprocess.check_output(['git', *args], text=True, stderr=subprocess.DEVNULL).strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+
+@arg('--only', help='Only run the scenarios whose name contains this.')
+@arg('--repeat', help='Replays per scenario, the fastest is kept.')
+@arg('--out', help='Where to write the JSON results, defaults to benchmarks/results/<commit>.json')
+def run(only=None, repeat=3, out=None):
+
+    names = [name for name in list(SCENARIOS) + ['nonivotes'] if only is None or only in name]
+
+    results = {}
+
+    # A fresh process per scenario, so the peak RSS is that scenario's alone.
+    context = multiprocessing.get_context('spawn')
+
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[name] = pool.submit(replay, name, int(repeat)).result()
+
+        r = results[name]
+        print(f"{name:<24} {r['events']:>8} events {r['events_per_s'] or 0:>14,.0f} events/s {r['peak_rss_bytes'] / 2 ** 20:>8.1f} MiB peak {r['bytes_per_entity'] or 0:>12,.0f} B/entity")
+
+    commit = git('rev-parse', '--short', 'HEAD')
+
+    output = {'meta' : {'commit' : commit,
+                        'dirty' : bool(git('status', '--porcelain', '--untracked-files=no')),
+                        'time' : time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                        'python' : platform.python_version(),
+                        'platform' : platform.platform(),
+                        'repeat' : int(repeat)},
+              'results' : results}
+
+    if out is None:
+        RESULTS_PATH.mkdir(parents=True, exist_ok=True)
+        out = RESULTS_PATH / f"{commit or 'unknown'}.json"
+
+    with open(out, 'w') as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+
+    print(f"Wrote {out}")
+
+
+METRICS = ('events_per_s', 'handle_s', 'read_s', 'peak_rss_bytes', 'bytes_per_entity')
+
+def compare(before, after):
+    """
+    Print the change in each metric, for the scenarios in both results.
+    """
+
+    before, after = json.load(open(before)), json.load(open(after))
+
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']}")
+
+    for name in sorted(before['results'].keys() & after['results'].keys()):
+        for metric in METRICS:
+            old, new = before['results'][name].get(metric), after['results'][name].get(metric)
+            if old and new is not None:
+                print(f"{name:<24} {metric:<18} {old:>16,.3f} {new:>16,.3f} {100 * (new - old) / old:>+8.1f}%")
+
+
+if __name__ == '__main__':
+    dispatch_commands([run, compare])
@@ -8,5 +8,5 @@ setup(
     author="DAO Node",
     author_email="jeff@voteagora.com",
     license="MIT license",
-    python_requires=">=3.7",
+    python_requires=">=3.11",
 )
@@ -1,10 +1,13 @@
 import os
+import asyncio
+
+os.environ.setdefault('AGORA_CONFIG_FILE', 'tests/test_config.yaml')
 
 import pytest
 from dotenv import load_dotenv
 from eth_utils import keccak
 
-from app.clients_httpjson import JsonRpcHistHttpClient
+from app.clients_httpjson import JsonRpcHistHttpClient, JsonRpcRtHttpClient
 from app.signatures import DELEGATE_VOTES_CHANGE, DELEGATE_CHANGED_1, DELEGATE_CHANGED_2
 from app.clients_wsjson import JsonRpcRtWsClientCaster
 from pprint import pprint
@@ -265,3 +268,208 @@ def test_get_paginated_logs_are_in_chronological_order(test_package):
             curr_high_bn = current_block_number
             curr_high_tran_idx = -1
 
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_csv_client_parallel_read_matches_serial(op_governor_abis, workers):
+
+    from app.clients_csv import CSVClient
+    from app.signatures import VOTE_CAST_1, VOTE_CAST_WITH_PARAMS_1, PROPOSAL_CREATED_4
+
+    def read(workers):
+
+        csvc = CSVClient('tests/data/3000-op-approval-PID31049', workers=workers)
+        csvc.set_abis(op_governor_abis)
+
+        gov = '0xcdf27f107725988f2261ce2256bdfcde8b382b10'
+        for signature in [PROPOSAL_CREATED_4, VOTE_CAST_1, VOTE_CAST_WITH_PARAMS_1]:
+            csvc.plan_event(10, gov, signature)
+
+        return list(csvc.read(after=0))
+
+    serial = read(0)
+
+    assert len(serial) > 0
+    assert read(workers) == serial
+
+def test_csv_client_parallel_read_blocks():
+
+    from app.clients_csv import CSVClient
+
+    def read(workers):
+        csvc = CSVClient('tests/data/5500-10Koptimism-dvc-w-blocks', workers=workers)
+        csvc.plan_block(10)
+        return list(csvc.read(after=0))
+
+    serial = read(0)
+
+    assert isinstance(serial[0][0]['timestamp'], int)
+    assert read(2) == serial
+
+
+class FakeAsyncEth:
+    """Serves logs from memory, rejecting ranges wider than `max_span` like a provider would."""
+
+    def __init__(self, logs, latest_block, max_span):
+        self.logs = logs
+        self.latest_block = latest_block
+        self.max_span = max_span
+        self.chain_id_value = 10
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    async def block_number(self):
+        return self.latest_block
+
+    @property
+    async def chain_id(self):
+        return self.chain_id_value
+
+    async def get_logs(self, event_filter):
+        from web3.exceptions import Web3RPCError
+
+        lo, hi = event_filter['fromBlock'], event_filter['toBlock']
+        self.requests.append((lo, hi))
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0)
+        self.in_flight -= 1
+
+        if hi - lo + 1 > self.max_span:
+            raise Web3RPCError(str({'code': -32602, 'message': 'range too large'}))
+
+        return [log for log in self.logs if lo <= log['blockNumber'] <= hi and '0x' + log['topics'][0].hex() in event_filter['topics'][0]]
+
+class FakeAsyncWeb3:
+    def __init__(self, eth):
+        self.eth = eth
+        self.provider = self
+
+    async def disconnect(self):
+        self.disconnected = True
+
+def test_concurrent_catch_up_is_ordered_and_split(monkeypatch):
+
+    monkeypatch.setenv('DAO_NODE_ARCHIVE_NODE_HTTP_BLOCK_COUNT_SPAN', '100')
+
+    topic_a, topic_b = '0x' + 'aa' * 32, '0x' + 'bb' * 32
+
+    def log(bn, tid, lid, topic):
+        return {'blockNumber': bn, 'transactionIndex': tid, 'logIndex': lid, 'topics': [bytes.fromhex(topic[2:])]}
+
+    # Block 99 sorts before block 100 numerically, but not as a string.
+    logs = [log(100, 0, 1, topic_a), log(99, 3, 0, topic_b), log(250, 1, 0, topic_a), log(250, 0, 7, topic_b), log(5, 0, 0, topic_a)]
+
+    eth = FakeAsyncEth(logs, latest_block=300, max_span=30)
+    w3 = FakeAsyncWeb3(eth)
+
+    jrhhc = JsonRpcHistHttpClient('http://unused')
+    jrhhc.in_flight = 3
+    monkeypatch.setattr(jrhhc, 'connect_async', lambda: w3)
+
+    def caster(log):
+        return {}
+
+    jrhhc.event_subsription_meta[10]['0xgov'][topic_a] = (caster, 'A()')
+    jrhhc.event_subsription_meta[10]['0xtoken'][topic_b] = (caster, 'B()')
+
+    out = list(jrhhc.read(after=0))
+
+    assert [(e['block_number'], e['transaction_index'], e['log_index']) for e, _, _ in out] == \
+           [('5', 0, 0), ('99', 3, 0), ('100', 0, 1), ('250', 0, 7), ('250', 1, 0)]
+
+    assert [signal for _, signal, _ in out] == ['10.0xgov.A()', '10.0xtoken.B()', '10.0xgov.A()', '10.0xtoken.B()', '10.0xgov.A()']
+    assert all(new_signal for _, _, new_signal in out)
+
+    # Every range the provider rejected was split until it was accepted.
+    assert any(hi - lo + 1 > 30 for lo, hi in eth.requests)
+    assert 0 < eth.max_in_flight <= 3
+    assert w3.disconnected
+
+def test_single_block_range_is_not_split(monkeypatch):
+
+    from web3.exceptions import Web3RPCError
+
+    topic = '0x' + 'aa' * 32
+
+    # Rejects every range, down to single blocks.
+    eth = FakeAsyncEth([], latest_block=10, max_span=0)
+
+    jrhhc = JsonRpcHistHttpClient('http://unused')
+    monkeypatch.setattr(jrhhc, 'connect_async', lambda: FakeAsyncWeb3(eth))
+    jrhhc.event_subsription_meta[10]['0xgov'][topic] = (lambda log: {}, 'A()')
+
+    with pytest.raises(Web3RPCError):
+        list(jrhhc.read(after=5))
+
+    assert (5, 5) in eth.requests
+    assert all(lo <= hi for lo, hi in eth.requests)
+
+@pytest.mark.asyncio
+async def test_catch_up_is_awaited(monkeypatch):
+
+    from app.server import Feed, ClientSequencer
+
+    topic = '0x' + 'aa' * 32
+
+    eth = FakeAsyncEth([{'blockNumber': bn, 'transactionIndex': 0, 'logIndex': 0, 'topics': [bytes.fromhex(topic[2:])]} for bn in (10, 20, 30)], latest_block=100, max_span=5)
+
+    jrhhc = JsonRpcHistHttpClient('http://unused')
+    monkeypatch.setattr(jrhhc, 'connect_async', lambda: FakeAsyncWeb3(eth))
+    monkeypatch.setattr(jrhhc, 'get_fallback_block', lambda: 0)
+    jrhhc.event_subsription_meta[10]['0xgov'][topic] = (lambda log: {}, 'A()')
+
+    feed = Feed()
+    feed.set_client_sequencer(ClientSequencer([jrhhc]))
+
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0)
+
+    ticker = asyncio.create_task(tick())
+
+    out = [event async for reader in feed.read_archive() for event in reader]
+
+    ticker.cancel()
+
+    # The loop ran other tasks while the catch-up was fetched.
+    assert ticks > 0
+
+    assert [e['block_number'] for e, _, _ in out] == ['10', '20', '30']
+    assert feed.archive_block == 31
+
+@pytest.mark.asyncio
+async def test_polling_only_requests_new_blocks(monkeypatch):
+
+    monkeypatch.setenv('DAO_NODE_ARCHIVE_NODE_HTTP_BLOCK_COUNT_SPAN', '2000')
+
+    topic = '0x' + 'aa' * 32
+
+    def log(bn, lid):
+        return {'blockNumber': bn, 'transactionIndex': 0, 'logIndex': lid, 'topics': [bytes.fromhex(topic[2:])]}
+
+    eth = FakeAsyncEth([log(995, 0), log(1000, 1), log(1003, 0)], latest_block=1000, max_span=2000)
+
+    jrrhc = JsonRpcRtHttpClient('http://unused', 'POLL0')
+    monkeypatch.setattr(jrrhc, 'connect_async', lambda: FakeAsyncWeb3(eth))
+    jrrhc.event_subsription_meta[10]['0xgov'][topic] = (lambda log: {}, 'A()')
+
+    first = [e async for e in jrrhc.read()]
+    assert [e['block_number'] for e in first] == ['995', '1000']
+    assert first[0]['signal'] == '10.0xgov.A()'
+    assert eth.requests == [(990, 1000)]
+
+    # Nothing new, so nothing is requested.
+    assert [e async for e in jrrhc.read()] == []
+    assert eth.requests == [(990, 1000)]
+
+    eth.latest_block = 1005
+    assert [e['block_number'] async for e in jrrhc.read()] == ['1003']
+    assert eth.requests == [(990, 1000), (1001, 1005)]
@@ -1,5 +1,6 @@
 import pytest
-from app.data_products import Balances, Delegations, NonIVotesVP, Proposals, Votes, ProposalTypes, Proposal, VoteAggregation
+from app.data_products import Balances, Delegations, NonIVotesVP, Proposals, Votes, ProposalTypes, Proposal, VoteAggregation, DelegateLeaderboard
+from app.data_models import ParticipationRateModel
 from app.clients_csv import CSVClient
 import csv
 import os
@@ -330,6 +331,121 @@ def test_Votes_one_op_approval_from_csv(op_governor_abis):
 
     assert len(aggregations.result) == 16
 
+def test_Votes_records_are_shared_and_serialize_like_events():
+
+    votes = Votes(governor_spec={'name': 'compound'})
+
+    voter = '0xded7e867cc42114f1cffa1c5572f591e8711771d'
+
+    votes.handle({'block_number': '100', 'transaction_index': 5, 'log_index': 10, 'voter': voter, 'proposal_id': 42, 'support': 1, 'votes': 100, 'reason': '', 'signature': VOTE_CAST_1, 'sighash': '8bd1'})
+    votes.handle({'block_number': '101', 'transaction_index': 1, 'log_index': 3, 'voter': voter, 'proposal_id': 43, 'support': 0, 'votes': 200, 'reason': 'because', 'params': '', 'signature': VOTE_CAST_WITH_PARAMS_1, 'sighash': '8c58'})
+
+    assert votes.voter_history[voter][0] is votes.proposal_vote_record['42'][0]
+
+    assert votes.voter_history[voter][0].to_dict() == {'voter': voter, 'proposal_id': '42', 'support': 1, 'votes': 100, 'bn': '100', 'tid': 5, 'lid': 10}
+    assert votes.proposal_vote_record['43'][0].to_dict(include_proposal_id=False) == {'voter': voter, 'support': 0, 'votes': 200, 'reason': 'because', 'params': '', 'bn': '101', 'tid': 1, 'lid': 3}
+    assert votes.proposal_vote_record['43'][0].vp == 200
+
+def test_Votes_handle_batch_matches_handle(op_governor_abis):
+
+    def read_events():
+        csvc = CSVClient('tests/data/3000-op-approval-PID31049')
+        csvc.set_abis(op_governor_abis)
+        csvc.plan_event(10, '0xcdf27f107725988f2261ce2256bdfcde8b382b10', VOTE_CAST_1)
+        csvc.plan_event(10, '0xcdf27f107725988f2261ce2256bdfcde8b382b10', VOTE_CAST_WITH_PARAMS_1)
+        return [event for event, _, _ in csvc.read(after=0)]
+
+    one, many = Votes({'name': 'agora', 'version': 0.1}), Votes({'name': 'agora', 'version': 0.1})
+
+    for event in read_events():
+        one.handle(event)
+
+    events = read_events()
+    for i in range(0, len(events), 100):
+        many.handle_batch(events[i:i + 100])
+
+    assert one.proposal_vote_record.keys() == many.proposal_vote_record.keys()
+
+    for proposal_id in one.proposal_vote_record:
+        assert one.proposal_vote_record[proposal_id] == many.proposal_vote_record[proposal_id]
+        assert list(one.proposal_vote_record_by_vp[proposal_id]) == list(many.proposal_vote_record_by_vp[proposal_id])
+        assert one.proposal_aggregations[proposal_id].result == many.proposal_aggregations[proposal_id].result
+
+    assert one.vote_index == many.vote_index
+    assert one.latest_vote_block == many.latest_vote_block
+
+def test_Votes_handle_batch_skips_an_event_without_a_proposal_id():
+
+    votes = Votes(governor_spec={'name': 'compound'})
+
+    def vote(tid, **fields):
+        return dict({'block_number': '100', 'transaction_index': tid, 'log_index': 0, 'voter': f'0x{tid:040x}', 'support': 1, 'votes': 10, 'reason': '', 'signature': VOTE_CAST_1}, **fields)
+
+    votes.handle_batch([vote(0, proposal_id=42), vote(1), vote(2, proposal_id=43)])
+
+    assert [r.voter for r in votes.proposal_vote_record['42']] == [f'0x{0:040x}']
+    assert [r.voter for r in votes.proposal_vote_record['43']] == [f'0x{2:040x}']
+    assert not votes.has_voted(f'0x{1:040x}', '42')
+
+def test_Votes_vote_record_page_matches_sort(op_governor_abis):
+
+    votes = Votes({'name': 'agora', 'version': 0.1})
+
+    csvc = CSVClient('tests/data/3000-op-approval-PID31049')
+    csvc.set_abis(op_governor_abis)
+    csvc.plan_event(10, '0xcdf27f107725988f2261ce2256bdfcde8b382b10', 'VoteCast(address,uint256,uint8,uint256,string)')
+    csvc.plan_event(10, '0xcdf27f107725988f2261ce2256bdfcde8b382b10', 'VoteCastWithParams(address,uint256,uint8,uint256,string,bytes)')
+
+    for event, _, _ in csvc.read(after=0):
+        votes.handle(event)
+
+    proposal_id = '31049359136632781771607732021569520613741907517136820917236339424553298132866'
+    record = votes.proposal_vote_record[proposal_id]
+
+    assert len(record) > 250
+
+    # Ties are broken by (block, tx, log), ascending, in both directions.
+    by_vp = sorted(record, key=lambda x: (-x.vp, int(x.bn), x.tid, x.lid))
+    by_bn = sorted(record, key=lambda x: (-int(x.bn), x.tid, x.lid))
+
+    for offset in (0, 100, len(record) - 10, len(record)):
+        page, has_more = votes.vote_record_page(proposal_id, 'VP', True, offset, 100)
+        assert page == by_vp[offset:offset + 100]
+        assert has_more == (offset + 100 < len(record))
+
+        page, _ = votes.vote_record_page(proposal_id, 'VP', False, offset, 100)
+        assert page == sorted(record, key=lambda x: (x.vp, int(x.bn), x.tid, x.lid))[offset:offset + 100]
+
+        page, _ = votes.vote_record_page(proposal_id, 'BN', True, offset, 100)
+        assert page == by_bn[offset:offset + 100]
+
+        page, _ = votes.vote_record_page(proposal_id, 'BN', False, offset, 100)
+        assert page == sorted(record, key=lambda x: (int(x.bn), x.tid, x.lid))[offset:offset + 100]
+
+    page, has_more = votes.vote_record_page(proposal_id, 'VP', True)
+    assert len(page) == len(record) and not has_more
+    assert page[0] is by_vp[0]
+
+    assert votes.vote_record_page('missing', 'VP', True, 0, 100) == ([], False)
+
+def test_Votes_vote_record_page_ties_are_in_block_order():
+
+    votes = Votes(governor_spec={'name': 'compound'})
+
+    for bn, tid, vp in [(100, 0, 10), (100, 1, 20), (100, 2, 10), (101, 0, 10), (102, 0, 30), (102, 1, 10)]:
+        votes.handle({'block_number': str(bn), 'transaction_index': tid, 'log_index': 0, 'voter': f'0x{bn:020x}{tid:020x}', 'proposal_id': 42, 'support': 1, 'votes': vp, 'reason': '', 'signature': VOTE_CAST_1})
+
+    def page(sort_by, reverse, offset=0, page_size=10):
+        return [(int(r.bn), r.tid) for r in votes.vote_record_page('42', sort_by, reverse, offset, page_size)[0]]
+
+    assert page('VP', True) == [(102, 0), (100, 1), (100, 0), (100, 2), (101, 0), (102, 1)]
+    assert page('VP', False) == [(100, 0), (100, 2), (101, 0), (102, 1), (100, 1), (102, 0)]
+    assert page('BN', True) == [(102, 0), (102, 1), (101, 0), (100, 0), (100, 1), (100, 2)]
+
+    # Pages that start, or end, inside a run of ties.
+    assert page('VP', True, 3, 2) == [(100, 2), (101, 0)]
+    assert page('BN', True, 1, 3) == [(102, 1), (101, 0), (100, 0)]
+
 def test_ProposalTypes_proposal_type_set_with_one_scope_created(pguild_ptc_abi):
 
     pt = ProposalTypes()
@@ -395,6 +511,243 @@ def test_DelegateVotesChanged_7day_growth_rate():
     end = time.perf_counter()
     print(f"Time: {end - start}")
 
+def test_DelegateLeaderboard_matches_full_sort():
+
+    d = Delegations()
+    votes = Votes(governor_spec={'name': 'compound'})
+    leaderboard = DelegateLeaderboard(d, votes)
+
+    def read_sorted_dvc():
+        with open('tests/data/5500-10Koptimism-dvc-w-blocks/10/0x4200000000000000000000000000000000000042/DelegateVotesChanged(address,uint256,uint256).csv', 'r') as f:
+            for row in csv.DictReader(f):
+                row['signature'] = 'DelegateVotesChanged(address,uint256,uint256)'
+                yield int(row['block_number']), row
+
+    def read_sorted_blocks():
+        with open('tests/data/5500-10Koptimism-dvc-w-blocks/10/blocks.csv', 'r') as f:
+            for row in csv.DictReader(f):
+                row['timestamp'] = int(row['timestamp'])
+                row['block_number'] = int(row['block_number'])
+                yield row['block_number'], row
+
+    merged = list(heapq.merge(
+        ((block_number, row) for block_number, row in read_sorted_dvc()),
+        ((block_number, row) for block_number, row in read_sorted_blocks()),
+        key=lambda x: x[0]
+    ))
+
+    def check(sort_by, value_func, offset, page_size, reverse):
+
+        page = leaderboard.page(sort_by, offset, page_size, reverse)
+
+        expected = sorted((value_func(addr) for addr in d.delegatee_vp if addr != '0x0000000000000000000000000000000000000000'), reverse=reverse)
+        expected = expected[offset:offset + page_size]
+
+        assert [value for _, value in page] == expected
+        assert all(value_func(addr) == value for addr, value in page)
+
+    half = len(merged) // 2
+
+    for _, row in merged[:half]:
+        d.handle(row)
+        leaderboard.handle(row)
+
+    check('VP', lambda addr: d.delegatee_vp[addr], 0, 20, True)
+
+    for _, row in merged[half:]:
+        d.handle(row)
+        leaderboard.handle(row)
+
+    top_addr = leaderboard.page('VP', 0, 1)[0][0]
+
+    vote = {'block_number': 100000000, 'transaction_index': 5, 'log_index': 10, 'voter': top_addr, 'proposal_id': '42', 'support': 1, 'votes': 100, 'reason': '', 'signature': 'VoteCast(address,uint256,uint8,uint256,string)', 'sighash': '8bd10c2c5c6c2693aef5a24259d241d27c33b5c753d92f752137b77ba70c198a'}
+    votes.handle(vote)
+    leaderboard.handle(vote)
+
+    for offset, page_size, reverse in [(0, 20, True), (7, 13, True), (0, 20, False), (len(d.delegatee_vp) - 5, 20, True)]:
+        check('VP', lambda addr: d.delegatee_vp[addr], offset, page_size, reverse)
+        check('VPC', d.delegate_seven_day_vp_change, offset, page_size, reverse)
+
+    assert leaderboard.page('LVB', 0, 10) == [(top_addr, 100000000)]
+
+def test_DelegateLeaderboard_ties_are_listed_by_address():
+
+    d = Delegations()
+    votes = Votes(governor_spec={'name': 'compound'})
+    leaderboard = DelegateLeaderboard(d, votes)
+
+    vps = {'0x00000000000000000000000000000000000000c3' : 10,
+           '0x00000000000000000000000000000000000000a1' : 20,
+           '0x00000000000000000000000000000000000000b2' : 10,
+           '0x00000000000000000000000000000000000000d4' : 30,
+           '0x00000000000000000000000000000000000000e5' : 10}
+
+    for i, (addr, vp) in enumerate(vps.items()):
+        d.handle({'block_number': 100 + i, 'transaction_index': 0, 'log_index': 0, 'delegate': addr, 'previous_votes': 0, 'new_votes': vp, 'signature': DELEGATE_VOTES_CHANGE})
+
+    # Ties are in address order, whichever way the page runs.
+    for reverse in (True, False):
+        expected = sorted(sorted(vps.items()), key=lambda x: x[1], reverse=reverse)
+        assert leaderboard.page('VP', 0, 10, reverse) == expected
+        assert leaderboard.page('VP', 1, 2, reverse) == expected[1:3]
+        assert leaderboard.page('VP', 2, 10, reverse) == expected[2:]
+
+def test_Delegations_vp_at_block():
+
+    d = Delegations()
+
+    addr = '0xded7e867cc42114f1cffa1c5572f591e8711771d'
+
+    for block_number, new_votes in [(100, 10), (200, 0), (300, 30)]:
+        d.handle({'block_number': block_number, 'transaction_index': 0, 'log_index': 0, 'delegate': addr, 'previous_votes': 0, 'new_votes': new_votes, 'signature': DELEGATE_VOTES_CHANGE})
+
+    assert d.delegatee_vp_at_block(addr, 100) == 0
+    assert d.delegatee_vp_at_block(addr, 101) == 10
+    assert d.delegatee_vp_at_block(addr, 250) == 0
+    assert d.delegatee_vp_at_block(addr, '301') == 30
+    assert d.delegatee_vp_at_block('0x0000000000000000000000000000000000000001', 301) == 0
+
+    assert d.delegatee_vp_at_block(addr, 50, include_history=True) == (0, [(0, 0), (100, 10), (200, 0), (300, 30)])
+    assert d.delegatee_vp_at_block(addr, 250, include_history=True) == (0, [(200, 0), (300, 30)])
+
+    assert '0x0000000000000000000000000000000000000001' not in d.delegatee_vp_history
+
+    assert d.delegatees_vp_at_block([addr, '0x0000000000000000000000000000000000000001'], 301) == {addr : 30, '0x0000000000000000000000000000000000000001' : 0}
+    assert d.delegatee_vp_history[addr].items() == [(100, 10), (200, 0), (300, 30)]
+
+def test_Delegations_seven_day_vp_change_window():
+
+    d = Delegations()
+
+    addr = '0xded7e867cc42114f1cffa1c5572f591e8711771d'
+    other = '0x0000000000000000000000000000000000000001'
+
+    hour = 3600
+    for block_number in range(1, 201):
+        d.handle_block({'block_number': block_number * 10, 'timestamp': block_number * hour})
+
+    assert d.seven_day_block_number == 320
+
+    for block_number, delegate, new_votes in [(100, addr, 10), (200, addr, 20), (300, addr, 30), (400, other, 5), (1000, addr, 40), (2000, addr, 50)]:
+        d.handle({'block_number': block_number, 'transaction_index': 0, 'log_index': 0, 'delegate': delegate, 'previous_votes': 0, 'new_votes': new_votes, 'signature': DELEGATE_VOTES_CHANGE})
+
+    # Only the last change before the 7-day-ago block is kept, at the front.
+    assert list(d.delegatee_vp_recent_history[addr]) == [(300, 30), (1000, 40), (2000, 50)]
+
+    for delegate in (addr, other):
+        assert d.delegate_seven_day_vp_change(delegate) == d.delegatee_vp[delegate] - d.delegatee_vp_at_block(delegate, d.seven_day_block_number)
+
+    # Later, the window rolls over.
+    for block_number in range(201, 301):
+        d.handle_block({'block_number': block_number * 10, 'timestamp': block_number * hour})
+
+    assert d.seven_day_block_number == 1320
+    assert d.delegate_seven_day_vp_change(addr) == 10
+    assert d.delegate_seven_day_vp_change(other) == 0
+    assert list(d.delegatee_vp_recent_history[addr]) == [(1000, 40), (2000, 50)]
+
+def test_Delegations_seven_day_vp_change_follows_partial_delegations():
+
+    d = Delegations()
+
+    addr = '0xabcdef1234567890123456789012345678901234'
+
+    hour = 3600
+    for block_number in range(1, 201):
+        d.handle_block({'block_number': block_number * 10, 'timestamp': block_number * hour})
+
+    d.handle({'block_number': 100, 'transaction_index': 0, 'log_index': 0, 'delegate': addr, 'previous_votes': 0, 'new_votes': 10, 'signature': DELEGATE_VOTES_CHANGE})
+
+    assert d.delegate_seven_day_vp_change(addr) == 0
+
+    d.handle({'block_number': 1000, 'transaction_index': 0, 'log_index': 1,
+              'delegator': '0x1234567890123456789012345678901234567890',
+              'old_delegatees': [], 'new_delegatees': [[addr, 5000]],
+              'signature': DELEGATE_CHANGED_2, 'sighash': 'test'})
+
+    assert d.delegatee_vp[addr] == 5010
+    assert d.delegate_seven_day_vp_change(addr) == 5000
+
+def test_ParticipationRateModel_refresh():
+
+    d = Delegations()
+
+    a, b, c = '0xaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa', '0xbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb', '0xcccccccccccccccccccccccccccccccccccccccc'
+
+    for block_number, delegate, new_votes in [(100, a, 10), (100, b, 10), (250, b, 0), (300, c, 5)]:
+        d.handle({'block_number': block_number, 'transaction_index': 0, 'log_index': 0, 'delegate': delegate, 'previous_votes': 0, 'new_votes': new_votes, 'signature': DELEGATE_VOTES_CHANGE})
+
+    votes = Votes(governor_spec={'name': 'compound'})
+
+    for voter, proposal_id in [(a, '1'), (b, '1'), (a, '3'), (c, '3')]:
+        votes.handle({'block_number': 1000, 'transaction_index': 0, 'log_index': 0, 'voter': voter, 'proposal_id': proposal_id, 'support': 1, 'votes': 1, 'reason': '', 'signature': 'VoteCast(address,uint256,uint8,uint256,string)', 'sighash': '8bd10c2c5c6c2693aef5a24259d241d27c33b5c753d92f752137b77ba70c198a'})
+
+    class MockPRST:
+        recently_completed_and_counted_proposals = [('1', 200, 400), ('2', '260', 500)]
+        ending_in_future_proposals = [('3', 350, 10 ** 9)]
+        flag_recently_completed_and_counted_has_changed = True
+        flag_ending_in_future_proposals_has_changed = True
+
+    class MockProposals:
+        prst = MockPRST()
+
+    model = ParticipationRateModel()
+    model.refresh_if_necessary(MockProposals(), votes, d)
+
+    assert dict(model.completed_participation_fractions) == {a: (1, 2), b: (1, 1)}
+    assert dict(model.future_participation_fractions) == {a: 1, c: 1}
+
+    assert model.get_rate(a) == 2 / 3
+    assert model.get_rate(b) == 1.0
+    assert model.get_rate(c) == 1.0
+    assert model.version == 2
+
+    # Lookups, hits or misses, don't add entries
+    assert len(votes.vote_index) == 4
+    assert votes.get_votes(a, '3') == [votes.voter_history[a][1]]
+    assert votes.get_votes(b, '3') == []
+    assert set(votes.voter_history) == {a, b, c}
+
+def test_handle_batch_matches_handle():
+
+    transfers = [
+        {'block_number': 1, 'transaction_index': 0, 'log_index': 0, 'from': '0x0000000000000000000000000000000000000000', 'to': '0xaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa', 'value': 100},
+        {'block_number': 2, 'transaction_index': 0, 'log_index': 0, 'from': '0xaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa', 'to': '0xbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb', 'value': 40},
+        {'block_number': 3, 'transaction_index': 0, 'log_index': 0, 'from': '0xbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb', 'to': '0xaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa', 'value': 40},
+    ]
+
+    one, many = Balances(token_spec={'name' : 'erc20', 'version' : '?'}), Balances(token_spec={'name' : 'erc20', 'version' : '?'})
+    for event in transfers:
+        one.handle(event)
+    many.handle_batch(transfers)
+
+    assert one.balances == many.balances
+
+    with open('tests/data/5500-10Koptimism-dvc-w-blocks/10/blocks.csv', 'r') as f:
+        blocks = [{'timestamp': int(row['timestamp']), 'block_number': int(row['block_number'])} for row in csv.DictReader(f)]
+
+    with open('tests/data/5500-10Koptimism-dvc-w-blocks/10/0x4200000000000000000000000000000000000042/DelegateVotesChanged(address,uint256,uint256).csv', 'r') as f:
+        dvcs = [dict(row, signature=DELEGATE_VOTES_CHANGE) for row in csv.DictReader(f)]
+
+    one, many = Delegations(), Delegations()
+
+    for event in blocks:
+        one.handle(event)
+    many.handle_batch(blocks)
+
+    # The sample spans less than 7 days, so fake a look-back block, to prune the recent history.
+    one.seven_day_block_number = many.seven_day_block_number = int(dvcs[len(dvcs) // 2]['block_number'])
+
+    for event in dvcs:
+        one.handle(event)
+    many.handle_batch(dvcs)
+
+    assert one.current_block_number == many.current_block_number
+    assert one.voting_power == many.voting_power
+    assert one.delegatee_vp == many.delegatee_vp
+    assert one.delegatee_vp_history == many.delegatee_vp_history
+    assert one.delegatee_vp_recent_history == many.delegatee_vp_recent_history
+
 def test_ProposalTypes_v2_scope_disabled_by_index(v2_scope_abi):
     
     proposal_types = ProposalTypes()
@@ -473,6 +826,38 @@ def test_ProposalTypes_v1_scope_disabled_all(pguild_ptc_abi):
     assert 'disabled_event' in scopes[0]
     assert 'disabled_event' in scopes[1]
 
+def test_ProposalTypes_resolved_proposal_type_follows_scope_events():
+
+    pt = ProposalTypes()
+
+    pt.handle({'signature': PROP_TYPE_SET_4, 'block_number': '1000', 'transaction_index': 0, 'log_index': 0, 'proposal_type_id': 1, 'quorum': 10, 'approval_threshold': 20, 'name': 'One', 'module': '0x0'})
+
+    def scope(sig, bn, **kwargs):
+        return {'signature': sig, 'sighash': '', 'block_number': str(bn), 'transaction_index': 0, 'log_index': 0, 'proposal_type_id': 1, 'scope_key': 'aa', **kwargs}
+
+    resolved = pt.get_resolved_proposal_type(1)
+    assert resolved['id'] == 1 and resolved['scopes'] == []
+    assert pt.get_resolved_proposal_type(1) is resolved
+
+    pt.handle(scope(SCOPE_CREATED, 1001, selector='01', description='first'))
+    pt.handle(scope(SCOPE_CREATED, 1003, selector='02', description='second'))
+
+    resolved = pt.get_resolved_proposal_type(1)
+    assert [s['status'] for s in resolved['scopes']] == ['created', 'created']
+
+    # A late disable, from before the second scope existed, only hits the first.
+    pt.handle(scope(SCOPE_DISABLED, 1002))
+
+    assert pt.get_resolved_proposal_type(1) is not resolved
+    assert [s['status'] for s in pt.get_resolved_proposal_type(1)['scopes']] == ['disabled', 'created']
+
+    replayed = list(pt._replay_scope_events(1).values())
+    assert pt.get_scopes(1) == replayed
+
+    assert 2 not in pt.proposal_types
+    assert pt.get_resolved_proposal_type(2) == {'scopes': [], 'id': 2}
+    assert 2 not in pt.proposal_types
+
 def test_Proposal_start_end_block_properties():
     
     # Test with vote_start/vote_end keys
@@ -565,6 +950,43 @@ def test_NonIvotesVp():
 
     assert non_ivotes_vp.latest_total == '6583144304669856863236773'
 
+@pytest.mark.parametrize("interval", [32, 5])
+def test_NonIvotesVp_deltas_replay_every_snapshot(monkeypatch, interval):
+
+    import json
+    import app.data_products
+
+    monkeypatch.setattr(app.data_products, 'NON_IVOTES_KEYFRAME_INTERVAL', interval)
+
+    payloads = [json.load(open(fname)) for fname in glob.glob('./tests/data/nonivotes-syndicate/*.json')]
+    payloads.sort(key=lambda payload: int(payload['block_number']))
+
+    non_ivotes_vp = NonIVotesVP()
+
+    # Out of order, so some of them are re-encoded.
+    for payload in payloads[1::2] + payloads[::2]:
+        non_ivotes_vp.handle(payload)
+
+    assert non_ivotes_vp.history_len == len(payloads)
+
+    for payload in payloads:
+        block_number = int(payload['block_number'])
+
+        snapshot_bn, vp = non_ivotes_vp.get_all_vp_at_block(block_number + 1)
+        assert snapshot_bn == block_number
+        assert vp == payload['vp']
+
+        addr = next(iter(payload['vp']))
+        assert non_ivotes_vp.get_user_vp_at_block(addr, block_number) == payload['vp'][addr]
+        assert non_ivotes_vp.get_total_asof_block_number(block_number) == payload['total']
+
+    assert non_ivotes_vp.get_all_vp_at_block(int(payloads[0]['block_number']) - 1) == (0, {})
+    assert non_ivotes_vp.latest == payloads[-1]['vp']
+
+    # Only every interval-th snapshot is kept in full.
+    assert len(non_ivotes_vp.keyframes) == (len(payloads) + interval - 1) // interval
+    assert sum(len(delta or {}) for delta in non_ivotes_vp.deltas) < len(payloads[0]['vp']) * (len(payloads) - len(non_ivotes_vp.keyframes)) / 4
+
 def test_VoteAggregation_no_params():
 
     agg = VoteAggregation(module_spec=None)
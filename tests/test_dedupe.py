@@ -0,0 +1,27 @@
+from app.dedupe import SeenEvents
+
+
+def test_seen_events_window():
+
+    seen = SeenEvents(depth=10)
+
+    assert seen.add(100, (0, 1))
+    assert not seen.add(100, (0, 1))
+    assert seen.add(100, (0, 2))
+    assert seen.add(105, (-1, -1))
+
+    # 110 reuses the slot of 100, evicting it.
+    assert seen.add(110, (0, 1))
+    assert (100, (0, 1)) not in seen
+    assert (110, (0, 1)) in seen
+
+    # A true duplicate, inside the window.
+    assert seen.add(105, (-1, -1)) is False
+
+    # Below the window, too old to tell, which isn't the same as heard.
+    assert seen.add(99, (5, 5)) is None
+    assert seen.add(100, (0, 1)) is None
+
+    assert seen.since(0) == [(105, (-1, -1)), (110, (0, 1))]
+    assert seen.since(106) == [(110, (0, 1))]
+    assert len(seen) == 2
@@ -1,12 +1,15 @@
 import pytest
-import os
+import os, time
 os.environ['AGORA_CONFIG_FILE'] = 'tests/test_config.yaml'
 
 from unittest.mock import Mock
 from sanic import Sanic
 from sanic.response import json
-from app.server import proposals_handler, proposal_types_handler, delegates_handler, delegate_handler
-from app.data_products import Proposals, Votes, Delegations, ProposalTypes, Balances
+from app.server import proposals_handler, vote_handler, proposal_types_handler, delegates_handler, delegate_handler, delegates_vp_handler, block_at_timestamp_handler, timestamp_at_block_handler
+from app.server import DataProductContext
+from app.middleware import etag
+from app.snapshots import fork_snapshot, read_snapshot
+from app.data_products import Proposals, Votes, Delegations, ProposalTypes, Balances, DelegateLeaderboard, ProposalSummaries
 from app.clients_csv import CSVClient
 from app.signatures import *
 import json
@@ -23,6 +26,10 @@ def app():
     async def delegates(request):
         return await delegates_handler(app, request)
 
+    @app.route('/v1/vote')
+    async def vote(request):
+        return await vote_handler(app, request)
+
     @app.route('/v1/proposal_types')
     async def proposal_types(request):
         return await proposal_types_handler(app, request)
@@ -31,6 +38,18 @@ def app():
     async def delegate(request, addr):
         return await delegate_handler(app, request, addr)
 
+    @app.route('/v1/delegates_vp/<block_number>')
+    async def delegates_vp(request, block_number):
+        return await delegates_vp_handler(app, request, block_number)
+
+    @app.route('/v1/block_at_timestamp/<timestamp>')
+    async def block_at_timestamp(request, timestamp):
+        return await block_at_timestamp_handler(app, request, timestamp)
+
+    @app.route('/v1/timestamp_at_block/<block_number>')
+    async def timestamp_at_block(request, block_number):
+        return await timestamp_at_block_handler(app, request, block_number)
+
     return app
 
 @pytest.fixture
@@ -171,6 +190,48 @@ async def test_delegates_endpoint_sort_by_latest(app):
     assert delegates[2]["addr"] == "0x2222222222222222222222222222222222222222"  # Block 2000 (highest)
     assert delegates[2]["MRD"] == 2000
 
+@pytest.mark.asyncio
+async def test_delegates_endpoint_with_leaderboard(app):
+
+    request = Mock()
+    request.args = {
+        "sort_by": "VP",
+        "offset": "1",
+        "page_size": "2",
+        "reverse": "true",
+        "include": "DC,OLD"
+    }
+
+    delegations = Delegations()
+
+    for i, (addr, vp) in enumerate([("0x1111111111111111111111111111111111111111", 1000), ("0x2222222222222222222222222222222222222222", 3000), ("0x3333333333333333333333333333333333333333", 2000), ("0x4444444444444444444444444444444444444444", 500)]):
+        delegations.handle({'block_number': 100 + i, 'transaction_index': 0, 'log_index': 0, 'delegator': '0xaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa', 'from_delegate': '0x0000000000000000000000000000000000000000', 'to_delegate': addr, 'signature': DELEGATE_CHANGED_1})
+        delegations.handle({'block_number': 100 + i, 'transaction_index': 0, 'log_index': 1, 'delegate': addr, 'previous_votes': 0, 'new_votes': vp, 'signature': DELEGATE_VOTES_CHANGE})
+
+    votes = Votes(governor_spec={'name': 'compound'})
+
+    app.ctx = Mock()
+    app.ctx.delegations = delegations
+    app.ctx.votes = votes
+    app.ctx.delegate_leaderboard = DelegateLeaderboard(delegations, votes)
+
+    response = await delegates_handler(app, request)
+    delegates = json.loads(response.body)["delegates"]
+
+    assert [d["addr"] for d in delegates] == ["0x3333333333333333333333333333333333333333", "0x1111111111111111111111111111111111111111"]
+    assert delegates[0]["VP"] == "2000"
+    assert delegates[0]["OLD"] == 102
+
+    # A new event is picked up by the next request.
+    event = {'block_number': 200, 'transaction_index': 0, 'log_index': 0, 'delegate': "0x4444444444444444444444444444444444444444", 'previous_votes': 500, 'new_votes': 2500, 'signature': DELEGATE_VOTES_CHANGE}
+    delegations.handle(event)
+    app.ctx.delegate_leaderboard.handle(event)
+
+    response = await delegates_handler(app, request)
+    delegates = json.loads(response.body)["delegates"]
+
+    assert [d["addr"] for d in delegates] == ["0x4444444444444444444444444444444444444444", "0x3333333333333333333333333333333333333333"]
+
 @pytest.mark.asyncio
 async def test_proposals_types_endpoint(app, test_client, pguild_ptc_abi):
 
@@ -356,3 +417,193 @@ async def test_delegate_endpoint(app, test_client, scroll_token_abi):
     assert data['delegate']['from_list'][0]['percentage'] == 10000
 
     
+
+@pytest.mark.asyncio
+async def test_proposals_endpoint_cached(app, test_client, compound_governor_abis):
+
+    proposals = Proposals(governor_spec={'name': 'compound'})
+    votes = Votes(governor_spec={'name': 'compound'})
+    summaries = ProposalSummaries(proposals, votes)
+
+    chain_id = 1
+    address = '0x408ed6354d4973f66138c91495f2f2fcbd8724c3'
+
+    csvc = CSVClient('tests/data/1000-all-uniswap-to-PID83')
+    csvc.set_abis(compound_governor_abis)
+    csvc.plan_event(chain_id, address, 'ProposalCreated(uint256,address,address[],uint256[],string[],bytes[],uint256,uint256,string)')
+    for event, _, _ in csvc.read(after=0):
+        proposals.handle(event)
+        summaries.handle(event)
+
+    csvc = CSVClient('tests/data/2000-uniswap-PID83-only')
+    csvc.set_abis(compound_governor_abis)
+    csvc.plan_event(chain_id, address, 'VoteCast(address,uint256,uint8,uint256,string)')
+    vote_events = list(csvc.read(after=0))
+
+    for event, _, _ in vote_events[:-1]:
+        votes.handle(event)
+        summaries.handle(event)
+
+    app.ctx.proposals = proposals
+    app.ctx.votes = votes
+    app.ctx.proposal_summaries = summaries
+
+    req, resp = await test_client.get('/v1/proposals')
+    assert resp.status == 200
+
+    first = summaries.listing('all', '')
+    assert summaries.listing('all', '') is first
+
+    # The last vote only dirties proposal 83's fragment.
+    other = next(p for p in first if p['id'] != '83')
+
+    event, _, _ = vote_events[-1]
+    votes.handle(event)
+    summaries.handle(event)
+
+    assert summaries.dirty == {'83'}
+
+    req, resp = await test_client.get('/v1/proposals')
+
+    prop83 = [proposal for proposal in resp.json['proposals'] if proposal['id'] == '83'][0]
+
+    assert prop83['totals']['no-param']['0'] == '4405600689481310079197606'
+    assert prop83['totals']['no-param']['1'] == '60410651581027066697650760'
+    assert prop83['totals']['no-param']['2'] == '5795658915470619580362791'
+
+    assert next(p for p in summaries.listing('all', '') if p['id'] == other['id']) is other
+    assert 'totals' not in proposals.proposals['83'].create_event
+
+@pytest.mark.asyncio
+async def test_etag_not_modified_until_a_source_changes(app, test_client):
+
+    app.ctx.proposals = Proposals(governor_spec={'name': 'compound'})
+    app.ctx.votes = Votes(governor_spec={'name': 'compound'})
+
+    calls = []
+
+    @app.route('/v1/tagged')
+    @etag('proposals', 'votes')
+    async def tagged(request):
+        calls.append(request)
+        return await proposals_handler(app, request)
+
+    req, resp = await test_client.get('/v1/tagged')
+    assert resp.status == 200
+    tag = resp.headers['ETag']
+
+    req, resp = await test_client.get('/v1/tagged', headers={'If-None-Match': f'"other", W/{tag}'})
+    assert resp.status == 304
+    assert len(calls) == 1
+
+    # Other query args are another representation.
+    req, resp = await test_client.get('/v1/tagged?set=relevant', headers={'If-None-Match': tag})
+    assert resp.status == 200
+    assert resp.headers['ETag'] != tag
+
+    app.ctx.votes.position = (100, 0, 0)
+
+    req, resp = await test_client.get('/v1/tagged', headers={'If-None-Match': tag})
+    assert resp.status == 200
+    assert resp.headers['ETag'] != tag
+    assert len(calls) == 3
+
+@pytest.mark.asyncio
+async def test_delegates_vp_endpoint(app, test_client):
+
+    delegations = Delegations()
+
+    one = '0x0000000000000000000000000000000000000001'
+    two = '0x0000000000000000000000000000000000000002'
+    three = '0x0000000000000000000000000000000000000003'
+
+    for block_number, delegate, new_votes in [(100, one, 10), (150, two, 5), (200, one, 20), (300, two, 0)]:
+        delegations.handle({'block_number': block_number, 'transaction_index': 0, 'log_index': 0, 'delegate': delegate, 'previous_votes': 0, 'new_votes': new_votes, 'signature': DELEGATE_VOTES_CHANGE})
+
+    app.ctx.delegations = delegations
+
+    req, resp = await test_client.get(f'/v1/delegates_vp/201?addresses={one},{two.upper()},{three}')
+
+    assert resp.status == 200
+    assert resp.json == {'voting_power' : {one : 20, two : 5, three : 0}, 'block_number' : 201}
+
+    req, resp = await test_client.get('/v1/delegates_vp/201')
+    assert resp.status == 400
+
+@pytest.mark.asyncio
+async def test_vote_endpoint_returns_every_vote_for_the_pair(app, test_client):
+
+    votes = Votes(governor_spec={'name': 'compound'})
+
+    voter = '0xded7e867cc42114f1cffa1c5572f591e8711771d'
+
+    for block_number, support in [(100, 0), (200, 1)]:
+        votes.handle({'block_number': str(block_number), 'transaction_index': 0, 'log_index': 0, 'voter': voter, 'proposal_id': 42, 'support': support, 'votes': 10, 'reason': '', 'signature': VOTE_CAST_1})
+
+    votes.handle({'block_number': '300', 'transaction_index': 0, 'log_index': 0, 'voter': voter, 'proposal_id': 43, 'support': 2, 'votes': 10, 'reason': '', 'signature': VOTE_CAST_1})
+
+    app.ctx.votes = votes
+
+    req, resp = await test_client.get(f'/v1/vote?proposal_id=42&voter={voter}')
+    assert resp.status == 200
+    assert [(v['bn'], v['support']) for v in resp.json['vote']] == [('100', 0), ('200', 1)]
+
+    req, resp = await test_client.get(f'/v1/vote?proposal_id=44&voter={voter}')
+    assert resp.json == {'vote' : []}
+
+@pytest.mark.asyncio
+async def test_block_timestamp_endpoints(app, test_client):
+
+    delegations = Delegations()
+
+    for block_number, timestamp in [(100, 1000), (110, 1020), (120, 1040)]:
+        delegations.handle_block({'block_number': block_number, 'timestamp': timestamp})
+
+    app.ctx.delegations = delegations
+
+    req, resp = await test_client.get('/v1/block_at_timestamp/1030')
+    assert resp.status == 200
+    assert resp.json == {'block_number' : 110, 'timestamp' : 1020}
+
+    req, resp = await test_client.get('/v1/timestamp_at_block/120')
+    assert resp.json == {'block_number' : 120, 'timestamp' : 1040}
+
+    req, resp = await test_client.get('/v1/timestamp_at_block/99')
+    assert resp.status == 404
+
+class SlowToPickle:
+
+    name = 'slow'
+
+    def __reduce__(self):
+        time.sleep(1)
+        return (SlowToPickle, ())
+
+@pytest.mark.asyncio
+async def test_requests_are_served_while_a_snapshot_is_written(app, test_client, tmp_path):
+
+    delegations = Delegations()
+
+    for block_number, timestamp in [(100, 1000), (110, 1020), (120, 1040)]:
+        delegations.handle_block({'block_number': block_number, 'timestamp': timestamp})
+
+    app.ctx.delegations = delegations
+
+    ctx = DataProductContext()
+    ctx.register_onchain('10.blocks', delegations)
+    ctx.register_model(SlowToPickle())
+    ctx.feed.block = 1000
+
+    path = tmp_path / 'snapshot.bin'
+    pid = fork_snapshot(path, ctx, overlap=100)
+
+    req, resp = await test_client.get('/v1/block_at_timestamp/1030')
+    assert resp.status == 200
+    assert not path.exists()
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    header, payload = read_snapshot(path, ctx, max_age=60)
+    assert header['block'] == 900
+    assert payload['data_products']['delegations'].block_timestamps.block_at_timestamp(1030) == (110, 1020)
@@ -0,0 +1,54 @@
+from app.eventlog import SharedEventLog
+
+
+def test_shared_event_log():
+
+    log = SharedEventLog(256)
+
+    try:
+        assert log.read() == []
+
+        log.append(('1.blocks', {'block_number': 1}))
+        log.append(('1.blocks', {'block_number': 2}))
+
+        assert log.read() == [('1.blocks', {'block_number': 1}), ('1.blocks', {'block_number': 2})]
+        assert log.read() == []
+
+        # Records wrap around the ring, and keep their order.
+        for block_number in range(3, 30):
+            log.append(('1.blocks', {'block_number': block_number}))
+            assert log.read() == [('1.blocks', {'block_number': block_number})]
+
+        assert log.written > log.capacity
+        assert log.overruns == 0
+
+        # A reader lapped by the writer loses records, and resumes from the head.
+        for block_number in range(30, 60):
+            log.append(('1.blocks', {'block_number': block_number}))
+
+        assert log.read() == []
+        assert log.overruns == 1
+
+        log.append(('1.blocks', {'block_number': 60}))
+        assert log.read() == [('1.blocks', {'block_number': 60})]
+    finally:
+        log.close()
+        log.unlink()
+
+
+def test_shared_event_log_drops_oversized_records():
+
+    log = SharedEventLog(256)
+
+    try:
+        assert log.append(('1.blocks', {'block_number': 1, 'extra': 'x' * 256})) is False
+        assert log.append(('1.blocks', {'block_number': 2})) is True
+
+        assert log.read() == [('1.blocks', {'block_number': 2})]
+        assert log.stats() == (1, 0)
+
+        log.restarted()
+        assert log.stats() == (1, 1)
+    finally:
+        log.close()
+        log.unlink()
@@ -0,0 +1,40 @@
+from app.indexes import PointInTimeIndex, BlockTimestampIndex
+
+
+def test_point_in_time_index():
+
+    index = PointInTimeIndex([(100, 'a'), ('300', 'c')])
+    index.set(200, 'b')
+    index.set(300, 'c2')
+
+    assert index.block_numbers == [100, 200, 300, 300]
+
+    assert index.at(99) is None
+    assert index.at(99, 'none') == 'none'
+    assert index.at(100) == 'a'
+    assert index.at('250') == 'b'
+    assert index.at(10 ** 9) == 'c2'
+
+    assert index.block_number_at(99) == 0
+    assert index.block_number_at(299) == 200
+    assert len(index) == 4
+
+def test_block_timestamp_index():
+
+    index = BlockTimestampIndex([(100, 1000), (102, 1004), (104, 1004)])
+    index.add(106, 1010)
+    index.add(104, 1004)
+    index.add(101, 1002)
+
+    assert list(index.block_numbers) == [100, 101, 102, 104, 106]
+    assert list(index.timestamps) == [1000, 1002, 1004, 1004, 1010]
+
+    assert index.block_at_timestamp(999) is None
+    assert index.block_at_timestamp(1000) == (100, 1000)
+    assert index.block_at_timestamp(1005) == (104, 1004)
+    assert index.block_at_timestamp(10 ** 10) == (106, 1010)
+
+    assert index.timestamp_at_block(99) is None
+    assert index.timestamp_at_block(103) == (102, 1004)
+    assert index.timestamp_at_block(106) == (106, 1010)
+    assert len(index) == 5
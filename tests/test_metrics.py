@@ -0,0 +1,33 @@
+from app.metrics import Registry
+
+
+def test_metrics_render():
+
+    registry = Registry()
+
+    events = registry.counter('events_total', 'Events.', ['signal'])
+    block = registry.gauge('block', 'Block.')
+    seconds = registry.histogram('seconds', 'Seconds.', ['handler'], buckets=(0.1, 1.0))
+
+    events.inc('1.blocks')
+    events.inc('1.blocks', amount=2)
+    block.set(value=100)
+
+    for value in (0.05, 0.1, 0.5, 5.0):
+        seconds.observe('delegates', value=value)
+
+    assert registry.render().splitlines() == [
+        '# HELP events_total Events.',
+        '# TYPE events_total counter',
+        'events_total{signal="1.blocks"} 3',
+        '# HELP block Block.',
+        '# TYPE block gauge',
+        'block 100',
+        '# HELP seconds Seconds.',
+        '# TYPE seconds histogram',
+        'seconds_bucket{handler="delegates",le="0.1"} 2',
+        'seconds_bucket{handler="delegates",le="1.0"} 3',
+        'seconds_bucket{handler="delegates",le="+Inf"} 4',
+        'seconds_sum{handler="delegates"} 5.65',
+        'seconds_count{handler="delegates"} 4',
+    ]
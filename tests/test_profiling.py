@@ -0,0 +1,31 @@
+from app.profiling import Profiler, LogHistogram
+
+
+def test_profiler_percentiles():
+
+    hist = LogHistogram()
+    assert hist.quantile(0.5) is None
+
+    for i in range(1, 1001):
+        hist.add(i * 1e-6)
+
+    for q, expected in [(0.5, 500e-6), (0.99, 990e-6), (0.999, 999e-6)]:
+        assert expected <= hist.quantile(q) <= expected * 1.125
+
+    profiler = Profiler()
+
+    profiler.record('realtime 1.blocks Delegations', 0.002)
+    profiler.record('realtime 1.blocks Delegations', 0.004)
+
+    with profiler('section'):
+        pass
+
+    stats = profiler.summary()
+
+    assert stats['realtime 1.blocks Delegations']['count'] == 2
+    assert stats['realtime 1.blocks Delegations']['max'] == 0.004
+    assert 0.004 <= stats['realtime 1.blocks Delegations']['p99'] <= 0.004 * 1.125
+    assert stats['section']['count'] == 1
+
+    profiler.reset()
+    assert profiler.summary() == {}
@@ -0,0 +1,104 @@
+import pytest
+import os
+os.environ['AGORA_CONFIG_FILE'] = 'tests/test_config.yaml'
+
+from app.server import DataProductContext, ClientSequencer
+from app.data_products import Votes, Delegations
+from app.data_models import ParticipationRateModel
+from app.clients_csv import CSVClient
+from app.snapshots import write_snapshot, read_snapshot
+from app.signatures import *
+
+GOV = '0xcdf27f107725988f2261ce2256bdfcde8b382b10'
+TOKEN = '0x4200000000000000000000000000000000000042'
+
+def make_ctx():
+
+    ctx = DataProductContext()
+
+    votes = Votes({'name': 'agora', 'version': 0.1})
+    ctx.register_onchain(f'10.{GOV}.{VOTE_CAST_1}', votes)
+    ctx.register_onchain(f'10.{GOV}.{VOTE_CAST_WITH_PARAMS_1}', votes)
+
+    delegations = Delegations()
+    ctx.register_onchain(f'10.{TOKEN}.{DELEGATE_VOTES_CHANGE}', delegations)
+
+    ctx.register_model(ParticipationRateModel())
+
+    return ctx
+
+def test_snapshot_round_trip(tmp_path, op_governor_abis):
+
+    ctx = make_ctx()
+
+    csvc = CSVClient('tests/data/3000-op-approval-PID31049')
+    csvc.set_abis(op_governor_abis)
+    csvc.plan_event(10, GOV, VOTE_CAST_1)
+    csvc.plan_event(10, GOV, VOTE_CAST_WITH_PARAMS_1)
+
+    for event, _, _ in csvc.read(after=0):
+        ctx.votes.handle(event)
+
+    ctx.delegations.handle({'block_number': 100, 'transaction_index': 0, 'log_index': 0, 'delegate': '0xded7e867cc42114f1cffa1c5572f591e8711771d', 'previous_votes': 0, 'new_votes': 10, 'signature': DELEGATE_VOTES_CHANGE})
+
+    ctx.feed.block = 1000
+    ctx.feed.seen.add(950, (1, 2))
+    ctx.feed.seen.add(850, (3, 4))
+
+    path = tmp_path / 'snapshot.bin'
+    assert write_snapshot(path, ctx, overlap=100)
+
+    restored = make_ctx()
+    header, payload = read_snapshot(path, restored, max_age=60)
+
+    assert header['block'] == 900
+    assert payload['seen'] == [(950, (1, 2))]
+
+    fresh_votes = restored.votes
+    restored.restore(payload)
+    restored.feed.restore(header['block'], payload['seen'])
+
+    assert restored.votes is not fresh_votes
+    assert all(dp is restored.votes for dp in restored.dps[f'10.{GOV}.{VOTE_CAST_1}'])
+    assert restored.votes.voter_history == ctx.votes.voter_history
+    assert dict(restored.votes.proposal_aggregations).keys() == dict(ctx.votes.proposal_aggregations).keys()
+    assert restored.delegations.delegatee_vp == ctx.delegations.delegatee_vp
+
+    assert restored.feed.block == 900
+    assert (950, 1, 2) in restored.feed.restored_seen
+    assert (950, (1, 2)) in restored.feed.seen
+
+def test_snapshot_rejected_when_stale_or_for_other_signals(tmp_path):
+
+    ctx = make_ctx()
+    path = tmp_path / 'snapshot.bin'
+    assert write_snapshot(path, ctx, overlap=0)
+
+    assert read_snapshot(tmp_path / 'missing.bin', ctx, max_age=60) is None
+    assert read_snapshot(path, ctx, max_age=-1) is None
+
+    other = make_ctx()
+    other.register_offchain('non_ivotes_vp', Votes({'name': 'compound'}))
+    assert read_snapshot(path, other, max_age=60) is None
+
+    assert read_snapshot(path, make_ctx(), max_age=60) is not None
+
+class ResumableArchiveClient:
+
+    timeliness = 'archive'
+    resumable = True
+
+    def plan(self, *signal_meta):
+        pass
+
+def test_snapshot_needs_a_resumable_archive_client():
+
+    # A CSV archive can't start from the snapshot's block, so with only
+    # that, the events since the snapshot would never be replayed.
+    ctx = make_ctx()
+    ctx.feed.set_client_sequencer(ClientSequencer([CSVClient('tests/data/3000-op-approval-PID31049')]))
+    assert not ctx.feed.resumable()
+
+    ctx = make_ctx()
+    ctx.feed.set_client_sequencer(ClientSequencer([CSVClient('tests/data/3000-op-approval-PID31049'), ResumableArchiveClient()]))
+    assert ctx.feed.resumable()
@@ -19,4 +19,4 @@ from app.utils import camel_to_snake
 def test_camel_to_snake(input_str, expected):
     result = camel_to_snake(input_str)
 
-    assert result == expected, f"Expected {expected}, but got {result}"
\ No newline at end of file
+    assert result == expected, f"Expected {expected}, but got {result}"